@@ -0,0 +1,124 @@
+"""Deterministic corpus of user messages and assistant replies for offline benchmarks.
+
+Short messages are typical single chat turns; long messages are journal-style
+entries built from the same sentence pool (seeded, so every run and every
+machine sees identical text). A share of the messages trip the crisis and
+theme patterns, roughly in proportion to what a support chat sees.
+"""
+import random
+
+SEED = 20240611
+
+SHORT_MESSAGES = [
+    "hi",
+    "Hello, is anyone there?",
+    "I feel really anxious about my exams tomorrow",
+    "I can't sleep again tonight",
+    "My partner and I keep fighting about small things",
+    "What is cognitive behavioural therapy?",
+    "How to deal with a panic attack?",
+    "I feel so worthless lately",
+    "nothing matters anymore",
+    "I think I need help but I don't know where to start",
+    "my family doesn't understand me",
+    "Explain mindfulness in simple words",
+    "I'm stressed about money and my job",
+    "resources for depression in India?",
+    "I had a flashback to the accident today",
+    "Sometimes I feel hopeless about the future",
+    "my heart is racing and I can't breathe",
+    "I want to die",
+    "I've been thinking about suicide",
+    "Is it normal to feel sad for no reason?",
+    "I'm struggling with my confidence at work",
+    "thank you, that helped a bit",
+    "Define burnout",
+    "My friend said I should talk to someone",
+    "I keep worrying that something bad will happen",
+    "I don't want to live like this",
+    "can't go on like this",
+    "How to talk to my parents about therapy?",
+    "I feel down most days",
+    "I cut myself last night",
+    "I'm okay today, just wanted to check in",
+    "what are some grounding techniques",
+    "I feel like I'm going crazy",
+    "My manager keeps shouting at me in meetings",
+    "I think I have social anxiety",
+    "I lost all hope after the results",
+    "I feel numb",
+    "can you recommend breathing exercises",
+    "I relapsed after six months sober",
+    "I am tired of pretending to be fine",
+]
+
+_SENTENCES = [
+    "Work has been piling up and I stay late almost every night.",
+    "I keep telling myself it will get better next week.",
+    "My family expects me to handle everything without complaining.",
+    "When I try to sleep my mind keeps replaying conversations from the day.",
+    "I used to enjoy painting but I haven't touched it in months.",
+    "My friend cancelled on me again and I felt like it was my fault.",
+    "I get worried before every meeting and my hands start shaking.",
+    "Some mornings I can't get out of bed at all.",
+    "I feel sad when I see everyone else moving ahead in life.",
+    "My partner says I am too sensitive about small things.",
+    "I started going for walks like my doctor suggested.",
+    "The stress at home makes it hard to focus on studying.",
+    "I don't know how to explain what I'm feeling to anyone.",
+    "I have been eating less and I've lost some weight.",
+    "There was a panic attack on the train last Tuesday.",
+    "I feel worthless when my work gets criticised.",
+    "My therapist moved cities so I stopped going to sessions.",
+    "I scroll on my phone for hours to avoid thinking.",
+    "I miss the person I used to be before all this started.",
+    "My parents keep comparing me with my cousins.",
+    "Sometimes I feel hopeless and nothing seems to help.",
+    "I tried journaling and it helps a little on some days.",
+    "There is a lot of trauma from my childhood that I never dealt with.",
+    "I'm not sure if what I have is depression or just tiredness.",
+    "Last night I thought about how everyone would be better off without me.",
+    "What is the difference between a psychologist and a psychiatrist?",
+    "I can't handle the pressure from my relationship anymore.",
+    "My self-esteem has been low since I lost my job.",
+    "I keep having the same flashback whenever I hear loud noises.",
+    "I don't want to take medication but I need something to change.",
+]
+
+_RESPONSE_SENTENCES = [
+    "It sounds like you're carrying a lot right now, and it makes sense that you feel exhausted.",
+    "Thank you for sharing this with me; that takes courage.",
+    "Would you like to talk about what a typical evening looks like for you?",
+    "One thing that may help is a short grounding exercise: name five things you can see around you.",
+    "Organisations like Mpower and The Live Love Laugh Foundation run awareness programmes.",
+    "You might find the resources at thelivelovelaughfoundation helpful.",
+    "I'm an AI assistant, so I can't replace a licensed therapist, but I'm here to listen.",
+    "Cognitive reframing means noticing a thought and gently asking whether it is the whole picture.",
+    "Many people find that small routines, like a regular bedtime, make a difference over a few weeks.",
+    "If things ever feel unsafe, please reach out to Tele-MANAS at 14416.",
+    "What do you think has changed since the time you used to enjoy painting?",
+    "Information from pib.gov and depwd lists government mental health initiatives.",
+    "It's okay to feel this way; feelings are signals, not verdicts about who you are.",
+    "MpowerMinds offers online sessions if you want to explore therapy.",
+    "Could we try breaking the week into smaller, more manageable pieces?",
+]
+
+
+def _compose(rng, pool, low, high):
+    return " ".join(rng.choice(pool) for _ in range(rng.randint(low, high)))
+
+
+def long_messages(count=40, seed=SEED):
+    rng = random.Random(seed)
+    return [_compose(rng, _SENTENCES, 6, 20) for _ in range(count)]
+
+
+def responses(count=40, seed=SEED + 1):
+    """Assistant replies of typical length, some mentioning blacklisted organisations"""
+    rng = random.Random(seed)
+    return [_compose(rng, _RESPONSE_SENTENCES, 3, 9) for _ in range(count)]
+
+
+LONG_MESSAGES = long_messages()
+RESPONSES = responses()
+MESSAGES = SHORT_MESSAGES + LONG_MESSAGES
@@ -0,0 +1,115 @@
+"""Regression cases for the crisis engine: messages that must and must not be flagged.
+
+Each case is a message and the category detect() has to return (None for
+an ordinary message). The ordinary messages are ones an earlier pattern
+table got wrong, so a pattern that is loosened again shows up here.
+
+    python benchmarks/crisis_cases.py
+
+It also runs every case and the microbench corpus through an engine
+without the keyword prefilter, so a pattern whose keyword is missing from
+the table shows up as a difference.
+
+Exits 1 if any case is detected differently.
+"""
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import corpus  # noqa: E402
+from server.crisis import CrisisEngine, detect, engine, is_high_risk, lookup_helpline, HELPLINES  # noqa: E402
+
+# Must be flagged, with this category
+CRISIS = [
+    ("I want to die", "immediate_suicide"),
+    ("I would rather die than go back there", "immediate_suicide"),
+    ("I'd rather be dead", "immediate_suicide"),
+    ("I wish I could die", "immediate_suicide"),
+    ("sometimes I wish I was dead", "immediate_suicide"),
+    ("I wish I were dead", "immediate_suicide"),
+    ("everyone would be better off dead without me", "immediate_suicide"),
+    ("I'm going to kill myself", "immediate_suicide"),
+    ("I want to end my life tonight", "immediate_suicide"),
+    ("I've been thinking about suicide", "immediate_suicide"),
+    ("I feel suicidal", "immediate_suicide"),
+    ("there is no reason to live", "immediate_suicide"),
+    ("I don't want to live anymore", "immediate_suicide"),
+    ("I dont want to live like this", "immediate_suicide"),
+    ("I do not want to live", "immediate_suicide"),
+    ("I feel like dying", "immediate_suicide"),
+    ("some days I feel like dying", "immediate_suicide"),
+    ("I am going to end it all", "immediate_suicide"),
+    ("I'm planning to kill myself", "immediate_suicide"),
+    ("I have a suicide plan", "immediate_suicide"),
+    ("I cut myself last night", "self_harm"),
+    ("I want to hurt myself", "self_harm"),
+    ("I keep hurting myself", "self_harm"),
+    ("I used to self-harm", "self_harm"),
+    ("I feel so worthless lately", "severe_depression"),
+    ("Sometimes I feel hopeless about the future", "severe_depression"),
+    ("I cant go on like this", "severe_depression"),
+    ("I can't go on", "severe_depression"),
+    ("I lost all hope after the results", "severe_depression"),
+    ("nobody cares about me", "severe_depression"),
+    ("How to deal with a panic attack?", "panic_anxiety"),
+    ("my heart is racing and I can't breathe", "panic_anxiety"),
+]
+
+# Must not be flagged at all
+ORDINARY = [
+    "I cut my hair",
+    "cutting my vegetables for dinner",
+    "this app is useless",
+    "I never give up",
+    "there is no point arguing",
+    "I feel dizzy after my run",
+    "I'm on a diet and studied all night",
+    "the battery is dead",
+    "my plant died",
+    "I'm going to die of embarrassment",
+    "I don't want to live in this city anymore",
+    "I don't want to live with my parents after college",
+    "I'm dying to see that movie",
+    "the weekend was fun with my friend",
+    "nothing matters more than my family",
+]
+
+
+def main():
+    failures = []
+    for message, expected in CRISIS:
+        result = detect(message)
+        category = result.category if result else None
+        if category != expected:
+            failures.append(f"{message!r}: expected {expected}, got {category}")
+        elif not is_high_risk(message) and result.severity != "medium":
+            failures.append(f"{message!r}: not high risk")
+        if expected == "immediate_suicide" and lookup_helpline(message) is not HELPLINES["aasra"]:
+            failures.append(f"{message!r}: not routed to the suicide prevention helpline")
+    for message in ORDINARY:
+        result = detect(message)
+        if result is not None:
+            failures.append(f"{message!r}: flagged as {result.category}")
+
+    unfiltered = CrisisEngine(prefilter=False)
+    for message in [message for message, _ in CRISIS] + ORDINARY + corpus.MESSAGES:
+        if detect(message) != unfiltered.detect(message):
+            failures.append(f"{message!r}: keyword prefilter changes detect()")
+        for severity in ("high", "immediate"):
+            if engine.matches(message, severity) != unfiltered.matches(message, severity):
+                failures.append(f"{message!r}: keyword prefilter changes matches({severity!r})")
+
+    for failure in failures:
+        print(f"   FAIL: {failure}")
+    print(f"{len(CRISIS)} crisis, {len(ORDINARY)} ordinary and {len(corpus.MESSAGES)} corpus messages: "
+          f"{len(failures) or 'no'} failures")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Stand-in for the Ollama HTTP API used by the serving benchmarks.
+
+Emits a fixed number of tokens with a fixed inter-token delay so that server
+overhead, not model speed, is what gets measured.
+
+    FAKE_OLLAMA_TOKENS=50 FAKE_OLLAMA_TOKEN_DELAY=0.02 \
+        uvicorn fake_ollama:app --port 11535
+"""
+import asyncio
+import json
+import os
+import time
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+TOKENS = int(os.environ.get("FAKE_OLLAMA_TOKENS", "50"))
+TOKEN_DELAY = float(os.environ.get("FAKE_OLLAMA_TOKEN_DELAY", "0.02"))
+# Simulated prefill cost per prompt character; 0 disables it
+PREFILL_PER_CHAR = float(os.environ.get("FAKE_OLLAMA_PREFILL_PER_CHAR", "0"))
+
+
+def prompt_length(payload):
+    if "messages" in payload:
+        return sum(len(m.get("content", "")) for m in payload["messages"])
+    return len(payload.get("prompt", ""))
+
+
+def final_stats(started):
+    elapsed = time.monotonic() - started
+    return {
+        "done": True,
+        "context": [1, 2, 3],
+        "eval_count": TOKENS,
+        "eval_duration": int(TOKENS * TOKEN_DELAY * 1e9),
+        "total_duration": int(elapsed * 1e9),
+    }
+
+
+def token_chunk(payload, index):
+    text = f"tok{index} "
+    if "messages" in payload:
+        return {"message": {"role": "assistant", "content": text}, "done": False}
+    return {"response": text, "done": False}
+
+
+async def generate(request):
+    payload = await request.json()
+    started = time.monotonic()
+    await asyncio.sleep(prompt_length(payload) * PREFILL_PER_CHAR)
+
+    if not payload.get("stream", True):
+        await asyncio.sleep(TOKENS * TOKEN_DELAY)
+        text = "".join(f"tok{i} " for i in range(TOKENS))
+        body = {"message": {"role": "assistant", "content": text}} if "messages" in payload else {"response": text}
+        body.update(final_stats(started))
+        return JSONResponse(body)
+
+    async def tokens():
+        for i in range(TOKENS):
+            await asyncio.sleep(TOKEN_DELAY)
+            yield json.dumps(token_chunk(payload, i)) + "\n"
+        yield json.dumps(final_stats(started)) + "\n"
+
+    return StreamingResponse(tokens(), media_type="application/x-ndjson")
+
+
+async def version(request):
+    return JSONResponse({"version": "fake"})
+
+
+app = Starlette(routes=[
+    Route("/api/generate", generate, methods=["POST"]),
+    Route("/api/chat", generate, methods=["POST"]),
+    Route("/api/version", version, methods=["GET"]),
+])
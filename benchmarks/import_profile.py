@@ -0,0 +1,136 @@
+"""Import-time profile and time-to-liveness for the server entry points.
+
+Imports each server module in a fresh interpreter with ``-X importtime`` and
+reports the total import time plus the most expensive modules (self and
+cumulative). Warm-up runs in lazy mode here, so only the import itself is
+measured and nothing is loaded in the background. With --liveness, also
+starts each server and times how long /health takes to answer.
+
+    python benchmarks/import_profile.py
+    python benchmarks/import_profile.py --top 25 app_optimized
+    python benchmarks/import_profile.py --budget-ms 1500 --liveness   # exit 1 over budget
+
+A module that cannot be imported here (e.g. langchain missing) is reported
+with the error instead of a profile.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_DIR = os.path.join(ROOT, "server")
+
+# module -> (working directory, port used for --liveness)
+TARGETS = {
+    "app_optimized": (SERVER_DIR, 5111),
+    "server": (SERVER_DIR, 5112),
+    "direct_ollama": (SERVER_DIR, 5113),
+    "model_server": (ROOT, 5114),
+}
+
+
+def profile_env():
+    env = dict(os.environ, WARMUP_MODE="lazy", SESSION_PATH=":memory:")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    return env
+
+
+def parse_importtime(stderr):
+    """(module, self_us, cumulative_us, depth) rows from -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def profile(module, cwd):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=cwd, env=profile_env(), capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - started) * 1000
+    rows = parse_importtime(result.stderr)
+    if result.returncode != 0:
+        error = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        return {"error": error[-1] if error else f"exit code {result.returncode}"}
+    # -X importtime lists a module's imports before it, one level deeper;
+    # keep only the target's subtree (interpreter startup imports come first)
+    end = next(i for i, row in enumerate(rows) if row[0] == module and row[3] == 0)
+    start = max((i for i, row in enumerate(rows[:end]) if row[3] == 0), default=-1) + 1
+    return {"import_ms": rows[end][2] / 1000, "wall_ms": wall_ms, "rows": rows[start:end + 1]}
+
+
+def liveness(module, cwd, port, timeout):
+    """Seconds from process start until GET /health answers"""
+    code = f"import {module} as m; m.app.run(host='127.0.0.1', port={port}, threaded=True)"
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", code], cwd=cwd, env=profile_env(),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                return None
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1):
+                    return time.perf_counter() - started
+            except urllib.error.HTTPError:
+                return time.perf_counter() - started  # answered, even if not healthy
+            except (urllib.error.URLError, OSError):
+                time.sleep(0.05)
+        return None
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=list(TARGETS))
+    parser.add_argument("--top", type=int, default=15, help="modules listed per target")
+    parser.add_argument("--budget-ms", type=float, help="exit 1 if any import takes longer than this")
+    parser.add_argument("--liveness", action="store_true", help="also time process start to /health")
+    parser.add_argument("--liveness-timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    over_budget = 0
+    for module in args.modules:
+        cwd, port = TARGETS.get(module, (SERVER_DIR, 5119))
+        report = profile(module, cwd)
+        print(f"\n== {module}")
+        if "error" in report:
+            print(f"   import failed: {report['error']}")
+            continue
+        print(f"   import {report['import_ms']:.1f} ms (interpreter wall {report['wall_ms']:.0f} ms)")
+        if args.budget_ms and report["import_ms"] > args.budget_ms:
+            over_budget += 1
+            print(f"   OVER BUDGET ({args.budget_ms:.0f} ms)")
+        if args.liveness:
+            seconds = liveness(module, cwd, port, args.liveness_timeout)
+            print(f"   /health answered after {seconds:.2f} s" if seconds is not None
+                  else "   /health never answered")
+            if args.budget_ms and (seconds is None or seconds * 1000 > args.budget_ms):
+                over_budget += 1
+
+        rows = report["rows"]
+        print(f"   {'cumulative_ms':>13} {'self_ms':>8}  imported directly by {module}")
+        direct = sorted((row for row in rows if row[3] == 1), key=lambda row: -row[2])
+        for name, self_us, cumulative_us, _ in direct[:args.top]:
+            print(f"   {cumulative_us / 1000:>13.1f} {self_us / 1000:>8.1f}  {name}")
+        print(f"   {'self_ms':>13}           heaviest modules by own time")
+        for name, self_us, _, _ in sorted(rows, key=lambda row: -row[1])[:args.top]:
+            print(f"   {self_us / 1000:>13.1f}           {name}")
+
+    if over_budget:
+        print(f"{over_budget} measurement(s) over budget", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
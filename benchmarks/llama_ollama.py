@@ -0,0 +1,140 @@
+"""Minimal Ollama HTTP API over llama-cpp-python, for CPU-only TTFT runs.
+
+Serves /api/generate (with and without a carried-forward `context`) and
+/api/chat for one GGUF model, formatting prompts with the ChatML template
+the qwen2.5 models use. Requests are served one at a time, like Ollama
+with OLLAMA_NUM_PARALLEL=1, and llama.cpp reuses the KV cache for the
+longest prefix shared with the previous request, so the prompt modes see
+the same prefill savings they would get from Ollama. prompt_eval_count is
+the number of prompt tokens actually evaluated, i.e. excluding that prefix.
+
+    pip install llama-cpp-python
+    LLAMA_OLLAMA_MODEL=model.gguf uvicorn llama_ollama:app --port 11434
+"""
+import json
+import os
+import threading
+import time
+
+from llama_cpp import Llama
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+MODEL_PATH = os.environ["LLAMA_OLLAMA_MODEL"]
+CONTEXT_SIZE = int(os.environ.get("LLAMA_OLLAMA_CTX", "8192"))
+THREADS = int(os.environ.get("LLAMA_OLLAMA_THREADS", str(os.cpu_count() or 1)))
+
+llm = Llama(MODEL_PATH, n_ctx=CONTEXT_SIZE, n_threads=THREADS, n_threads_batch=THREADS,
+            n_gpu_layers=0, verbose=False)
+lock = threading.Lock()
+
+
+def chatml(role, content):
+    return f"<|im_start|>{role}\n{content}<|im_end|>\n"
+
+
+def generate_tokens(payload):
+    """Prompt tokens for /api/generate, appended to `context` when one is given"""
+    prompt = ""
+    if payload.get("system") and not payload.get("context"):
+        prompt += chatml("system", payload["system"])
+    prompt += chatml("user", payload.get("prompt", "")) + "<|im_start|>assistant\n"
+    return list(payload.get("context") or []) + llm.tokenize(prompt.encode(), add_bos=False)
+
+
+def chat_tokens(payload):
+    prompt = "".join(chatml(m["role"], m.get("content", "")) for m in payload["messages"])
+    return llm.tokenize((prompt + "<|im_start|>assistant\n").encode(), add_bos=False)
+
+
+def cached_prefix(tokens):
+    """Number of leading tokens llama.cpp still holds in its KV cache"""
+    n = 0
+    for cached, token in zip(llm.input_ids[:llm.n_tokens], tokens):
+        if cached != token:
+            break
+        n += 1
+    # llama.cpp always re-evaluates at least the last prompt token
+    return min(n, len(tokens) - 1)
+
+
+def run(payload, tokens):
+    """Yield (text, final_stats_or_None) for one generation; the caller holds the lock"""
+    options = payload.get("options") or {}
+    num_predict = int(options.get("num_predict", 128))
+    started = time.monotonic()
+    evaluated = len(tokens) - cached_prefix(tokens)
+    first = None
+    output = []
+    for token in llm.generate(tokens, temp=float(options.get("temperature", 0.8)), reset=True):
+        if first is None:
+            first = time.monotonic()
+        if token == llm.token_eos() or len(output) >= num_predict:
+            break
+        output.append(token)
+        yield llm.detokenize([token]).decode(errors="ignore"), None
+    finished = time.monotonic()
+    first = first or finished
+    yield "", {
+        "done": True,
+        "context": tokens + output,
+        "prompt_eval_count": evaluated,
+        "prompt_eval_duration": int((first - started) * 1e9),
+        "eval_count": len(output),
+        "eval_duration": int((finished - first) * 1e9),
+        "total_duration": int((finished - started) * 1e9),
+    }
+
+
+def handler(build_tokens, is_chat):
+    def chunk(text):
+        if is_chat:
+            return {"message": {"role": "assistant", "content": text}, "done": False}
+        return {"response": text, "done": False}
+
+    async def endpoint(request):
+        payload = await request.json()
+
+        if not payload.get("stream", True):
+            with lock:
+                tokens = build_tokens(payload)
+                text = ""
+                for piece, final in run(payload, tokens):
+                    text += piece
+            body = chunk(text)
+            body.update(final)
+            if is_chat:
+                del body["context"]
+            return JSONResponse(body)
+
+        def lines():
+            with lock:
+                tokens = build_tokens(payload)
+                for piece, final in run(payload, tokens):
+                    if final is None:
+                        yield json.dumps(chunk(piece)) + "\n"
+                    else:
+                        if is_chat:
+                            del final["context"]
+                        yield json.dumps(final) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    return endpoint
+
+
+async def version(request):
+    return JSONResponse({"version": "llama-cpp-python"})
+
+
+async def tags(request):
+    return JSONResponse({"models": [{"name": os.path.basename(MODEL_PATH)}]})
+
+
+app = Starlette(routes=[
+    Route("/api/generate", handler(generate_tokens, is_chat=False), methods=["POST"]),
+    Route("/api/chat", handler(chat_tokens, is_chat=True), methods=["POST"]),
+    Route("/api/version", version, methods=["GET"]),
+    Route("/api/tags", tags, methods=["GET"]),
+])
@@ -0,0 +1,303 @@
+"""Microbenchmarks for the pure-Python per-request stages, with a regression gate.
+
+Runs theme tracking, crisis screening, context filtering, response
+sanitizing, prompt assembly and helpline lookup over the corpus in
+corpus.py, and reports throughput (ops/sec) and allocation per call
+(tracemalloc peak); batch APIs are reported per message. Nothing talks to Ollama or downloads a model; a stage
+whose module cannot be imported is reported as skipped, and --check fails
+if a skipped stage has a baseline, since it was not checked.
+
+    python benchmarks/microbench.py               # run and compare with baselines
+    python benchmarks/microbench.py --save        # record new baselines
+    python benchmarks/microbench.py --check       # exit 1 on a regression
+
+Baselines live in benchmarks/baselines/microbench.json. Throughput depends on
+the machine, so record them with --save on the machine that runs --check.
+A benchmark that looks slower than its baseline is measured again (--confirm
+times) and only counts as a regression if no run reaches the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import timeit
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "ollama_rag"))
+sys.path.insert(0, BENCH_DIR)
+
+import corpus  # noqa: E402
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baselines", "microbench.json")
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a factory returning (fn, inputs[, items_per_call]); inputs are argument tuples
+
+    items_per_call lets batch APIs report per-message throughput and allocation.
+    """
+    def register(factory):
+        BENCHMARKS[name] = factory
+        return factory
+    return register
+
+
+def single_args(items):
+    return [(item,) for item in items]
+
+
+def therapist_bot():
+    # TherapistBot normally loads web pages and embeds them through Ollama;
+    # the stages measured here only need the shared tables and prompt budget
+    from simple_rag import TherapistBot
+    return TherapistBot(model_local=object(), load_documents=False)
+
+
+@benchmark("themes.track")
+def _track_themes():
+    from server.themes import ContextManager
+    return ContextManager()._track_themes, single_args(corpus.MESSAGES)
+
+
+@benchmark("themes.get_context")
+def _theme_context():
+    from server.themes import ContextManager
+    manager = ContextManager()
+    for text in corpus.MESSAGES:
+        manager.update(text)
+    return manager.get_context, [()] * len(corpus.MESSAGES)
+
+
+@benchmark("crisis.is_high_risk")
+def _is_high_risk():
+    from server.crisis import is_high_risk
+    return is_high_risk, single_args(corpus.MESSAGES)
+
+
+@benchmark("crisis.lookup_helpline")
+def _lookup_helpline():
+    from server.crisis import lookup_helpline
+    return lookup_helpline, single_args(corpus.MESSAGES)
+
+
+@benchmark("crisis.detect")
+def _crisis_detect():
+    from server.crisis import detect
+    return detect, single_args(corpus.MESSAGES)
+
+
+@benchmark("crisis.screen_batch")
+def _crisis_screen():
+    from server.crisis import screen
+    batch = 20
+    batches = [corpus.MESSAGES[i:i + batch] for i in range(0, len(corpus.MESSAGES), batch)]
+    return screen, single_args(batches), batch
+
+
+@benchmark("simple_rag.detect_crisis")
+def _simple_rag_crisis():
+    return therapist_bot().detect_crisis, single_args(corpus.MESSAGES)
+
+
+@benchmark("simple_rag.context_filter")
+def _context_filter():
+    return therapist_bot().context_filter, single_args(corpus.MESSAGES)
+
+
+@benchmark("simple_rag.sanitize_response")
+def _sanitize_response():
+    return therapist_bot().sanitize_response, single_args(corpus.RESPONSES)
+
+
+def response_tokens(text, size=4):
+    """A response cut into chunks about the size of LLM tokens"""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@benchmark("sanitizer.sanitize")
+def _sanitizer_one_shot():
+    from server.sanitizer import BLACKLISTED_ENTITIES, RESOURCE_PLACEHOLDER, Sanitizer
+    return Sanitizer(BLACKLISTED_ENTITIES, RESOURCE_PLACEHOLDER).sanitize, single_args(corpus.RESPONSES)
+
+
+@benchmark("sanitizer.stream_per_token")
+def _sanitizer_stream():
+    from server.sanitizer import BLACKLISTED_ENTITIES, RESOURCE_PLACEHOLDER, Sanitizer
+    sanitizer = Sanitizer(BLACKLISTED_ENTITIES, RESOURCE_PLACEHOLDER)
+    # Same token count per call, so throughput and allocation are per token
+    tokens = [token for text in corpus.RESPONSES for token in response_tokens(text)]
+    per_call = 64
+    batches = [tokens[i:i + per_call] for i in range(0, len(tokens) - per_call + 1, per_call)]
+
+    def stream(batch):
+        for _ in sanitizer.sanitize_stream(batch):
+            pass
+    return stream, single_args(batches), per_call
+
+
+@benchmark("simple_rag.build_prompt")
+def _build_prompt():
+    from server.themes import ContextManager
+    bot = therapist_bot()
+    manager = ContextManager()
+    messages = []
+    inputs = []
+    for text, reply in zip(corpus.MESSAGES, corpus.RESPONSES * 2):
+        manager.update(text)
+        context = reply if bot.context_filter(text) else ""
+        inputs.append((text, manager.get_context(), list(messages), context))
+        messages += [("User", text), ("Assistant", reply)]
+    return bot.build_prompt, inputs
+
+
+def measure(fn, inputs, repeat, items_per_call=1):
+    def run_pass():
+        for args in inputs:
+            fn(*args)
+
+    run_pass()  # warm up regex caches and lazy imports
+    timer = timeit.Timer(run_pass)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number))
+    ops_per_sec = len(inputs) * items_per_call * number / best
+
+    tracemalloc.start()
+    peaks = []
+    for args in inputs:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn(*args)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    return {"ops_per_sec": round(ops_per_sec, 1),
+            "alloc_bytes": round(statistics.mean(peaks) / items_per_call)}
+
+
+def run(names, repeat):
+    results, skipped = {}, {}
+    for name in names:
+        try:
+            fn, inputs, *items_per_call = BENCHMARKS[name]()
+        except ImportError as e:
+            skipped[name] = str(e)
+            continue
+        results[name] = measure(fn, inputs, repeat, *items_per_call)
+    return results, skipped
+
+
+def confirm(results, baselines, threshold, repeat, runs):
+    """Measure apparently slower benchmarks up to runs more times, keeping the best result
+
+    A single timing can lose 20% to a busy machine; a real regression is
+    slow on every run.
+    """
+    for _ in range(runs):
+        slow = [name for name, result in results.items()
+                if name in baselines["results"]
+                and result["ops_per_sec"] < baselines["results"][name]["ops_per_sec"] * (1 - threshold)]
+        if not slow:
+            return
+        rerun, _ = run(slow, repeat)
+        for name, result in rerun.items():
+            results[name] = {"ops_per_sec": max(results[name]["ops_per_sec"], result["ops_per_sec"]),
+                             "alloc_bytes": min(results[name]["alloc_bytes"], result["alloc_bytes"])}
+
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return {"meta": {}, "results": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baselines(path, baselines, results):
+    # Merge, so stages skipped on this machine keep their recorded baseline
+    baselines["results"].update(results)
+    baselines["meta"] = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "recorded": time.strftime("%Y-%m-%d"),
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(results, baselines, threshold, alloc_threshold):
+    """Yield (name, result, baseline, verdict) rows; verdict is '', 'new' or 'REGRESSION ...'"""
+    for name, result in results.items():
+        baseline = baselines["results"].get(name)
+        if baseline is None:
+            yield name, result, None, "new"
+            continue
+        problems = []
+        if result["ops_per_sec"] < baseline["ops_per_sec"] * (1 - threshold):
+            problems.append("throughput")
+        # Allocation is deterministic, but allow a little slack for interpreter noise
+        allowed = max(baseline["alloc_bytes"] * (1 + alloc_threshold), baseline["alloc_bytes"] + 64)
+        if result["alloc_bytes"] > allowed:
+            problems.append("allocations")
+        yield name, result, baseline, f"REGRESSION ({', '.join(problems)})" if problems else ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed fractional throughput drop before --check fails")
+    parser.add_argument("--confirm", type=int, default=3,
+                        help="times to re-measure a benchmark that looks slower before calling it a regression")
+    parser.add_argument("--alloc-threshold", type=float, default=0.1,
+                        help="allowed fractional allocation growth before --check fails")
+    parser.add_argument("--baselines", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="record results as the new baselines")
+    parser.add_argument("--check", action="store_true", help="exit 1 if any benchmark regressed")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    results, skipped = run(names, args.repeat)
+    baselines = load_baselines(args.baselines)
+    if not args.save:
+        confirm(results, baselines, args.threshold, args.repeat, args.confirm)
+
+    recorded_on = baselines["meta"].get("python")
+    if recorded_on and recorded_on != platform.python_version():
+        print(f"note: baselines were recorded on Python {recorded_on}", file=sys.stderr)
+
+    print(f"{'benchmark':<28} {'ops/s':>11} {'us/op':>8} {'alloc_B':>8} {'base_ops/s':>11} {'change':>7}  verdict")
+    regressions = 0
+    for name, result, baseline, verdict in compare(results, baselines, args.threshold, args.alloc_threshold):
+        regressions += verdict.startswith("REGRESSION")
+        base_ops = f"{baseline['ops_per_sec']:>11.0f}" if baseline else f"{'-':>11}"
+        change = f"{result['ops_per_sec'] / baseline['ops_per_sec'] - 1:>+7.0%}" if baseline else f"{'-':>7}"
+        print(f"{name:<28} {result['ops_per_sec']:>11.0f} {1e6 / result['ops_per_sec']:>8.2f} "
+              f"{result['alloc_bytes']:>8} {base_ops} {change}  {verdict}")
+    for name, reason in skipped.items():
+        print(f"{name:<28} skipped: {reason}")
+
+    if args.save:
+        save_baselines(args.baselines, baselines, results)
+        print(f"Saved {len(results)} baselines to {os.path.relpath(args.baselines)}")
+    unchecked = [name for name in skipped if name in baselines["results"]]
+    if args.check and (regressions or unchecked):
+        if regressions:
+            print(f"{regressions} benchmark(s) regressed", file=sys.stderr)
+        if unchecked:
+            print(f"{len(unchecked)} baselined benchmark(s) could not run: {', '.join(unchecked)}",
+                  file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Time to first token per prompt mode (flat / chat / context) against Ollama.
+
+Plays the same multi-turn conversation for every chat type in each mode and
+reports time to first token plus the prefill work Ollama reports
+(prompt_eval_count / prompt_eval_duration). Needs a running Ollama with the
+direct_ollama model pulled; --cpu forces CPU-only inference (num_gpu=0).
+
+    OLLAMA_BASE_URL=http://localhost:11434 python benchmarks/prefill_ttft.py --cpu
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "server"))
+
+from direct_ollama_shared import MODEL_NAME, prompts as server_prompts  # noqa: E402
+from ollama_client import OllamaClient  # noqa: E402
+from prompt_builder import PROMPT_MODES, PromptBuilder, chunk_text  # noqa: E402
+
+CONVERSATION = [
+    "I've been feeling really overwhelmed with work lately.",
+    "I can't sleep properly and keep worrying about deadlines.",
+    "My manager keeps adding tasks and I don't know how to say no.",
+    "Sometimes I feel like I'm not good enough for this job.",
+    "What is one small thing I could try this week?",
+]
+
+
+def run_turn(client, builder, message, chat_type, history, session_id):
+    endpoint, payload = builder.build(message, chat_type, history, session_id, stream=True)
+    started = time.perf_counter()
+    ttft = None
+    text = ""
+    final = {}
+    for chunk in client.stream_generate(payload, endpoint):
+        token = chunk_text(chunk)
+        if ttft is None and token:
+            ttft = time.perf_counter() - started
+        text += token
+        if chunk.get("done"):
+            final = chunk
+    builder.record(session_id, chat_type, final)
+    history.append({"user": message, "assistant": text})
+    return {
+        "ttft": ttft if ttft is not None else time.perf_counter() - started,
+        "prompt_tokens": final.get("prompt_eval_count", 0),
+        "prefill_s": final.get("prompt_eval_duration", 0) / 1e9,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=list(PROMPT_MODES), choices=PROMPT_MODES)
+    parser.add_argument("--chat-types", nargs="+", default=list(server_prompts.contexts))
+    parser.add_argument("--turns", type=int, default=len(CONVERSATION))
+    parser.add_argument("--num-predict", type=int, default=64)
+    parser.add_argument("--cpu", action="store_true", help="force CPU-only inference")
+    args = parser.parse_args()
+
+    options = {"temperature": 0.7, "num_predict": args.num_predict}
+    if args.cpu:
+        options["num_gpu"] = 0
+    client = OllamaClient()
+
+    print(f"{'mode':<8} {'chat_type':<15} {'turn1_ttft':>10} {'later_ttft':>10} "
+          f"{'prompt_tok':>10} {'prefill_s':>9}")
+    for mode in args.modes:
+        builder = PromptBuilder(MODEL_NAME, server_prompts.contexts, mode=mode,
+                                history_turns=server_prompts.history_turns, options=options)
+        for chat_type in args.chat_types:
+            history = []
+            session_id = f"bench-{mode}-{chat_type}"
+            turns = [run_turn(client, builder, message, chat_type, history, session_id)
+                     for message in CONVERSATION[:args.turns]]
+            later = turns[1:] or turns
+            print(f"{mode:<8} {chat_type:<15} {turns[0]['ttft']:>10.3f} "
+                  f"{statistics.mean(t['ttft'] for t in later):>10.3f} "
+                  f"{statistics.mean(t['prompt_tokens'] for t in later):>10.0f} "
+                  f"{statistics.mean(t['prefill_s'] for t in later):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
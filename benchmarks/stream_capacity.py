@@ -0,0 +1,187 @@
+"""Concurrent-stream capacity: Flask direct_ollama vs the async ASGI mode.
+
+Starts a fake Ollama (see fake_ollama.py), then each server variant pointed
+at it, and opens N concurrent /chat/stream requests per level. Reports how
+many streams complete, time to first token, wall time and (on Linux) the
+server's peak thread count and resident memory.
+
+    python benchmarks/stream_capacity.py --levels 10 50 100 200 400
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_DIR = os.path.join(ROOT, "server")
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+
+FAKE_PORT = 11535
+FLASK_PORT = 5102
+ASYNC_PORT = 5103
+
+FLASK_CMD = [
+    sys.executable, "-c",
+    "import direct_ollama as d; d.ollama.start_monitor(); "
+    f"d.app.run(host='127.0.0.1', port={FLASK_PORT}, threaded=True)",
+]
+ASYNC_CMD = [
+    sys.executable, "-m", "uvicorn", "direct_ollama_async:app",
+    "--host", "127.0.0.1", "--port", str(ASYNC_PORT), "--log-level", "warning",
+]
+FAKE_CMD = [
+    sys.executable, "-m", "uvicorn", "fake_ollama:app",
+    "--host", "127.0.0.1", "--port", str(FAKE_PORT), "--log-level", "warning",
+]
+
+
+def launch(cmd, cwd, env):
+    return subprocess.Popen(cmd, cwd=cwd, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready")
+
+
+def proc_status(pid):
+    """Threads and RSS (MiB) of a process, read from /proc; None elsewhere"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(fields["Threads"]), int(fields["VmRSS"].split()[0]) / 1024
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+async def sample_peak(pid, stop, peak):
+    while not stop.is_set():
+        status = proc_status(pid)
+        if status:
+            peak["threads"] = max(peak.get("threads", 0), status[0])
+            peak["rss_mb"] = max(peak.get("rss_mb", 0), status[1])
+        await asyncio.sleep(0.05)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run_level(base_url, concurrency, timeout, server_pid):
+    stop = asyncio.Event()
+    peak = {}
+    sampler = asyncio.create_task(sample_peak(server_pid, stop, peak))
+    connector = aiohttp.TCPConnector(limit=0)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as client:
+
+        async def one(i):
+            started = time.monotonic()
+            ttft = None
+            try:
+                async with client.post(f"{base_url}/chat/stream", json={
+                    # Unique per stream so requests are not coalesced upstream
+                    "message": f"I have been feeling anxious about exams ({i})",
+                    "chat_type": "GENERAL",
+                    "session_id": f"bench-{concurrency}-{i}",
+                }) as response:
+                    async for line in response.content:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        if ttft is None and chunk.get("chunk"):
+                            ttft = time.monotonic() - started
+                        if chunk.get("done"):
+                            return ttft, "full_response" in chunk
+            except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError):
+                pass
+            return ttft, False
+
+        started = time.monotonic()
+        results = await asyncio.gather(*(one(i) for i in range(concurrency)))
+        wall = time.monotonic() - started
+    stop.set()
+    await sampler
+
+    ttfts = [t for t, ok in results if ok and t is not None]
+    completed = sum(1 for _, ok in results if ok)
+    return {
+        "concurrency": concurrency,
+        "completed": completed,
+        "failed": concurrency - completed,
+        "ttft_p50": statistics.median(ttfts) if ttfts else None,
+        "ttft_p95": percentile(ttfts, 95),
+        "wall": wall,
+        "threads": peak.get("threads"),
+        "rss_mb": peak.get("rss_mb"),
+    }
+
+
+def fmt(value, spec=".3f"):
+    return "-" if value is None else format(value, spec)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--levels", type=int, nargs="+", default=[10, 50, 100, 200, 400])
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--modes", nargs="+", default=["flask", "async"], choices=["flask", "async"])
+    args = parser.parse_args()
+
+    env = dict(os.environ,
+               OLLAMA_BASE_URL=f"http://127.0.0.1:{FAKE_PORT}",
+               FAKE_OLLAMA_TOKENS=str(args.tokens),
+               FAKE_OLLAMA_TOKEN_DELAY=str(args.token_delay),
+               # Measure serving capacity, not the admission limits
+               ADMISSION_MAX_CONCURRENT=str(max(args.levels) + 1),
+               ADMISSION_LIMITS="")
+    servers = {"flask": (FLASK_CMD, FLASK_PORT), "async": (ASYNC_CMD, ASYNC_PORT)}
+
+    fake = launch(FAKE_CMD, BENCH_DIR, env)
+    try:
+        wait_ready(f"http://127.0.0.1:{FAKE_PORT}/api/version")
+        print(f"{'mode':<6} {'streams':>7} {'done':>6} {'failed':>6} {'ttft_p50':>9} {'ttft_p95':>9} {'wall_s':>8} {'threads':>8} {'rss_mb':>7}")
+        for mode in args.modes:
+            cmd, port = servers[mode]
+            proc = launch(cmd, SERVER_DIR, env)
+            try:
+                base_url = f"http://127.0.0.1:{port}"
+                wait_ready(f"{base_url}/health")
+                for level in args.levels:
+                    r = asyncio.run(run_level(base_url, level, args.timeout, proc.pid))
+                    print(f"{mode:<6} {r['concurrency']:>7} {r['completed']:>6} {r['failed']:>6} "
+                          f"{fmt(r['ttft_p50']):>9} {fmt(r['ttft_p95']):>9} {r['wall']:>8.2f} "
+                          f"{fmt(r['threads'], 'd'):>8} {fmt(r['rss_mb'], '.0f'):>7}")
+            finally:
+                proc.terminate()
+                proc.wait()
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Session isolation and memory per session for the multi-tenant TherapistBot.
+
+Runs one shared TherapistBot (no documents, a stand-in model that answers
+instantly) and has many threads hold conversations at once, each under its
+own session ID with its own marker word. Then checks that no prompt, reply
+or history ever mixed two sessions' markers and that a crisis message only
+flagged its own session. Finally measures memory per session (tracemalloc)
+for fresh sessions and after several turns.
+
+    python benchmarks/therapist_sessions.py
+    python benchmarks/therapist_sessions.py --sessions 200 --turns 10 --threads 32
+
+Exits 1 if sessions leaked into each other.
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "ollama_rag"))
+
+from simple_rag import TherapistBot  # noqa: E402
+
+# TherapistBot logs every prompt's token counts at INFO
+logging.getLogger("simple_rag").setLevel(logging.WARNING)
+
+MARKER = re.compile(r"marker(\d+)x")
+CRISIS_MESSAGE = "I want to end my life tonight"
+
+
+class EchoModel:
+    """Replies with the marker from the user message after a short pause, recording every prompt"""
+
+    def __init__(self, delay=0.001):
+        self.delay = delay
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt):
+        with self._lock:
+            self.prompts.append(prompt)
+        time.sleep(self.delay)  # lets other sessions' turns interleave
+        user_message = prompt.rsplit("USER MESSAGE:", 1)[1]
+        return f"I hear you about marker{MARKER.search(user_message).group(1)}x."
+
+
+def converse(bot, session, turns):
+    replies = []
+    for turn in range(turns):
+        message = f"I keep thinking about marker{session}x at work, day {turn}."
+        replies.append(bot.chat(message, f"session-{session}"))
+    return replies
+
+
+def check_isolation(bot, model, sessions, turns, threads):
+    crisis_session = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = {session: pool.submit(converse, bot, session, turns) for session in range(sessions)}
+        pool.submit(bot.chat, CRISIS_MESSAGE, f"session-{crisis_session}").result()
+        replies = {session: future.result() for session, future in futures.items()}
+    elapsed = time.perf_counter() - started
+
+    problems = []
+    for prompt in model.prompts:
+        markers = set(MARKER.findall(prompt))
+        if len(markers) > 1:
+            problems.append(f"prompt mixes sessions {sorted(markers)}")
+    for session, session_replies in replies.items():
+        if any(f"marker{session}x" not in reply for reply in session_replies):
+            problems.append(f"session {session} got another session's reply")
+        state = bot.sessions.get(f"session-{session}")
+        if {int(m) for _, text in state.messages for m in MARKER.findall(text)} - {session}:
+            problems.append(f"session {session} history holds other sessions' messages")
+        if len(state.messages) != 2 * turns:
+            problems.append(f"session {session} has {len(state.messages)} messages, expected {2 * turns}")
+        if state.crisis_mode != (session == crisis_session):
+            problems.append(f"session {session} crisis_mode is {state.crisis_mode}")
+    return elapsed, problems
+
+
+def memory_per_session(count, turns):
+    bot = TherapistBot(model_local=EchoModel(delay=0), load_documents=False)
+    bot.sessions.max_sessions = count
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for session in range(count):
+        bot.sessions.get(f"session-{session}")
+    fresh = tracemalloc.take_snapshot()
+    for session in range(count):
+        converse(bot, session, turns)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    fresh_bytes = sum(stat.size_diff for stat in fresh.compare_to(before, "filename"))
+    # Counted per session only; the shared summary and token caches grow too
+    total_bytes = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return fresh_bytes / count, total_bytes / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--memory-sessions", type=int, default=1000)
+    args = parser.parse_args()
+
+    model = EchoModel()
+    bot = TherapistBot(model_local=model, load_documents=False)
+    elapsed, problems = check_isolation(bot, model, args.sessions, args.turns, args.threads)
+    print(f"{args.sessions} sessions x {args.turns} turns on {args.threads} threads: "
+          f"{len(model.prompts)} prompts in {elapsed:.2f}s")
+    for problem in problems[:20]:
+        print(f"   LEAK: {problem}")
+    print("   sessions isolated" if not problems else f"   {len(problems)} isolation problems")
+    print(f"   prompt tokens: {bot.prompt_budget.stats()['mean_prompt_tokens']} mean, "
+          f"{bot.prompt_budget.stats()['max_prompt_tokens']} max")
+
+    fresh, after_turns = memory_per_session(args.memory_sessions, args.turns)
+    print(f"memory per session ({args.memory_sessions} sessions): {fresh / 1024:.1f} KiB fresh, "
+          f"{after_turns / 1024:.1f} KiB after {args.turns} turns (incl. shared caches)")
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""NumpyVectorStore vs Chroma at several corpus sizes.
+
+Builds both stores from the same synthetic vectors and reports build time,
+single-query latency (p50/p95), per-query time for a batch of queries, the
+store's vector memory and Chroma's recall@k against the exact NumPy top k.
+Embeddings come from a lookup table, so no model runs and both stores see
+identical vectors; only the store is measured. Chroma is skipped if it is
+not installed.
+
+    python benchmarks/vector_store.py
+    python benchmarks/vector_store.py --sizes 100 1000 10000 --dim 768 --float16
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "server"))
+
+from numpy_store import NumpyVectorStore  # noqa: E402
+
+
+class TableEmbeddings:
+    """Embeddings served from a dict, so neither store pays for a model"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def embed_documents(self, texts):
+        return [self.table[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.table[text]
+
+
+def synthetic(size, queries, dim, seed=0):
+    """Clustered random vectors (closer to real embeddings than uniform noise)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(size // 20, 1), dim))
+    docs = centers[rng.integers(len(centers), size=size)] + 0.5 * rng.normal(size=(size, dim))
+    asks = centers[rng.integers(len(centers), size=queries)] + 0.5 * rng.normal(size=(queries, dim))
+    texts = [f"chunk {i}" for i in range(size)]
+    questions = [f"query {i}" for i in range(queries)]
+    table = dict(zip(texts, docs.tolist()))
+    table.update(zip(questions, asks.tolist()))
+    metadatas = [{"source": f"source-{i % 5}"} for i in range(size)]
+    return TableEmbeddings(table), texts, metadatas, questions
+
+
+def open_chroma():
+    try:
+        from langchain_chroma import Chroma
+    except ImportError:
+        try:
+            from langchain_community.vectorstores import Chroma
+        except ImportError:
+            return None
+    return Chroma
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def time_queries(search, questions, k):
+    timings = []
+    results = []
+    for question in questions:
+        started = time.perf_counter()
+        results.append([doc.page_content for doc in search(question, k=k)])
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings, results
+
+
+def bench_numpy(embeddings, texts, metadatas, questions, k, dtype):
+    started = time.perf_counter()
+    store = NumpyVectorStore.from_texts(texts, embeddings, metadatas=metadatas, dtype=dtype)
+    build_ms = (time.perf_counter() - started) * 1000
+    timings, results = time_queries(store.similarity_search, questions, k)
+    started = time.perf_counter()
+    store.batch_similarity_search(questions, k=k)
+    batch_ms = (time.perf_counter() - started) * 1000 / len(questions)
+    with tempfile.TemporaryDirectory() as directory:
+        store.save(directory)
+        started = time.perf_counter()
+        loaded = NumpyVectorStore.load(directory, embeddings)
+        loaded.similarity_search(questions[0], k=k)
+        load_ms = (time.perf_counter() - started) * 1000
+    return {"build_ms": build_ms, "timings": timings, "batch_ms": batch_ms, "load_ms": load_ms,
+            "bytes": store.matrix.nbytes, "results": results}
+
+
+def bench_chroma(Chroma, embeddings, texts, metadatas, questions, k, size):
+    started = time.perf_counter()
+    store = Chroma.from_texts(texts, embeddings, metadatas=metadatas,
+                              collection_name=f"bench-{size}-{time.time_ns()}",
+                              collection_metadata={"hnsw:space": "cosine"})
+    build_ms = (time.perf_counter() - started) * 1000
+    timings, results = time_queries(store.similarity_search, questions, k)
+    store.delete_collection()
+    return {"build_ms": build_ms, "timings": timings, "results": results}
+
+
+def recall(results, exact):
+    hits = sum(len(set(found) & set(truth)) for found, truth in zip(results, exact))
+    return hits / sum(len(truth) for truth in exact)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 2000, 10000])
+    parser.add_argument("--dim", type=int, default=768, help="nomic-embed-text vectors are 768-d")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--float16", action="store_true", help="store the NumPy matrix as float16")
+    args = parser.parse_args()
+
+    Chroma = open_chroma()
+    if Chroma is None:
+        print("Chroma is not installed; reporting NumpyVectorStore only")
+    dtype = np.float16 if args.float16 else np.float32
+
+    print(f"{'size':>6} {'store':<7} {'build_ms':>9} {'p50_ms':>8} {'p95_ms':>8} "
+          f"{'batch_ms/q':>10} {'load_ms':>8} {'vectors_MB':>10} {'recall':>7}")
+    for size in args.sizes:
+        embeddings, texts, metadatas, questions = synthetic(size, args.queries, args.dim)
+        numpy_report = bench_numpy(embeddings, texts, metadatas, questions, args.k, dtype)
+        timings = numpy_report["timings"]
+        print(f"{size:>6} {'numpy':<7} {numpy_report['build_ms']:>9.1f} {statistics.median(timings):>8.3f} "
+              f"{percentile(timings, 0.95):>8.3f} {numpy_report['batch_ms']:>10.3f} "
+              f"{numpy_report['load_ms']:>8.1f} {numpy_report['bytes'] / 2**20:>10.2f} {'exact':>7}")
+        if Chroma is None:
+            continue
+        chroma_report = bench_chroma(Chroma, embeddings, texts, metadatas, questions, args.k, size)
+        timings = chroma_report["timings"]
+        print(f"{size:>6} {'chroma':<7} {chroma_report['build_ms']:>9.1f} {statistics.median(timings):>8.3f} "
+              f"{percentile(timings, 0.95):>8.3f} {'-':>10} {'-':>8} {'-':>10} "
+              f"{recall(chroma_report['results'], numpy_report['results']):>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,15 @@
 import os
+import asyncio
 import logging
-import re
-from collections import deque
-from flask import Flask, request, jsonify
+import time
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-import httpx
 from functools import lru_cache
-from concurrent.futures import ThreadPoolExecutor
+from server.admission import (AdmissionController, AdmissionRejected, busy_response, ndjson,
+                              released_on_error, single_chunk_stream)
+from server.crisis import engine as crisis_engine
+from server.themes import SessionContexts
+from server.ollama_client import ASYNC_REQUEST_ERRORS, get_client_thread
 
 app = Flask(__name__)
 CORS(app)
@@ -15,56 +18,88 @@ CORS(app)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Thread pool for handling requests
-executor = ThreadPoolExecutor(max_workers=10)
-
-class ContextManager:
-    def __init__(self, window_size=6):
-        self.window = deque(maxlen=window_size)
-        self.theme_tracker = {}
-
-    def update(self, exchange):
-        self.window.append(exchange)
-        self._track_themes(exchange)
-
-    def _track_themes(self, exchange):
-        themes = {
-            'anxiety': r'\b(anxious|worried|panic|stress)\b',
-            'depression': r'\b(sad|depressed|hopeless|down)\b',
-            'relationships': r'\b(relationship|family|friend|partner)\b',
-            'self_esteem': r'\b(worthless|confidence|self-esteem)\b',
-            'trauma': r'\b(trauma|abuse|ptsd|flashback)\b'
-        }
-        text = exchange.lower()
-        for theme, pattern in themes.items():
-            if re.search(pattern, text, re.I):
-                self.theme_tracker[theme] = self.theme_tracker.get(theme, 0) + 1
-
-    def get_context(self):
-        return {
-            "recent_exchanges": list(self.window),
-            "dominant_themes": sorted(
-                self.theme_tracker.items(),
-                key=lambda x: x[1],
-                reverse=True
-            )[:3]
-        }
+# One pooled aiohttp client for the whole process. Flask runs every async
+# view on a fresh event loop, so the client lives on its own loop thread
+# and keeps its connections across requests (see ollama_client.ClientThread).
+ollama = get_client_thread()
+MODEL_NAME = "mistral"
+
+IMMEDIATE_CRISIS_RESPONSE = "I notice you're expressing thoughts of self-harm. Please reach out to a crisis helpline immediately: Call 14416 or 1800-599-0019. Your life matters and help is available 24/7."
 
 def detect_crisis(text):
-    patterns = {
-        'immediate': r'\b(suicide|kill myself)\b',
-        'high': r'\b(hopeless|worthless)\b',
-        'medium': r'\b(panic attack)\b'
+    """Crisis severity ('immediate', 'high', 'medium') or None, from the shared engine"""
+    result = crisis_engine.detect(text)
+    return result.severity if result else None
+
+# Recent exchanges and conversation themes, kept separately for each session
+contexts = SessionContexts(window_size=6)
+
+# Per chat type concurrency limits in front of Ollama; crisis-flagged
+# messages and CRISIS_SUPPORT chats are admitted ahead of everything else
+admission = AdmissionController()
+
+def build_payload(message, chat_type=None, session_id=None, stream=False):
+    """Update the session's conversation context and build the /api/chat payload for a message"""
+    # Update context
+    context_manager = contexts.get(session_id)
+    context_manager.update(message)
+    context_info = context_manager.get_context()
+    
+    # Prepare the system message based on chat type and context
+    system_message = "You are an empathetic AI assistant focused on mental health support. "
+    
+    # Add context awareness
+    if context_info["dominant_themes"]:
+        themes = [f"{theme} ({count})" for theme, count in context_info["dominant_themes"]]
+        system_message += f"Current conversation themes: {', '.join(themes)}. "
+    
+    if chat_type:
+        system_message += {
+            "GENERAL": "Provide general assistance and support.",
+            "CRISIS_SUPPORT": "Offer empathetic crisis support and guidance.",
+            "THERAPY": "Act as a supportive therapy assistant.",
+            "WELLNESS": "Focus on mental wellness and self-improvement strategies."
+        }.get(chat_type, "Provide general assistance and support.")
+
+    # Prepare the request payload
+    payload = {
+        "model": MODEL_NAME,
+        "messages": [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": message}
+        ],
+        "stream": stream
     }
-    for level, pat in patterns.items():
-        if re.search(pat, text, re.IGNORECASE):
-            return level
-    return None
 
-# Initialize context manager
-context_manager = ContextManager()
+    # Add recent context if available
+    if context_info["recent_exchanges"]:
+        for exchange in context_info["recent_exchanges"][-3:]:  # Last 3 exchanges
+            payload["messages"].insert(-1, {
+                "role": "user" if len(payload["messages"]) % 2 == 0 else "assistant",
+                "content": exchange
+            })
+    return payload
+
+def generation_stats(started, first_token_at, final_chunk, token_count):
+    """Time to first token and decode speed for one reply"""
+    elapsed = time.perf_counter() - started
+    ttft = (first_token_at or time.perf_counter()) - started
+    if final_chunk.get("eval_duration"):
+        # Ollama's own count, excluding prompt evaluation
+        tokens = final_chunk.get("eval_count", token_count)
+        tokens_per_sec = tokens / (final_chunk["eval_duration"] / 1e9)
+    else:
+        tokens = token_count
+        decode_time = elapsed - ttft
+        tokens_per_sec = tokens / decode_time if decode_time > 0 else 0.0
+    return {
+        "ttft_ms": round(ttft * 1000, 1),
+        "total_ms": round(elapsed * 1000, 1),
+        "tokens": tokens,
+        "tokens_per_sec": round(tokens_per_sec, 1),
+    }
 
-async def get_ollama_response(message, chat_type=None):
+async def get_ollama_response(message, chat_type=None, session_id=None):
     """
     Get response from Ollama API with context awareness
     """
@@ -72,59 +107,53 @@ async def get_ollama_response(message, chat_type=None):
         # Check for crisis
         crisis_level = detect_crisis(message)
         if crisis_level == 'immediate':
-            return "I notice you're expressing thoughts of self-harm. Please reach out to a crisis helpline immediately: Call 14416 or 1800-599-0019. Your life matters and help is available 24/7."
+            return IMMEDIATE_CRISIS_RESPONSE
 
-        # Update context
-        context_manager.update(message)
-        context_info = context_manager.get_context()
-        
-        # Prepare the system message based on chat type and context
-        system_message = "You are an empathetic AI assistant focused on mental health support. "
-        
-        # Add context awareness
-        if context_info["dominant_themes"]:
-            themes = [f"{theme} ({count})" for theme, count in context_info["dominant_themes"]]
-            system_message += f"Current conversation themes: {', '.join(themes)}. "
-        
-        if chat_type:
-            system_message += {
-                "GENERAL": "Provide general assistance and support.",
-                "CRISIS_SUPPORT": "Offer empathetic crisis support and guidance.",
-                "THERAPY": "Act as a supportive therapy assistant.",
-                "WELLNESS": "Focus on mental wellness and self-improvement strategies."
-            }.get(chat_type, "Provide general assistance and support.")
-
-        # Prepare the request payload
-        payload = {
-            "model": "mistral",
-            "messages": [
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": message}
-            ],
-            "stream": False
-        }
-
-        # Add recent context if available
-        if context_info["recent_exchanges"]:
-            for exchange in context_info["recent_exchanges"][-3:]:  # Last 3 exchanges
-                payload["messages"].insert(-1, {
-                    "role": "user" if len(payload["messages"]) % 2 == 0 else "assistant",
-                    "content": exchange
-                })
-
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post("http://localhost:11434/api/chat", json=payload)
-            response.raise_for_status()
-            data = response.json()
-            return data.get('message', {}).get('content', '')
-
-    except httpx.TimeoutException:
+        payload = build_payload(message, chat_type, session_id)
+        started = time.perf_counter()
+        data = await ollama.call_async(ollama.client.generate(payload, "/api/chat"))
+        stats = generation_stats(started, None, data, 0)
+        logger.info(f"Generated {stats['tokens']} tokens in {stats['total_ms']}ms "
+                    f"({stats['tokens_per_sec']} tokens/s)")
+        return data.get('message', {}).get('content', '')
+
+    except asyncio.TimeoutError:
         logger.error("Timeout while calling Ollama API")
         return "I apologize, but I'm taking too long to respond. Please try again."
     except Exception as e:
         logger.error(f"Error calling Ollama API: {str(e)}")
         return "I apologize, but I'm having trouble processing your request. Please try again."
 
+def stream_ollama_response(message, chat_type=None, session_id=None):
+    """Forward tokens as Ollama emits them; the final line carries TTFT and tokens/sec"""
+    started = time.perf_counter()
+    first_token_at = None
+    final_chunk = {}
+    token_count = 0
+    full_response = ""
+    try:
+        payload = build_payload(message, chat_type, session_id, stream=True)
+        for chunk in ollama.stream(ollama.client.stream_generate(payload, "/api/chat")):
+            token = chunk.get('message', {}).get('content', '')
+            if token:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                token_count += 1
+                full_response += token
+                yield ndjson({"chunk": token, "done": False})
+            if chunk.get("done"):
+                final_chunk = chunk
+
+        stats = generation_stats(started, first_token_at, final_chunk, token_count)
+        logger.info(f"Streamed {stats['tokens']} tokens: TTFT {stats['ttft_ms']}ms, "
+                    f"{stats['tokens_per_sec']} tokens/s")
+        yield ndjson({"chunk": "", "done": True, "full_response": full_response, "stats": stats})
+
+    except ASYNC_REQUEST_ERRORS as e:
+        logger.error(f"Error streaming from Ollama API: {str(e)}")
+        yield ndjson({"chunk": "I apologize, but I'm having trouble processing your request. Please try again.",
+                      "done": True})
+
 @app.route('/chat', methods=['POST'])
 async def chat():
     try:
@@ -135,20 +164,65 @@ async def chat():
             
         message = data.get('message', '')
         chat_type = data.get('chat_type', 'GENERAL')
+        session_id = data.get('session_id', 'default-session')
         
         logger.info(f"Received message: {message}")
         
-        # Get response from Ollama
-        response = await get_ollama_response(message, chat_type)
+        # Immediate-risk messages get the helpline reply without calling the
+        # model, so they never queue
+        crisis_level = detect_crisis(message)
+        if crisis_level == 'immediate':
+            response = await get_ollama_response(message, chat_type, session_id)
+        else:
+            with await admission.acquire_async(chat_type, crisis=crisis_level is not None):
+                response = await get_ollama_response(message, chat_type, session_id)
         return jsonify({'response': response})
         
+    except AdmissionRejected as e:
+        return busy_response(e)
+        
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+            
+        message = data.get('message', '')
+        chat_type = data.get('chat_type', 'GENERAL')
+        session_id = data.get('session_id', 'default-session')
+        
+        logger.info(f"Received streaming message: {message}")
+        
+        # The crisis check runs before anything is streamed
+        crisis_level = detect_crisis(message)
+        if crisis_level == 'immediate':
+            return Response(single_chunk_stream(IMMEDIATE_CRISIS_RESPONSE), content_type='application/json')
+        
+        # The admission slot is held until the stream is closed
+        ticket = admission.acquire(chat_type, crisis=crisis_level is not None)
+        with released_on_error(ticket):
+            response = Response(stream_with_context(stream_ollama_response(message, chat_type, session_id)),
+                                content_type='application/json')
+            response.call_on_close(ticket.release)
+        return response
+        
+    except AdmissionRejected as e:
+        return busy_response(e)
+        
+    except Exception as e:
+        logger.error(f"Error in chat stream endpoint: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy'})
+    return jsonify({'status': 'healthy', 'admission': admission.stats(), 'ollama_client': ollama.client.stats(),
+                    'contexts': contexts.stats()})
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False) 
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
@@ -1,8 +1,16 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import logging
+import os
+import sys
+import threading
+import time
 from simple_rag import TherapistBot
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from server.admission import (AdmissionController, AdmissionRejected, busy_response, ndjson,
+                              released_on_error)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -10,14 +18,41 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
-# Initialize the bot
+# One bot for every user: the model client and documents are shared and
+# each session_id gets its own conversation state
 bot = TherapistBot()
 
+# Limits concurrent LLM generations; crisis messages are answered by the
+# bot's fixed helpline responses and never wait for a slot
+admission = AdmissionController()
+
+# Time to first token and total time of completed /chat/stream replies
+stream_stats = {"streams": 0, "ttft_ms_total": 0.0, "total_ms_total": 0.0, "max_ttft_ms": 0.0}
+stream_stats_lock = threading.Lock()
+
+def record_stream(ttft_ms, total_ms):
+    with stream_stats_lock:
+        stream_stats["streams"] += 1
+        stream_stats["ttft_ms_total"] += ttft_ms
+        stream_stats["total_ms_total"] += total_ms
+        stream_stats["max_ttft_ms"] = max(stream_stats["max_ttft_ms"], ttft_ms)
+
+def stream_summary():
+    with stream_stats_lock:
+        count = stream_stats["streams"]
+        return {
+            "streams": count,
+            "mean_ttft_ms": round(stream_stats["ttft_ms_total"] / count, 1) if count else 0.0,
+            "max_ttft_ms": round(stream_stats["max_ttft_ms"], 1),
+            "mean_total_ms": round(stream_stats["total_ms_total"] / count, 1) if count else 0.0,
+        }
+
 @app.route('/chat', methods=['POST'])
 def chat():
     try:
         data = request.get_json()
         user_message = data.get('message', '')
+        session_id = data.get('session_id', 'default-session')
         
         if not user_message:
             return jsonify({'error': 'No message provided'}), 400
@@ -25,14 +60,80 @@ def chat():
         logger.info(f"Received message: {user_message}")
         
         # Process the message using our enhanced bot
-        response = bot.chat(user_message)
+        if bot.detect_crisis(user_message):
+            response = bot.chat(user_message, session_id)
+        else:
+            with admission.acquire(data.get('chat_type', 'GENERAL')):
+                response = bot.chat(user_message, session_id)
         
         logger.info(f"Generated response: {response}")
         return jsonify({'response': response})
 
+    except AdmissionRejected as e:
+        return busy_response(e)
+
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+def stream_reply(user_message, session_id, started):
+    """NDJSON chunks of the bot's streamed reply, ending with timings and the full response"""
+    full_response = ""
+    ttft_ms = None
+    for piece in bot.stream_chat(user_message, session_id):
+        if ttft_ms is None:
+            ttft_ms = (time.perf_counter() - started) * 1000
+        full_response += piece
+        yield ndjson({"chunk": piece, "done": False})
+    total_ms = (time.perf_counter() - started) * 1000
+    ttft_ms = total_ms if ttft_ms is None else ttft_ms
+    record_stream(ttft_ms, total_ms)
+    logger.info(f"Streamed response: ttft {ttft_ms:.0f}ms, total {total_ms:.0f}ms")
+    yield ndjson({"chunk": "", "done": True, "full_response": full_response,
+                  "ttft_ms": round(ttft_ms, 1), "total_ms": round(total_ms, 1)})
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    started = time.perf_counter()
+    try:
+        data = request.get_json()
+        user_message = data.get('message', '')
+        session_id = data.get('session_id', 'default-session')
+        
+        if not user_message:
+            return jsonify({'error': 'No message provided'}), 400
+
+        logger.info(f"Received streaming message: {user_message}")
+        
+        # Crisis messages get the fixed helpline reply without waiting for
+        # a slot; everything else holds its slot until the stream is closed
+        ticket = None
+        if not bot.detect_crisis(user_message):
+            ticket = admission.acquire(data.get('chat_type', 'GENERAL'))
+        with released_on_error(ticket):
+            response = Response(stream_with_context(stream_reply(user_message, session_id, started)),
+                                content_type='application/json')
+            if ticket is not None:
+                response.call_on_close(ticket.release)
+        return response
+
+    except AdmissionRejected as e:
+        return busy_response(e)
+
+    except Exception as e:
+        logger.error(f"Error processing streaming request: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({
+        'status': 'ok',
+        'admission': admission.stats(),
+        'retrieval_cache': bot.retrieval_cache.stats(),
+        'prompt_tokens': bot.prompt_budget.stats(),
+        'sessions': bot.sessions.stats(),
+        'streaming': stream_summary()
+    })
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000) 
\ No newline at end of file
@@ -0,0 +1,297 @@
+"""Offline ingest for the modelrag vector store.
+
+Downloads (or reads) each source, splits it into chunks and embeds them into
+a persisted Chroma collection, next to a manifest recording every source's
+content hash and chunk IDs. Chunk IDs are hashes of the chunk text, so a
+rerun embeds only new or changed chunks and deletes the ones that
+disappeared; an unchanged source is skipped without splitting it again.
+A source that fails to load keeps its previous chunks.
+
+    python ollama_rag/ingest.py                          # the default URLs
+    python ollama_rag/ingest.py --source page.html ...   # local HTML files or directories
+    python ollama_rag/ingest.py --rebuild                # re-embed everything
+
+Servers then open the store with open_vectorstore() instead of loading the
+web pages at startup. Every ingest also writes the vectors as a
+NumpyVectorStore snapshot (numpy/ in the persist directory), which
+open_vectorstore() memory-maps instead of starting Chroma unless
+VECTOR_STORE=chroma.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from server.embedding_cache import cached_embeddings
+from server.numpy_store import VECTOR_STORE, NumpyVectorStore
+
+logger = logging.getLogger(__name__)
+
+# Mental health resources embedded by default
+DEFAULT_SOURCES = [
+    "https://www.thelivelovelaughfoundation.org/find-help/helplines",
+    "https://depwd.gov.in/others-helplines/",
+    "https://pib.gov.in/PressReleaseIframePage.aspx?PRID=2100706",
+    "https://mpowerminds.com/oneonone",
+    "https://www.who.int/india/health-topics/mental-health",
+]
+
+PERSIST_DIRECTORY = os.environ.get(
+    "RAG_PERSIST_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "vectorstore"))
+COLLECTION_NAME = "mental-health-india"
+EMBEDDING_MODEL = os.environ.get("RAG_EMBEDDING_MODEL", "nomic-embed-text")
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+CHUNK_SIZE = 7500
+CHUNK_OVERLAP = 100
+MANIFEST_NAME = "manifest.json"
+NUMPY_SNAPSHOT = "numpy"
+MANIFEST_VERSION = 1
+
+
+class IndexNotFound(RuntimeError):
+    """No persisted vector store; run the ingest command first"""
+
+
+def manifest_path(persist_directory=PERSIST_DIRECTORY):
+    return os.path.join(persist_directory, MANIFEST_NAME)
+
+
+def load_manifest(persist_directory=PERSIST_DIRECTORY):
+    path = manifest_path(persist_directory)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, persist_directory=PERSIST_DIRECTORY):
+    # Written after the vector store is updated, via a rename so a crash
+    # never leaves a half-written manifest
+    path = manifest_path(persist_directory)
+    os.makedirs(persist_directory, exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def get_embeddings(model=EMBEDDING_MODEL, base_url=OLLAMA_BASE_URL):
+    from langchain_ollama import OllamaEmbeddings
+    return cached_embeddings(OllamaEmbeddings(model=model, base_url=base_url))
+
+
+def get_splitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    from langchain.text_splitter import CharacterTextSplitter
+    return CharacterTextSplitter.from_tiktoken_encoder(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def expand_sources(sources):
+    """URLs as given; local directories become the .html/.htm files inside them"""
+    expanded = []
+    for source in sources:
+        if os.path.isdir(source):
+            expanded.extend(sorted(
+                os.path.abspath(os.path.join(source, name)) for name in os.listdir(source)
+                if name.lower().endswith((".html", ".htm"))
+            ))
+        elif source.startswith(("http://", "https://")):
+            expanded.append(source)
+        else:
+            expanded.append(os.path.abspath(source))
+    return expanded
+
+
+def load_source(source):
+    """Documents for one URL or local HTML file, extracted the same way WebBaseLoader does"""
+    if source.startswith(("http://", "https://")):
+        from langchain_community.document_loaders import WebBaseLoader
+        return WebBaseLoader(source).load()
+
+    from bs4 import BeautifulSoup
+    from langchain_core.documents import Document
+    with open(source, encoding="utf-8") as f:
+        soup = BeautifulSoup(f.read(), "html.parser")
+    metadata = {"source": source}
+    if soup.title and soup.title.string:
+        metadata["title"] = soup.title.string.strip()
+    return [Document(page_content=soup.get_text(), metadata=metadata)]
+
+
+def content_hash(docs):
+    digest = hashlib.sha256()
+    for doc in docs:
+        digest.update(doc.page_content.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def chunk_ids(source, chunks):
+    """Stable IDs from the source and chunk text; repeated text gets an occurrence suffix"""
+    ids, seen = [], {}
+    for chunk in chunks:
+        key = hashlib.sha256(f"{source}\x00{chunk.page_content}".encode("utf-8")).hexdigest()[:32]
+        seen[key] = seen.get(key, 0) + 1
+        ids.append(key if seen[key] == 1 else f"{key}-{seen[key]}")
+    return ids
+
+
+def open_store(persist_directory=PERSIST_DIRECTORY, embedding=None, collection_name=COLLECTION_NAME):
+    from langchain_community.vectorstores import Chroma
+    return Chroma(
+        collection_name=collection_name,
+        embedding_function=embedding or get_embeddings(),
+        persist_directory=persist_directory,
+    )
+
+
+def export_numpy(store, persist_directory=PERSIST_DIRECTORY, embedding=None):
+    """Snapshot a Chroma store's vectors as a NumpyVectorStore (no re-embedding)"""
+    data = store.get(include=["embeddings", "documents", "metadatas"])
+    snapshot = NumpyVectorStore(embedding)
+    if data["ids"]:
+        snapshot.add_vectors(data["embeddings"], data["documents"], data["metadatas"], data["ids"])
+    snapshot.save(os.path.join(persist_directory, NUMPY_SNAPSHOT))
+    return len(snapshot)
+
+
+def open_vectorstore(persist_directory=PERSIST_DIRECTORY, embedding=None, collection_name=COLLECTION_NAME):
+    """The persisted store written by ingest(); raises IndexNotFound if it was never built"""
+    manifest = load_manifest(persist_directory)
+    if manifest is None:
+        raise IndexNotFound(
+            f"No vector store in {persist_directory}; run `python ollama_rag/ingest.py` first")
+    if embedding is None:
+        embedding = get_embeddings(manifest.get("embedding_model", EMBEDDING_MODEL))
+    snapshot = os.path.join(persist_directory, NUMPY_SNAPSHOT)
+    if VECTOR_STORE == "numpy" and NumpyVectorStore.exists(snapshot):
+        return NumpyVectorStore.load(snapshot, embedding)
+    collection = manifest.get("chroma_collection", manifest.get("collection", collection_name))
+    return open_store(persist_directory, embedding, collection)
+
+
+def ingest(sources=DEFAULT_SOURCES, persist_directory=PERSIST_DIRECTORY, embedding=None,
+           embedding_model=EMBEDDING_MODEL, collection_name=COLLECTION_NAME,
+           chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, rebuild=False):
+    """Bring the persisted store in line with sources; returns counts of what changed
+
+    Only chunks whose ID is not in the manifest are embedded. A different
+    embedding model, collection or chunking, or rebuild=True, re-embeds
+    everything into a new collection, which replaces the old one only once
+    the rebuild has succeeded.
+    """
+    sources = expand_sources(sources)
+    settings = {
+        "embedding_model": embedding_model,
+        "collection": collection_name,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+    }
+    manifest = load_manifest(persist_directory) or {}
+    previous = manifest.get("sources", {})
+    embedding = embedding or get_embeddings(embedding_model)
+    active = manifest.get("chroma_collection", manifest.get("collection", collection_name))
+    rebuilding = rebuild or any(manifest.get(key) != value for key, value in settings.items())
+    retired = None
+    if rebuilding:
+        if previous:
+            logger.info("Settings changed or rebuild requested, re-embedding every source")
+        # A new embedding model may not even have the same dimensions, so
+        # nothing is added to the collection the manifest points at
+        retired = active if manifest else None
+        active = f"{collection_name}-{uuid.uuid4().hex[:8]}"
+        previous = {}
+    store = open_store(persist_directory, embedding, active)
+
+    try:
+        entries, stats = update_store(store, sources, previous, chunk_size, chunk_overlap)
+        # The snapshot is written before the manifest, so a manifest never
+        # points at a snapshot older than the collection
+        export_numpy(store, persist_directory, embedding)
+        save_manifest(dict(settings, chroma_collection=active, version=MANIFEST_VERSION, sources=entries),
+                      persist_directory)
+    except Exception:
+        if rebuilding:
+            # The old collection and manifest are untouched and still served
+            logger.error(f"Rebuild failed, keeping {retired or 'no'} collection")
+            store.delete_collection()
+        raise
+
+    if retired is not None and retired != active:
+        open_store(persist_directory, embedding, retired).delete_collection()
+    return stats
+
+
+def update_store(store, sources, previous, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """Embed new or changed chunks of sources into store; returns (manifest entries, counts)"""
+    stale_ids = []
+    splitter = None
+    entries = {}
+    stats = {"added": 0, "deleted": 0, "unchanged": 0, "failed": 0}
+
+    for source in sources:
+        old = previous.get(source)
+        try:
+            docs = load_source(source)
+        except Exception as e:
+            logger.error(f"Error loading from {source}: {str(e)}")
+            stats["failed"] += 1
+            if old:
+                entries[source] = old  # keep serving what we had
+            continue
+
+        digest = content_hash(docs)
+        if old and old["content_hash"] == digest:
+            entries[source] = old
+            stats["unchanged"] += 1
+            continue
+
+        splitter = splitter or get_splitter(chunk_size, chunk_overlap)
+        chunks = splitter.split_documents(docs)
+        ids = chunk_ids(source, chunks)
+        known = set(old["chunk_ids"]) if old else set()
+        new = [(chunk_id, chunk) for chunk_id, chunk in zip(ids, chunks) if chunk_id not in known]
+        if new:
+            store.add_texts(
+                [chunk.page_content for _, chunk in new],
+                metadatas=[dict(chunk.metadata, source=source) for _, chunk in new],
+                ids=[chunk_id for chunk_id, _ in new],
+            )
+        stale_ids.extend(known.difference(ids))
+        stats["added"] += len(new)
+        entries[source] = {"content_hash": digest, "chunk_ids": ids, "ingested_at": time.time()}
+        logger.info(f"{source}: {len(new)} of {len(ids)} chunks embedded")
+
+    # Sources no longer listed lose their chunks
+    for source, entry in previous.items():
+        if source not in entries:
+            stale_ids.extend(entry["chunk_ids"])
+    if stale_ids:
+        store.delete(ids=stale_ids)
+    stats["deleted"] = len(stale_ids)
+    return entries, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", nargs="+", default=DEFAULT_SOURCES,
+                        help="URLs, local HTML files or directories of them (default: the resource URLs)")
+    parser.add_argument("--persist-dir", default=PERSIST_DIRECTORY)
+    parser.add_argument("--embedding-model", default=EMBEDDING_MODEL)
+    parser.add_argument("--rebuild", action="store_true", help="re-embed every source")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("chromadb").setLevel(logging.WARNING)
+    stats = ingest(args.source, args.persist_dir, embedding_model=args.embedding_model, rebuild=args.rebuild)
+    print(f"Added {stats['added']} chunks, deleted {stats['deleted']}, "
+          f"{stats['unchanged']} sources unchanged, {stats['failed']} failed "
+          f"-> {os.path.relpath(args.persist_dir)}")
+
+
+if __name__ == "__main__":
+    main()
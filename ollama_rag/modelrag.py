@@ -1,20 +1,20 @@
 # mental_health_chatbot.py
 
-from langchain_community.document_loaders import WebBaseLoader
-from langchain_community.vectorstores import Chroma
 from langchain_ollama import ChatOllama
-from langchain_ollama import OllamaEmbeddings
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.text_splitter import CharacterTextSplitter
 from langchain.memory import ConversationBufferMemory
 import logging
 import asyncio
 import time
 import os
+import sys
 import torch
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from ollama_rag.ingest import open_vectorstore
+
 # Configure GPU/CUDA settings
 USE_GPU = torch.cuda.is_available()
 GPU_DEVICE = 0 if USE_GPU else -1
@@ -73,41 +73,11 @@ try:
         "If you do not find an answer in your resources, say 'I am sorry, I do not have that information.'"
     )
 
-    # URLs containing mental health resources
-    urls = [
-        "https://www.thelivelovelaughfoundation.org/find-help/helplines",
-        "https://depwd.gov.in/others-helplines/",
-        "https://pib.gov.in/PressReleaseIframePage.aspx?PRID=2100706",
-        "https://mpowerminds.com/oneonone",
-        "https://www.who.int/india/health-topics/mental-health",
-        # Add more relevant URLs as needed
-    ]
-
-    logger.info("Loading documents from URLs...")
-    # Load documents from the URLs
-    docs = []
-    for url in urls:
-        try:
-            loader = WebBaseLoader(url)
-            docs.extend(loader.load())
-        except Exception as e:
-            logger.error(f"Error loading from {url}: {str(e)}")
-
-    # Split documents into manageable chunks
-    text_splitter = CharacterTextSplitter.from_tiktoken_encoder(chunk_size=7500, chunk_overlap=100)
-    doc_splits = text_splitter.split_documents(docs)
-
-    logger.info("Creating embeddings and vector store...")
-    # Create embeddings with GPU support
-    embedding_model = OllamaEmbeddings(
-        model='nomic-embed-text',
-        base_url="http://localhost:11434"
-    )
-    vectorstore = Chroma.from_documents(
-        documents=doc_splits,
-        collection_name="mental-health-india",
-        embedding=embedding_model,
-    )
+    # The corpus is embedded offline by ingest.py; startup only opens the
+    # persisted index, so it needs neither the network nor re-embedding.
+    # Queries are embedded with the model the manifest says built the index.
+    logger.info("Opening persisted vector store...")
+    vectorstore = open_vectorstore()
     retriever = vectorstore.as_retriever()
 
     # Initialize conversation memory
@@ -124,12 +94,14 @@ try:
 
     after_rag_prompt = ChatPromptTemplate.from_template(after_rag_template)
 
+    # Generation over already retrieved documents, for callers that run
+    # retrieval as a separate stage
+    generate_chain = after_rag_prompt | model_local | StrOutputParser()
+
     # Create the RAG chain with async support
     after_rag_chain = (
         {"context": retriever, "question": RunnablePassthrough()}
-        | after_rag_prompt
-        | model_local
-        | StrOutputParser()
+        | generate_chain
     )
 
     logger.info("RAG system initialized successfully!")
@@ -1,17 +1,19 @@
-from langchain_community.document_loaders import WebBaseLoader
-from langchain_community.vectorstores import Chroma
-from langchain_ollama import ChatOllama
-from langchain_ollama import OllamaEmbeddings
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.memory import ConversationBufferMemory
-from langchain.schema import HumanMessage, AIMessage
+from collections import OrderedDict
 import logging
-import json
+import os
 import re
-from collections import deque
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from server.cache import RetrievalCache, fingerprint
+from server.crisis import engine as crisis_engine
+from server.embedding_cache import cached_embeddings
+from server.prompt_budget import PromptBudget
+from server.sanitizer import BLACKLISTED_ENTITIES, RESOURCE_PLACEHOLDER, Sanitizer
+from server.numpy_store import VECTOR_STORE, NumpyVectorStore
+from server.themes import ContextManager
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,100 +26,99 @@ THERAPY_RESOURCES = [
     "https://www.psychiatry.org/patients-families/psychotherapy"
 ]
 
-# Exclusion list for organizational references
-BLACKLISTED_ENTITIES = [
-    "mpower", "thelivelovelaughfoundation",
-    "depwd", "pib.gov", "mpowerminds"
-]
+# Conversations kept in memory at once, and how long an idle one survives
+THERAPY_MAX_SESSIONS = int(os.environ.get("THERAPY_MAX_SESSIONS", "1000"))
+THERAPY_IDLE_TTL = float(os.environ.get("THERAPY_IDLE_TTL", "3600"))
+# Messages kept per session; the prompt budget summarizes all but the last few
+THERAPY_MAX_MESSAGES = int(os.environ.get("THERAPY_MAX_MESSAGES", "40"))
+DEFAULT_SESSION = "default-session"
 
-class ContextManager:
-    def __init__(self, window_size=6):
-        self.window = deque(maxlen=window_size)
-        self.theme_tracker = {}
-        
-    def update(self, exchange):
-        """Add new exchange and track themes"""
-        self.window.append(exchange)
-        self._track_themes(exchange)
-        
-    def _track_themes(self, exchange):
-        """Track conversation themes"""
-        # Simple theme detection based on keywords
-        themes = {
-            'anxiety': r'\b(anxious|worried|panic|stress)\b',
-            'depression': r'\b(sad|depressed|hopeless|down)\b',
-            'relationships': r'\b(relationship|family|friend|partner)\b',
-            'self_esteem': r'\b(worthless|confidence|self-esteem)\b',
-            'trauma': r'\b(trauma|abuse|ptsd|flashback)\b'
-        }
-        
-        text = exchange.lower()
-        for theme, pattern in themes.items():
-            if re.search(pattern, text, re.I):
-                self.theme_tracker[theme] = self.theme_tracker.get(theme, 0) + 1
-                
-    def get_context(self):
-        """Get current conversation context and themes"""
-        return {
-            "recent_exchanges": list(self.window),
-            "dominant_themes": sorted(
-                self.theme_tracker.items(),
-                key=lambda x: x[1],
-                reverse=True
-            )[:3]
-        }
+class TherapySession:
+    """One user's conversation: (role, text) messages, themes and crisis flag
+
+    The lock is held for a whole turn, so a session's messages are never
+    interleaved; different sessions run in parallel.
+    """
+
+    __slots__ = ("messages", "context_manager", "crisis_mode", "lock", "updated_at")
 
-class TherapistBot:
     def __init__(self):
-        self.memory = ConversationBufferMemory(return_messages=True)
-        self.model_local = ChatOllama(
-            model="qwen2.5:latest",
-            temperature=0.8
-        )
-        self.crisis_mode = False
+        self.messages = []
         self.context_manager = ContextManager()
-        self.setup_embeddings()
+        self.crisis_mode = False
+        self.lock = threading.Lock()
+        self.updated_at = time.monotonic()
+
+    def add_exchange(self, user_input, response):
+        self.messages.append(("User", user_input))
+        self.messages.append(("Assistant", response))
+        del self.messages[:-THERAPY_MAX_MESSAGES]
+        self.updated_at = time.monotonic()
+
+class TherapySessions:
+    """Bounded registry of TherapySessions (LRU, idle sessions expire)"""
+
+    def __init__(self, max_sessions=THERAPY_MAX_SESSIONS, idle_ttl=THERAPY_IDLE_TTL):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()  # session_id -> TherapySession
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "evicted": 0, "expired": 0}
+
+    def get(self, session_id):
+        """The session's state, created on first use"""
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and self.idle_ttl and now - session.updated_at > self.idle_ttl:
+                session = None
+                self._stats["expired"] += 1
+            if session is None:
+                session = self._sessions[session_id] = TherapySession()
+                self._stats["created"] += 1
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._stats["evicted"] += 1
+            return session
+
+    def forget(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, sessions=len(self._sessions), max_sessions=self.max_sessions)
+
+class TherapistBot:
+    """Shared model client, vector store and caches serving many conversations
+
+    Everything per user lives in a TherapySession looked up by session ID,
+    so one bot (and one set of loaded documents) serves every HTTP user.
+    """
+
+    def __init__(self, model_local=None, load_documents=True):
+        # LangChain's Ollama, loader and splitter packages are imported only
+        # where they are used, so the session and prompt code runs without them
+        if model_local is None:
+            from langchain_ollama import ChatOllama
+            model_local = ChatOllama(
+                model="qwen2.5:latest",
+                temperature=0.8
+            )
+        self.model_local = model_local
+        self.sessions = TherapySessions()
+        # Repeated informational questions skip the embedding and vector search
+        self.retrieval_cache = RetrievalCache()
+        self.prompt_budget = PromptBudget()
+        self.vectorstore = None
+        self.retriever = None
+        if load_documents:
+            self.setup_embeddings()
         
-    # Enhanced crisis keywords with patterns and severity levels
-    CRISIS_KEYWORDS = {
-        "immediate_suicide": {
-            "patterns": [
-                r"\b(kill|end|hurt)\s+(myself|my\s+life)\b",
-                r"\b(want\s+to\s+die|going\s+to\s+die)\b",
-                r"\b(suicide|suicidal)\b",
-                r"\b(better\s+off\s+dead|don't\s+want\s+to\s+live)\b",
-                r"\b(plan\s+to\s+(die|kill))\b"
-            ],
-            "severity": "immediate"
-        },
-        "self_harm": {
-            "patterns": [
-                r"\b(cut|cutting|harm)\s+(myself|my)\b",
-                r"\b(self\s*harm|self\s*injury)\b",
-                r"\b(hurt\s+myself)\b"
-            ],
-            "severity": "high"
-        },
-        "severe_depression": {
-            "patterns": [
-                r"\b(hopeless|worthless|useless)\b",
-                r"\b(no\s+point|nothing\s+matters)\b",
-                r"\b(can't\s+go\s+on|give\s+up)\b",
-                r"\b(lost\s+all\s+hope)\b"
-            ],
-            "severity": "high"
-        },
-        "panic_anxiety": {
-            "patterns": [
-                r"\b(panic\s+attack|anxiety\s+attack)\b",
-                r"\b(can't\s+breathe|heart\s+racing)\b",
-                r"\b(going\s+crazy|losing\s+my\s+mind)\b",
-                r"\b(chest\s+pain|dizzy)\b"
-            ],
-            "severity": "medium"
-        }
-    }
-    
     # Comprehensive helpline information
     HELPLINE_INFO = {
         "immediate_suicide": {
@@ -151,72 +152,33 @@ class TherapistBot:
     }
     
     def detect_crisis(self, text):
-        """Enhanced hierarchical crisis assessment"""
-        text = text.lower().strip()
-        
-        # Immediate risk patterns
-        suicide_regex = r"""
-            (\b(end|kill|harm)\s+(my|this)\s*(life|self)\b)|
-            (\b(no\s+reason\s+to\s+live)\b)|
-            (\b(final|suicide)\s+(attempt|plan)\b)
-        """
-        
-        # Emotional distress patterns
-        depression_regex = r"""
-            (\b(can't\s+go\s+on)\b)|
-            (\b(lost\s+all\s+hope)\b)|
-            (\b(worthless|hopeless)\b)
-        """
-        
-        # Anxiety patterns
-        anxiety_regex = r"""
-            (\b(panic(\s+attack)?)\b)|
-            (\b(heart\s+racing)\b)|
-            (\b(can't\s+breathe)\b)
-        """
-        
-        crisis_levels = {
-            'immediate': suicide_regex,
-            'high': depression_regex,
-            'medium': anxiety_regex
-        }
-        
-        for level, pattern in crisis_levels.items():
-            if re.search(pattern, text, re.VERBOSE|re.IGNORECASE):
-                return {'category': level, 'severity': level}
-                
-        return None
+        """Hierarchical crisis assessment using the shared crisis engine"""
+        result = crisis_engine.detect(text)
+        if result is None:
+            return None
+        return {'category': result.category, 'severity': result.severity, 'spans': result.spans}
+
+    # Compiled once for every session
+    INFORMATIONAL_TRIGGERS = re.compile(
+        r"what (is|are)|how to|explain|define|resources for", re.I)
+    PERSONAL_SHARING = re.compile(
+        r"i (feel|think|need)|my (life|family|job)|struggling with|can't handle", re.I)
+    # One matcher for every blacklisted entity; also rewrites token streams
+    SANITIZER = Sanitizer(BLACKLISTED_ENTITIES, RESOURCE_PLACEHOLDER)
 
     def context_filter(self, query):
         """Determine if RAG context should be used"""
-        informational_triggers = [
-            r"what (is|are)",
-            r"how to",
-            r"explain",
-            r"define",
-            r"resources for"
-        ]
-        
-        personal_sharing = [
-            r"i (feel|think|need)",
-            r"my (life|family|job)",
-            r"struggling with",
-            r"can't handle"
-        ]
-        
-        if any(re.search(p, query, re.I) for p in informational_triggers):
+        if self.INFORMATIONAL_TRIGGERS.search(query):
             return True
-        elif any(re.search(p, query, re.I) for p in personal_sharing):
+        elif self.PERSONAL_SHARING.search(query):
             return False
         return None
 
     def sanitize_response(self, text):
         """Remove unwanted organizational references"""
-        for entity in BLACKLISTED_ENTITIES:
-            text = re.sub(rf"\b{entity}\b", "[mental health resource]", text, flags=re.I)
-        return text
+        return self.SANITIZER.sanitize(text)
     
-    def get_crisis_response(self, crisis_info):
+    def get_crisis_response(self, crisis_info, session=None):
         """Generate comprehensive crisis response with helplines."""
         category = crisis_info["category"]
         
@@ -231,7 +193,8 @@ class TherapistBot:
             response += f"\n{info['follow_up']}\n\n"
             response += "Remember: These conversations are confidential. You deserve support and care."
             
-            self.crisis_mode = True
+            if session is not None:
+                session.crisis_mode = True
             return response
         
         return self.get_general_crisis_response()
@@ -247,6 +210,10 @@ class TherapistBot:
     
     def setup_embeddings(self):
         """Initialize embeddings with curated therapeutic resources."""
+        from langchain_community.document_loaders import WebBaseLoader
+        from langchain_ollama import OllamaEmbeddings
+        from langchain.text_splitter import CharacterTextSplitter
+
         try:
             logger.info("Loading documents from therapeutic resources...")
             docs = []
@@ -265,75 +232,65 @@ class TherapistBot:
             doc_splits = text_splitter.split_documents(docs)
 
             logger.info("Creating embeddings and vector store...")
-            embedding_model = OllamaEmbeddings(
+            embedding_model = cached_embeddings(OllamaEmbeddings(
                 model='nomic-embed-text',
                 base_url="http://localhost:11434"
-            )
+            ))
             
             # Create vector store
-            self.vectorstore = Chroma.from_documents(
-                documents=doc_splits,
-                embedding=embedding_model
-            )
+            if VECTOR_STORE == "chroma":
+                from langchain_community.vectorstores import Chroma
+                self.vectorstore = Chroma.from_documents(
+                    documents=doc_splits,
+                    embedding=embedding_model
+                )
+            else:
+                self.vectorstore = NumpyVectorStore.from_documents(doc_splits, embedding_model)
             
             # Create retriever with similarity threshold
-            self.retriever = self.vectorstore.as_retriever(
-                search_kwargs={
-                    "k": 3,  # Return top 3 most relevant chunks
-                    "score_threshold": 0.7  # Only return relevant matches
-                }
-            )
+            search_kwargs = {
+                "k": 3,  # Return top 3 most relevant chunks
+                "score_threshold": 0.7  # Only return relevant matches
+            }
+            self.retriever = self.vectorstore.as_retriever(search_kwargs=search_kwargs)
+            
+            # Cached contexts belong to this configuration and these chunks;
+            # setting up the embeddings again starts a fresh cache
+            self.retrieval_cache.invalidate(fingerprint(
+                search_kwargs["k"], search_kwargs["score_threshold"], VECTOR_STORE,
+                *(doc.page_content for doc in doc_splits)
+            ))
             
             logger.info("Embeddings setup completed successfully")
         except Exception as e:
             logger.error(f"Error setting up embeddings: {str(e)}")
             raise
 
+    def retrieve_context(self, query):
+        """Retrieve documents for a query; returns (document IDs, formatted context)"""
+        docs = self.retriever.get_relevant_documents(query)
+        
+        # Extract and format relevant information
+        context = "\n".join([
+            f"- {doc.page_content.strip()}"
+            for doc in docs
+        ])
+        
+        doc_ids = [getattr(doc, "id", None) or fingerprint(doc.page_content) for doc in docs]
+        return doc_ids, context if context.strip() else ""
+
     def get_relevant_context(self, query):
         """Get relevant context from vector store with improved filtering."""
+        if self.retriever is None:
+            return ""
         try:
-            # Get relevant documents
-            docs = self.retriever.get_relevant_documents(query)
-            
-            # Extract and format relevant information
-            context = "\n".join([
-                f"- {doc.page_content.strip()}"
-                for doc in docs
-            ])
-            
-            return context if context.strip() else ""
+            return self.retrieval_cache.get_or_retrieve(query, self.retrieve_context)
         except Exception as e:
             logger.error(f"Error retrieving context: {str(e)}")
             return ""
     
-    def generate_therapeutic_response(self, user_input):
-        """Generate appropriate therapeutic response based on context."""
-        # First check for crisis
-        crisis_info = self.detect_crisis(user_input)
-        if crisis_info:
-            return self.get_crisis_response(crisis_info)
-        
-        # Update context manager
-        self.context_manager.update(user_input)
-        context_info = self.context_manager.get_context()
-        
-        # Determine if we should use RAG context
-        use_context = self.context_filter(user_input)
-        
-        # Get conversation history
-        history = self.memory.chat_memory.messages[-6:] if self.memory.chat_memory.messages else []
-        conversation_context = ""
-        if history:
-            conversation_context = "\n".join([
-                f"{'User' if isinstance(msg, HumanMessage) else 'Assistant'}: {msg.content}"
-                for msg in history
-            ])
-        
-        # Get relevant therapeutic context if needed
-        context = self.get_relevant_context(user_input) if use_context else ""
-        
-        # Enhanced therapeutic prompt
-        therapeutic_prompt = """You are an AI mental health assistant trained on various mental health guidelines and best practices. You provide empathetic support while maintaining clear boundaries about your role.
+    # Fixed part of every prompt; only counted against the budget, never cut
+    THERAPEUTIC_GUIDELINES = """You are an AI mental health assistant trained on various mental health guidelines and best practices. You provide empathetic support while maintaining clear boundaries about your role.
 
 CORE THERAPEUTIC MODALITIES:
 1. Person-Centered Therapy: Unconditional positive regard
@@ -353,23 +310,91 @@ SAFETY PROTOCOLS:
 - Immediate crisis detection override
 - No organizational references unless explicitly requested
 - Clear AI identity disclosure
-- Professional boundary maintenance
+- Professional boundary maintenance"""
+
+    RESPONSE_INSTRUCTIONS = """Generate a response that:
+1. Acknowledges and validates the user's feelings
+2. Maintains appropriate therapeutic boundaries
+3. Provides evidence-based support when appropriate
+4. Is transparent about being an AI assistant"""
+
+    def build_prompt(self, user_input, context_info, history, context=""):
+        return self.assemble_prompt(user_input, context_info, history, context)[0]
+
+    def assemble_prompt(self, user_input, context_info, history, context=""):
+        """(prompt, token counts per section) from history, themes and RAG context within the token budgets
+
+        history may be the whole conversation: the turns that do not fit are
+        folded into a rolling summary.
+        """
+        budget = self.prompt_budget
+        # (role, text) pairs as kept by TherapySession, or LangChain messages
+        messages = [
+            msg if isinstance(msg, tuple)
+            else ('User' if msg.type == 'human' else 'Assistant', msg.content)
+            for msg in history
+        ]
+        summary, recent = budget.fit_history(messages)
+        conversation_context = "\n".join(f"{role}: {text}" for role, text in recent)
+        themes = ', '.join(f"{theme}: {count}" for theme, count in context_info['dominant_themes'])
+        context = budget.fit_context(context)
+        user_input = budget.fit_message(user_input)
+        
+        summary_section = f"Earlier in the conversation:\n{summary}\n" if summary else ""
+        context_section = f"RELEVANT INFORMATION:\n{context}" if context else ""
+        therapeutic_prompt = f"""{self.THERAPEUTIC_GUIDELINES}
 
 CONVERSATION CONTEXT:
-Recent exchanges: {conversation_context}
+{summary_section}Recent exchanges: {conversation_context}
 
 IDENTIFIED THEMES:
-{', '.join(f"{theme}: {count}" for theme, count in context_info['dominant_themes'])}
+{themes}
 
-{f"RELEVANT INFORMATION:\n{context}" if context else ""}
+{context_section}
 
 USER MESSAGE: {user_input}
 
-Generate a response that:
-1. Acknowledges and validates the user's feelings
-2. Maintains appropriate therapeutic boundaries
-3. Provides evidence-based support when appropriate
-4. Is transparent about being an AI assistant"""
+{self.RESPONSE_INSTRUCTIONS}"""
+        counts = budget.record({
+            "guidelines": self.THERAPEUTIC_GUIDELINES,
+            "summary": summary,
+            "history": conversation_context,
+            "context": context,
+            "message": user_input,
+        }, therapeutic_prompt)
+        return therapeutic_prompt, counts
+
+    WELCOME_MESSAGE = "Hello! I am an AI mental health assistant trained on various mental health guidelines and best practices. I'm here to listen and provide support. How are you feeling today?"
+    GENERATION_ERROR_MESSAGE = "I'm having some technical difficulties right now. As an AI assistant, I want to ensure you receive reliable support. If you're experiencing distress, please reach out to a mental health professional or crisis helpline in your area."
+
+    def prepare_turn(self, user_input, session):
+        """(crisis response, None) for a crisis message, else (None, therapeutic prompt)"""
+        # First check for crisis
+        crisis_info = self.detect_crisis(user_input)
+        if crisis_info:
+            return self.get_crisis_response(crisis_info, session), None
+        
+        # Update context manager
+        session.context_manager.update(user_input)
+        context_info = session.context_manager.get_context()
+        
+        # Determine if we should use RAG context
+        use_context = self.context_filter(user_input)
+        
+        # Get relevant therapeutic context if needed
+        context = self.get_relevant_context(user_input) if use_context else ""
+        
+        # Enhanced therapeutic prompt (build_prompt keeps the history that
+        # fits and summarizes the rest)
+        therapeutic_prompt, counts = self.assemble_prompt(user_input, context_info, session.messages, context)
+        logger.info(f"Prompt tokens: {counts}")
+        return None, therapeutic_prompt
+
+    def generate_therapeutic_response(self, user_input, session):
+        """Generate appropriate therapeutic response based on context."""
+        crisis_response, therapeutic_prompt = self.prepare_turn(user_input, session)
+        if crisis_response is not None:
+            return crisis_response
 
         try:
             response = self.model_local.invoke(therapeutic_prompt)
@@ -379,38 +404,82 @@ Generate a response that:
             response_text = self.sanitize_response(response_text)
             
             # Add to memory
-            self.memory.chat_memory.add_user_message(user_input)
-            self.memory.chat_memory.add_ai_message(response_text)
+            session.add_exchange(user_input, response_text)
             
             return response_text
             
         except Exception as e:
             logger.error(f"Error generating response: {e}")
-            return "I'm having some technical difficulties right now. As an AI assistant, I want to ensure you receive reliable support. If you're experiencing distress, please reach out to a mental health professional or crisis helpline in your area."
+            return self.GENERATION_ERROR_MESSAGE
     
-    def chat(self, user_input):
+    def chat(self, user_input, session_id=DEFAULT_SESSION):
         """Main chat interface."""
         if not user_input.strip():
-            return "Hello! I am an AI mental health assistant trained on various mental health guidelines and best practices. I'm here to listen and provide support. How are you feeling today?"
+            return self.WELCOME_MESSAGE
         
         try:
-            response = self.generate_therapeutic_response(user_input)
-            return response
+            session = self.sessions.get(session_id)
+            with session.lock:
+                return self.generate_therapeutic_response(user_input, session)
         except Exception as e:
             logger.error(f"Chat error: {e}")
             return "I apologize, but I'm experiencing some technical issues. If you're in crisis, please reach out to a mental health helpline or emergency services in your area."
 
-    def clear_memory(self):
-        """Clear the conversation memory and reset to initial state."""
-        self.memory = ConversationBufferMemory(return_messages=True)
-        self.crisis_mode = False
-        logger.info("Conversation memory cleared")
+    def stream_chat(self, user_input, session_id=DEFAULT_SESSION):
+        """Yield the reply in pieces as the model generates it
+
+        The crisis check runs before any generation, and a crisis reply is
+        yielded whole. Pieces are sanitized on the fly. The exchange is added
+        to the session's memory only once the stream completes, so a reply
+        the client abandoned is not remembered. The session stays locked
+        until the generator finishes or is closed.
+        """
+        if not user_input.strip():
+            yield self.WELCOME_MESSAGE
+            return
+        
+        session = self.sessions.get(session_id)
+        with session.lock:
+            try:
+                crisis_response, therapeutic_prompt = self.prepare_turn(user_input, session)
+            except Exception as e:
+                logger.error(f"Chat error: {e}")
+                yield "I apologize, but I'm experiencing some technical issues. If you're in crisis, please reach out to a mental health helpline or emergency services in your area."
+                return
+            if crisis_response is not None:
+                yield crisis_response
+                return
 
-# Initialize the bot
-bot = TherapistBot()
+            sanitizer = self.SANITIZER.stream()
+            pieces = []
+            try:
+                for chunk in self.model_local.stream(therapeutic_prompt):
+                    piece = sanitizer.feed(chunk.content if hasattr(chunk, 'content') else str(chunk))
+                    if piece:
+                        pieces.append(piece)
+                        yield piece
+                piece = sanitizer.flush()
+                if piece:
+                    pieces.append(piece)
+                    yield piece
+            except Exception as e:
+                logger.error(f"Error streaming response: {e}")
+                yield self.GENERATION_ERROR_MESSAGE if not pieces else f"\n\n{self.GENERATION_ERROR_MESSAGE}"
+                return
+            
+            session.add_exchange(user_input, "".join(pieces))
+
+    def clear_memory(self, session_id=DEFAULT_SESSION):
+        """Clear a session's conversation memory and reset it to its initial state."""
+        self.sessions.forget(session_id)
+        logger.info("Conversation memory cleared")
 
 # Example usage
 if __name__ == "__main__":
+    # Created here rather than at import time: setup_embeddings() fetches the
+    # therapy resources and embeds them through Ollama
+    bot = TherapistBot()
+    
     print("Mental Health Support Bot Ready")
     print("Type 'quit' to exit")
     print("-" * 50)
@@ -0,0 +1,280 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CRISIS_CHAT_TYPES = ("CRISIS_SUPPORT",)
+
+
+def parse_limits(spec):
+    """'GENERAL=3,THERAPY=2' -> {'GENERAL': 3, 'THERAPY': 2}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        chat_type, _, value = item.partition("=")
+        limits[chat_type.strip()] = int(value)
+    return limits
+
+
+ADMISSION_MAX_CONCURRENT = int(os.environ.get("ADMISSION_MAX_CONCURRENT", "4"))
+ADMISSION_CRISIS_RESERVE = int(os.environ.get("ADMISSION_CRISIS_RESERVE", "1"))
+ADMISSION_LIMITS = parse_limits(os.environ.get("ADMISSION_LIMITS", "GENERAL=3,THERAPY=3,WELLNESS=3"))
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "30"))
+ADMISSION_CRISIS_TIMEOUT = float(os.environ.get("ADMISSION_CRISIS_TIMEOUT", "60"))
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed; servers answer 503 with Retry-After"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Server busy ({reason}), retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def busy_response(e, error=None):
+    """(body, 503, headers) for a shed request; Flask returns it as is"""
+    logger.warning(f"Request shed: {str(e)}")
+    return ({"error": error or str(e), "retry_after": e.retry_after},
+            503, {"Retry-After": str(e.retry_after)})
+
+
+@contextlib.contextmanager
+def released_on_error(ticket):
+    """Release ticket if the block raises before handing it to the response"""
+    try:
+        yield ticket
+    except BaseException:
+        if ticket is not None:
+            ticket.release()
+        raise
+
+
+def ndjson(payload):
+    return json.dumps(payload) + "\n"
+
+
+def single_chunk_stream(text):
+    """A complete reply as a stream: one chunk, then the final line"""
+    yield ndjson({"chunk": text, "done": False})
+    yield ndjson({"chunk": "", "done": True, "full_response": text})
+
+
+class Ticket:
+    """An admitted request's slot; release exactly once (idempotent)"""
+
+    __slots__ = ("_controller", "chat_type", "crisis", "admitted_at", "_released")
+
+    def __init__(self, controller, chat_type, crisis):
+        self._controller = controller
+        self.chat_type = chat_type
+        self.crisis = crisis
+        self.admitted_at = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class _Waiter:
+    __slots__ = ("chat_type", "crisis", "enqueued_at", "ticket", "cancelled", "_notify")
+
+    def __init__(self, chat_type, crisis, notify):
+        self.chat_type = chat_type
+        self.crisis = crisis
+        self.enqueued_at = time.monotonic()
+        self.ticket = None
+        self.cancelled = False
+        self._notify = notify
+
+
+class AdmissionController:
+    """Priority admission control in front of an LLM backend
+
+    At most ``max_concurrent`` generations run at once and each chat type is
+    capped by ``limits``. Crisis requests (crisis chat types or crisis-flagged
+    messages) are strictly prioritised: they jump every queue, ignore per-type
+    limits and may use ``crisis_reserve`` slots that ordinary traffic never
+    gets, so they are not stuck behind long generations. Ordinary requests
+    wait in a bounded queue for at most ``queue_timeout`` seconds and are
+    otherwise shed with AdmissionRejected.
+    """
+
+    def __init__(self, max_concurrent=ADMISSION_MAX_CONCURRENT, limits=None,
+                 crisis_reserve=ADMISSION_CRISIS_RESERVE, max_queue=ADMISSION_MAX_QUEUE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT, crisis_timeout=ADMISSION_CRISIS_TIMEOUT,
+                 crisis_chat_types=CRISIS_CHAT_TYPES):
+        self.max_concurrent = max_concurrent
+        self.limits = dict(ADMISSION_LIMITS if limits is None else limits)
+        self.crisis_reserve = min(crisis_reserve, max_concurrent - 1)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.crisis_timeout = crisis_timeout
+        self.crisis_chat_types = set(crisis_chat_types)
+        self._lock = threading.Lock()
+        self._queue = []  # heap of (priority, seq, waiter)
+        self._seq = itertools.count()
+        self._running = 0
+        self._running_by_type = {}
+        self._queued = 0
+        self._service_time = 5.0  # EWMA of slot hold time, seeds Retry-After
+        self._stats = {"admitted": 0, "admitted_crisis": 0, "queued": 0,
+                       "shed_queue_full": 0, "shed_timeout": 0,
+                       "max_wait": 0.0, "max_wait_crisis": 0.0}
+
+    def is_crisis(self, chat_type, crisis=False):
+        return bool(crisis) or chat_type in self.crisis_chat_types
+
+    # Blocking / async entry points
+
+    def acquire(self, chat_type="GENERAL", crisis=False, timeout=None):
+        """Block until admitted; returns a Ticket or raises AdmissionRejected"""
+        event = threading.Event()
+        waiter, ticket = self._enqueue(chat_type, crisis, event.set)
+        if ticket is not None:
+            return ticket
+        if not event.wait(self._timeout(waiter, timeout)):
+            self._abandon(waiter)
+        return self._result(waiter)
+
+    async def acquire_async(self, chat_type="GENERAL", crisis=False, timeout=None):
+        """asyncio version of acquire(); does not block the event loop while queued"""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        waiter, ticket = self._enqueue(chat_type, crisis, notify)
+        if ticket is not None:
+            return ticket
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), self._timeout(waiter, timeout))
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            if waiter.ticket is not None:
+                waiter.ticket.release()
+            raise
+        return self._result(waiter)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, running=self._running, queue_depth=self._queued,
+                        running_by_type=dict(self._running_by_type),
+                        max_concurrent=self.max_concurrent, limits=dict(self.limits),
+                        crisis_reserve=self.crisis_reserve)
+
+    # Internals
+
+    def _timeout(self, waiter, timeout):
+        if timeout is not None:
+            return timeout
+        return self.crisis_timeout if waiter.crisis else self.queue_timeout
+
+    def _result(self, waiter):
+        if waiter.ticket is not None:
+            return waiter.ticket
+        raise AdmissionRejected("queue timeout", self._retry_after())
+
+    def _enqueue(self, chat_type, crisis, notify):
+        crisis = self.is_crisis(chat_type, crisis)
+        waiter = _Waiter(chat_type, crisis, notify)
+        with self._lock:
+            if not self._queued_crisis_ahead(crisis) and self._can_run(chat_type, crisis):
+                return waiter, self._grant(waiter)
+            if not crisis and self._queued >= self.max_queue:
+                self._stats["shed_queue_full"] += 1
+                raise AdmissionRejected("queue full", self._retry_after())
+            # Crisis requests sort ahead of everything else; FIFO within a lane
+            heapq.heappush(self._queue, (0 if crisis else 1, next(self._seq), waiter))
+            self._queued += 1
+            self._stats["queued"] += 1
+        return waiter, None
+
+    def _queued_crisis_ahead(self, crisis):
+        if crisis:
+            return False
+        return any(entry[0] == 0 and not entry[2].cancelled for entry in self._queue)
+
+    def _can_run(self, chat_type, crisis):
+        if crisis:
+            return self._running < self.max_concurrent
+        if self._running >= self.max_concurrent - self.crisis_reserve:
+            return False
+        limit = self.limits.get(chat_type, self.max_concurrent - self.crisis_reserve)
+        return self._running_by_type.get(chat_type, 0) < limit
+
+    def _grant(self, waiter):
+        ticket = Ticket(self, waiter.chat_type, waiter.crisis)
+        waiter.ticket = ticket
+        self._running += 1
+        self._running_by_type[waiter.chat_type] = self._running_by_type.get(waiter.chat_type, 0) + 1
+        waited = ticket.admitted_at - waiter.enqueued_at
+        self._stats["admitted"] += 1
+        if waiter.crisis:
+            self._stats["admitted_crisis"] += 1
+            self._stats["max_wait_crisis"] = max(self._stats["max_wait_crisis"], waited)
+        else:
+            self._stats["max_wait"] = max(self._stats["max_wait"], waited)
+        return ticket
+
+    def _abandon(self, waiter):
+        with self._lock:
+            if waiter.ticket is None and not waiter.cancelled:
+                waiter.cancelled = True
+                self._queued -= 1
+                self._stats["shed_timeout"] += 1
+
+    def _release(self, ticket):
+        with self._lock:
+            self._running -= 1
+            self._running_by_type[ticket.chat_type] -= 1
+            held = time.monotonic() - ticket.admitted_at
+            self._service_time = 0.8 * self._service_time + 0.2 * held
+            self._dispatch()
+
+    def _dispatch(self):
+        # Strict priority: walk the heap in order and start everything that
+        # fits. A blocked ordinary request does not hold back other chat
+        # types, but nothing ordinary starts while a crisis request is waiting.
+        skipped = []
+        crisis_waiting = False
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            waiter = entry[2]
+            if waiter.cancelled:
+                continue
+            if crisis_waiting and not waiter.crisis:
+                skipped.append(entry)
+                continue
+            if self._can_run(waiter.chat_type, waiter.crisis):
+                self._queued -= 1
+                self._grant(waiter)
+                waiter._notify()
+            else:
+                crisis_waiting = crisis_waiting or waiter.crisis
+                skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+
+    def _retry_after(self):
+        slots = max(self.max_concurrent - self.crisis_reserve, 1)
+        estimate = self._service_time * (self._queued / slots + 1)
+        return int(min(max(estimate, 1), 60))
@@ -6,6 +6,7 @@ import os
 # Add ollama_rag directory to Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from ollama_rag.modelrag import after_rag_chain
+from singleflight import SingleFlight, request_key
 import logging
 
 # Configure logging
@@ -15,6 +16,9 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Concurrent identical messages share one RAG generation
+rag_calls = SingleFlight("after_rag_chain")
+
 @app.route('/chat', methods=['POST'])
 def chat():
     try:
@@ -33,7 +37,8 @@ def chat():
         logger.info(f"Processing message: {message}")
         
         # Get response from Ollama RAG
-        response = after_rag_chain.invoke(message)
+        response = rag_calls.do(request_key("after_rag_chain", message),
+                                lambda: after_rag_chain.invoke(message))
         logger.info(f"Generated response: {response}")
         
         return jsonify({'response': response})
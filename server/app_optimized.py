@@ -4,25 +4,27 @@ import sys
 import os
 import logging
 import asyncio
-import time
-from optimized_embeddings import OptimizedEmbeddings
-from transformers import pipeline
-import torch
-
-# Configure GPU detection
-USE_GPU = torch.cuda.is_available()
-if USE_GPU:
-    os.environ["CUDA_VISIBLE_DEVICES"] = "0"
-    logging.info(f"GPU is available: {torch.cuda.get_device_name(0)}")
-else:
-    logging.info("GPU not available, using CPU only")
+from session_store import create_store
+from singleflight import SingleFlight, request_key
+from admission import AdmissionController, AdmissionRejected
+from crisis import detect, is_high_risk, lookup_helpline
+from warmup import NotReady, Warmup
+from stages import StageGraph
+
+# torch, transformers, the embeddings and the RAG chain take tens of seconds
+# to import and build, so none of them is imported here. They load on the
+# warm-up thread while the server is already answering /health; /ready
+# reports their progress, and crisis replies never depend on them.
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Initialize the optimized embeddings system
-embedder = OptimizedEmbeddings(persist_directory="./chroma_db")
+# Add parent directory to Python path to fix import issues
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+    logger.info(f"Added parent directory to Python path: {parent_dir}")
 
 # Create collections for different chat types
 collections = {
@@ -32,76 +34,99 @@ collections = {
     "WELLNESS": "wellness_advice"
 }
 
-# Crisis detection system
-CRISIS_KEYWORDS = [
-    "suicide", "kill myself", "end my life", "die", "worthless", 
-    "cant go on", "hopeless", "nobody cares", "self harm", "hurt myself"
-]
+def load_torch():
+    """Configure GPU detection"""
+    import torch
+    use_gpu = torch.cuda.is_available()
+    if use_gpu:
+        os.environ["CUDA_VISIBLE_DEVICES"] = "0"
+        logger.info(f"GPU is available: {torch.cuda.get_device_name(0)}")
+    else:
+        logger.info("GPU not available, using CPU only")
+    return {"gpu_available": use_gpu}
 
-def is_high_risk(text: str) -> bool:
-    """Check if a message contains crisis indicators"""
-    if not text:
-        return False
-    lower = text.lower()
-    return any(kw in lower for kw in CRISIS_KEYWORDS)
-
-# Helpline information
-HELPLINES = {
-    "tele-manas": {"number": "14416", "desc": "24×7 Government helpline (all Indian languages)"},
-    "kiran":      {"number": "1800-599-0019", "desc": "National Mental Health Rehab Helpline"},
-    "aasra":      {"number": "+91-22-27546669", "desc": "24×7 Suicide Prevention"},
-    "vandrevala": {"number": "+91-9999666555", "desc": "24×7 Free Counseling"},
-}
+def load_embedder():
+    """Initialize the optimized embeddings system"""
+    from optimized_embeddings import OptimizedEmbeddings
+    return OptimizedEmbeddings(persist_directory="./chroma_db")
 
-def lookup_helpline(topic: str):
-    """Find the most appropriate helpline based on the topic"""
-    tl = topic.lower()
-    if "suicide" in tl or "die" in tl or "end my life" in tl:
-        return HELPLINES["aasra"]
-    if "depress" in tl or "depression" in tl or "anxiety" in tl:
-        return HELPLINES["tele-manas"]
-    # default
-    return HELPLINES["tele-manas"]
-
-# Initialize emotion detection (will be loaded on first use to avoid startup delays)
-emo_pipeline = None
-
-def get_emotion_pipeline():
-    """Lazy loading of emotion detection pipeline"""
-    global emo_pipeline
-    if emo_pipeline is None:
-        try:
-            logger.info("Initializing emotion detection pipeline...")
-            # Use GPU if available, otherwise fallback to CPU
-            device = 0 if USE_GPU else -1
-            emo_pipeline = pipeline(
-                "text-classification",
-                model="j-hartmann/emotion-english-distilroberta-base",
-                return_all_scores=True,
-                device=device
-            )
-            logger.info(f"Emotion detection pipeline initialized on {'GPU' if USE_GPU else 'CPU'}")
-        except Exception as e:
-            logger.warning(f"Could not initialize emotion detection: {str(e)}")
-            return None
-    return emo_pipeline
+def load_emotion_pipeline():
+    """Initialize emotion detection behind a micro-batcher"""
+    from transformers import pipeline
+    from emotion_batcher import EmotionBatcher
+    logger.info("Initializing emotion detection pipeline...")
+    # Use GPU if available, otherwise fallback to CPU
+    use_gpu = warmup.components["torch"].get(wait=None)["gpu_available"]
+    emo_pipeline = pipeline(
+        "text-classification",
+        model="j-hartmann/emotion-english-distilroberta-base",
+        return_all_scores=True,
+        device=0 if use_gpu else -1
+    )
+    logger.info(f"Emotion detection pipeline initialized on {'GPU' if use_gpu else 'CPU'}")
+    # Concurrent requests share forward passes instead of running one each
+    return EmotionBatcher(emo_pipeline)
+
+def load_rag_chain():
+    """Import the RAG chain (opens the persisted vector store, see ollama_rag/ingest.py)
+
+    /chat uses its retriever and generation steps as separate stages.
+    """
+    from ollama_rag.ingest import IndexNotFound
+    try:
+        from ollama_rag import modelrag
+    except IndexNotFound as e:
+        # Not fatal: the component fails and /chat answers in basic mode
+        logger.error(f"RAG chain unavailable until the index is built: {str(e)}")
+        raise
+    logger.info("Successfully imported after_rag_chain")
+    return modelrag
+
+# Heavy components, loaded in this order on one background thread. Emotion
+# detection is optional: chat works without it.
+warmup = Warmup()
+warmup.register("torch", load_torch)
+warmup.register("embeddings", load_embedder)
+warmup.register("rag_chain", load_rag_chain)
+warmup.register("emotion", load_emotion_pipeline, required=False)
+warmup.start()
+
+# Emotion is only logged, so a slow classifier never holds up a reply for long
+EMOTION_TIMEOUT = float(os.environ.get("EMOTION_TIMEOUT", "2"))
+
+def gpu_available():
+    torch_info = warmup.components["torch"].peek()
+    return torch_info["gpu_available"] if torch_info else None
+
+def emotion_stats():
+    batcher = warmup.components["emotion"].peek()
+    return batcher.stats() if batcher else None
 
 def top_emotion(text):
-    """Detect the primary emotion in text"""
-    pipeline = get_emotion_pipeline()
-    if not pipeline or not text:
+    """Detect the primary emotion in text ("unknown" until the pipeline has loaded)"""
+    try:
+        batcher = warmup.components["emotion"].get()
+    except NotReady:
+        return "unknown"
+    if not text:
         return "unknown"
     
     try:
-        scores = pipeline(text)[0]
-        best = max(scores, key=lambda x: x["score"])
-        return best["label"]
+        return batcher.top_emotion(text, timeout=EMOTION_TIMEOUT)
     except Exception as e:
         logger.warning(f"Error detecting emotion: {str(e)}")
         return "unknown"
 
-# Session storage to track conversation history
-sessions = {}
+# Session storage to track conversation history (user and assistant
+# messages are stored separately, so 20 entries is 10 exchanges)
+sessions = create_store(path=os.environ.get("SESSION_PATH", "./sessions_optimized.db"), max_history=20)
+
+# Concurrent identical messages share one RAG generation
+rag_calls = SingleFlight("after_rag_chain")
+
+# Per chat type concurrency limits in front of the RAG chain. High-risk
+# messages never wait here: they are answered before any model is called.
+admission = AdmissionController()
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -110,24 +135,11 @@ CORS(app)  # Enable CORS for all routes
 def basic_response(message):
     return f"I received your message: '{message}'. I'm running in basic mode because the advanced response system couldn't be loaded."
 
-# Add parent directory to Python path to fix import issues
-parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-if parent_dir not in sys.path:
-    sys.path.insert(0, parent_dir)
-    logger.info(f"Added parent directory to Python path: {parent_dir}")
-
-# Try to import the RAG chain
-has_rag_chain = False
-try:
-    from ollama_rag.modelrag import after_rag_chain
-    logger.info("Successfully imported after_rag_chain")
-    has_rag_chain = True
-except ImportError as e:
-    logger.error(f"Could not import after_rag_chain: {str(e)}")
-    after_rag_chain = None
-
-# We need to see where the ollama_rag module is
-logger.info(f"Current sys.path: {sys.path}")
+def warming_up_response(e):
+    logger.warning(f"Request before warm-up finished: {str(e)}")
+    return (jsonify({"error": "The server is still starting up, please try again shortly.",
+                     "retry_after": e.retry_after}),
+            503, {"Retry-After": str(e.retry_after)})
 
 def get_collection_for_chat_type(chat_type):
     """Get the appropriate collection name for a chat type"""
@@ -148,6 +160,53 @@ def get_helpline_response(message):
     helpline = lookup_helpline(message)
     return f"For support, you can call {helpline['desc']} at {helpline['number']}. This service is available 24/7 and is free of charge."
 
+# /chat after the crisis check: retrieval and recording the user message
+# run side by side, generation starts as soon as retrieval is done, and
+# emotion detection runs in the background since it is only logged
+chat_stages = StageGraph("chat")
+
+@chat_stages.stage("retrieve")
+def retrieve_stage(ctx):
+    rag = ctx["rag"]
+    if rag is None:
+        return None
+    try:
+        return rag_calls.do(request_key("retrieve", ctx["message"]),
+                            lambda: rag.retriever.invoke(ctx["message"]))
+    except Exception as e:
+        logger.error(f"Error retrieving context: {str(e)}")
+        return None
+
+@chat_stages.stage("history")
+def history_stage(ctx):
+    # Add the new message to the session history
+    sessions.append(ctx["session_id"], {"role": "user", "content": ctx["message"]})
+
+@chat_stages.stage("generate", after=("retrieve",))
+def generate_stage(ctx):
+    rag, message = ctx["rag"], ctx["message"]
+    if rag is None or ctx["retrieve"] is None:
+        logger.warning("Using basic response (RAG chain not available)")
+        return basic_response(message)
+    try:
+        logger.info("Calling after_rag_chain...")
+        return rag_calls.do(request_key("after_rag_chain", message),
+                            lambda: rag.generate_chain.invoke({"context": ctx["retrieve"], "question": message}))
+    except Exception as e:
+        logger.error(f"Error from RAG chain: {str(e)}")
+        # Fall back to basic response
+        return basic_response(message)
+
+@chat_stages.stage("store", after=("generate", "history"))
+def store_stage(ctx):
+    # Add the response to the session, after the user message
+    sessions.append(ctx["session_id"], {"role": "assistant", "content": ctx["generate"]})
+
+def log_emotion(message):
+    emotion = top_emotion(message)
+    logger.info(f"Detected emotion: {emotion}")
+    return emotion
+
 @app.route('/chat', methods=['POST'])
 def chat():
     try:
@@ -166,54 +225,42 @@ def chat():
         # Log incoming request
         logger.info(f"Received chat request: session={session_id}, type={chat_type}, message='{message[:30]}...'")
         
-        # Get collection name based on chat type
-        collection_name = collections.get(chat_type, collections["GENERAL"])
-        
-        # Check for crisis indicators
-        is_crisis = is_high_risk(message)
+        # Check for crisis indicators (one scan serves both checks)
+        crisis = detect(message)
+        is_crisis = is_high_risk(message, crisis)
         if is_crisis:
             logger.warning(f"Crisis detected in message: '{message}'")
-            helpline = lookup_helpline(message)
+            helpline = lookup_helpline(message, crisis)
             response = f"I notice you may be going through a difficult time. If you need immediate support, please consider contacting {helpline['desc']} at {helpline['number']}. Remember, it's okay to ask for help."
             return jsonify({"response": response})
             
-        # Detect emotion
-        emotion = top_emotion(message)
-        logger.info(f"Detected emotion: {emotion}")
+        # A chain that failed to load falls back to the basic reply; one
+        # still loading answers 503 before anything is stored
+        try:
+            rag = warmup.components["rag_chain"].get()
+        except NotReady as e:
+            if e.state != "failed":
+                return warming_up_response(e)
+            rag = None
         
-        # Prepare context for the model
-        # Track session for conversation history
-        if session_id not in sessions:
-            sessions[session_id] = []
+        chat_stages.background(log_emotion, message)
         
-        # Add the new message to the session
-        sessions[session_id].append({"role": "user", "content": message})
+        # Retrieval and generation both call Ollama, so the admission slot
+        # covers the whole graph
+        ticket = admission.acquire(chat_type) if rag is not None else None
+        try:
+            ctx, timings = chat_stages.run(rag=rag, message=message, session_id=session_id)
+        finally:
+            if ticket is not None:
+                ticket.release()
         
-        # Generate response
-        if has_rag_chain and after_rag_chain:
-            logger.info("Using RAG chain for response")
-            try:
-                # Log before calling the chain
-                logger.info("Calling after_rag_chain...")
-                
-                # Call the RAG chain with the message - fix the invocation method
-                start_time = time.time()
-                response = after_rag_chain.invoke(message)
-                elapsed = time.time() - start_time
-                
-                logger.info(f"Got response from RAG chain in {elapsed:.2f}s")
-            except Exception as e:
-                logger.error(f"Error from RAG chain: {str(e)}")
-                # Fall back to basic response
-                response = basic_response(message)
-        else:
-            logger.warning("Using basic response (RAG chain not available)")
-            response = basic_response(message)
-            
-        # Add the response to the session
-        sessions[session_id].append({"role": "assistant", "content": response})
+        logger.info(f"Chat stages: {timings.summary()} (total {timings.total_ms:.0f}ms)")
+        return jsonify({"response": ctx["generate"]}), 200, {"Server-Timing": timings.server_timing()}
         
-        return jsonify({"response": response})
+    except AdmissionRejected as e:
+        logger.warning(f"Request shed: {str(e)}")
+        return (jsonify({"error": str(e), "retry_after": e.retry_after}),
+                503, {"Retry-After": str(e.retry_after)})
         
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}")
@@ -221,18 +268,30 @@ def chat():
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """Liveness: answers as soon as the port is bound and never loads anything"""
+    embedder = warmup.components["embeddings"].peek()
     status = {
         "status": "ok",
-        "rag_available": has_rag_chain,
-        "embeddings": embedder.status(),
-        "emotion_detection": get_emotion_pipeline() is not None,
-        "gpu_available": USE_GPU
+        "ready": warmup.ready(),
+        "rag_available": warmup.components["rag_chain"].peek() is not None,
+        "embeddings": embedder.status() if embedder else None,
+        "emotion_detection": warmup.components["emotion"].peek() is not None,
+        "emotion_batching": emotion_stats(),
+        "gpu_available": gpu_available(),
+        "sessions": sessions.stats(),
+        "coalescing": rag_calls.stats(),
+        "admission": admission.stats(),
+        "chat_stages": chat_stages.stats()
     }
     return jsonify(status)
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness: 200 once every required component has loaded, 503 before"""
+    readiness = warmup.readiness()
+    return jsonify(readiness), 200 if readiness["ready"] else 503
+
 if __name__ == '__main__':
     logger.info("Starting optimized mental health chat server...")
-    logger.info(f"RAG chain available: {has_rag_chain}")
-    logger.info(f"GPU acceleration: {USE_GPU}")
-    app.run(host='0.0.0.0', port=5001, debug=True) 
\ No newline at end of file
+    # The reloader would import this module, and warm everything up, twice
+    app.run(host='0.0.0.0', port=5001, debug=True, use_reloader=False) 
\ No newline at end of file
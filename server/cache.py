@@ -0,0 +1,303 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Case-, punctuation- and whitespace-insensitive cache key"""
+    text = _PUNCTUATION.sub(" ", text.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def fingerprint(*parts):
+    """Stable hash of everything an answer depends on (documents, model names, ...)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl`` seconds"""
+
+    def __init__(self, maxsize=256, ttl=3600.0, on_evict=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.clock = clock
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and item[1] > self.clock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            if item[1] <= self.clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, self.clock() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data[key][0]
+            self._remove(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._data):
+                self._remove(key)
+
+    def prune(self):
+        """Remove every expired entry"""
+        with self._lock:
+            now = self.clock()
+            for key in [key for key, item in self._data.items() if item[1] <= now]:
+                self._remove(key)
+                self.expirations += 1
+
+    def _remove(self, key):
+        self._data.pop(key)
+        if self.on_evict is not None:
+            self.on_evict(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class AnswerCache:
+    """Response cache matching exact (normalized) prompts and near-identical ones by embedding
+
+    ``embed_query`` maps a prompt to a vector (e.g. an embeddings object's
+    ``embed_query``); without it only exact matches are served. The cache is
+    labelled with a fingerprint of the documents and models behind the
+    answers; invalidate() with a different fingerprint empties it, so a
+    caller that changes either has to pass the new one.
+    """
+
+    def __init__(self, embed_query=None, threshold=0.92, maxsize=256, ttl=3600.0,
+                 fingerprint=""):
+        self.embed_query = embed_query
+        self.threshold = threshold
+        self.fingerprint = fingerprint
+        self._answers = TTLCache(maxsize, ttl, on_evict=self._forget_vector)
+        self._vectors = {}  # normalized prompt -> unit vector
+        # Vectors computed by a missed lookup, reused when its answer is stored
+        self._pending = TTLCache(maxsize=128, ttl=300.0)
+        self._lock = threading.RLock()
+        self._stats = {"lookups": 0, "exact_hits": 0, "semantic_hits": 0, "misses": 0,
+                       "embed_errors": 0, "invalidations": 0}
+
+    def lookup(self, prompt, semantic=True):
+        """Return (answer, match) where match is 'exact', 'semantic' or None
+
+        With semantic=False only exact matches are tried and the prompt is
+        not embedded.
+        """
+        key = normalize_text(prompt)
+        with self._lock:
+            self._stats["lookups"] += 1
+            answer = self._answers.get(key)
+            if answer is not None:
+                self._stats["exact_hits"] += 1
+                return answer, "exact"
+
+        vector = self._embed(prompt) if semantic else None
+        if vector is not None:
+            with self._lock:
+                match = self._nearest(vector)
+                if match is not None:
+                    answer = self._answers.get(match)
+                    if answer is not None:
+                        self._stats["semantic_hits"] += 1
+                        return answer, "semantic"
+            self._pending.set(key, vector)
+        with self._lock:
+            self._stats["misses"] += 1
+        return None, None
+
+    def store(self, prompt, answer, semantic=True):
+        """Cache answer; with semantic=False it is only served to exact matches (no embedding)"""
+        key = normalize_text(prompt)
+        vector = self._pending.pop(key)
+        if vector is None and semantic and self.embed_query is not None:
+            vector = self._embed(prompt)
+        with self._lock:
+            self._answers.set(key, answer)
+            if vector is not None:
+                self._vectors[key] = vector
+
+    def invalidate(self, fingerprint=None):
+        """Drop every entry; with a fingerprint, only if it differs from the current one"""
+        with self._lock:
+            if fingerprint is not None and fingerprint == self.fingerprint:
+                return False
+            if fingerprint is not None:
+                self.fingerprint = fingerprint
+            self._answers.clear()
+            self._vectors.clear()
+            self._pending.clear()
+            self._stats["invalidations"] += 1
+            logger.info("Answer cache invalidated")
+            return True
+
+    def stats(self):
+        with self._lock:
+            hits = self._stats["exact_hits"] + self._stats["semantic_hits"]
+            lookups = self._stats["lookups"]
+            return dict(
+                self._stats,
+                hit_rate=round(hits / lookups, 4) if lookups else 0.0,
+                threshold=self.threshold,
+                fingerprint=self.fingerprint,
+                entries=self._answers.stats(),
+            )
+
+    def _embed(self, prompt):
+        if self.embed_query is None:
+            return None
+        try:
+            vector = np.asarray(self.embed_query(prompt), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Answer cache could not embed prompt: {str(e)}")
+            with self._lock:
+                self._stats["embed_errors"] += 1
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _nearest(self, vector):
+        # Expired answers drop their vectors here, so an expired best match
+        # cannot hide a live one that also clears the threshold
+        self._answers.prune()
+        if not self._vectors:
+            return None
+        keys = list(self._vectors)
+        matrix = np.stack([self._vectors[key] for key in keys])
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.threshold else None
+
+    def _forget_vector(self, key):
+        self._vectors.pop(key, None)
+
+
+class RetrievalCache:
+    """Retrieved document IDs and formatted context per normalized query
+
+    Entries are keyed by the retriever's configuration (k, score threshold,
+    index version) as well as the query, and the cache is emptied when that
+    configuration changes, e.g. after the documents are ingested again. Each
+    entry remembers how long its retrieval took, so hits report the time
+    they saved.
+    """
+
+    def __init__(self, config="", maxsize=512, ttl=1800.0):
+        self.config = config
+        self._entries = TTLCache(maxsize, ttl)
+        self._lock = threading.Lock()
+        self._stats = {"stores": 0, "invalidations": 0, "retrieval_ms_total": 0.0, "saved_ms": 0.0}
+
+    def _key(self, query):
+        return (self.config, normalize_text(query))
+
+    def lookup(self, query):
+        """The cached context string for query, or None"""
+        entry = self._entries.get(self._key(query))
+        if entry is None:
+            return None
+        _, context, retrieval_ms = entry
+        with self._lock:
+            self._stats["saved_ms"] += retrieval_ms
+        return context
+
+    def store(self, query, doc_ids, context, retrieval_ms):
+        self._entries.set(self._key(query), (tuple(doc_ids), context, retrieval_ms))
+        with self._lock:
+            self._stats["stores"] += 1
+            self._stats["retrieval_ms_total"] += retrieval_ms
+
+    def get_or_retrieve(self, query, retrieve):
+        """Cached context for query, or retrieve(query) -> (doc_ids, context) timed and stored"""
+        context = self.lookup(query)
+        if context is not None:
+            return context
+        started = time.perf_counter()
+        doc_ids, context = retrieve(query)
+        self.store(query, doc_ids, context, (time.perf_counter() - started) * 1000)
+        return context
+
+    def invalidate(self, config=None):
+        """Drop every entry; with a config, only if it differs from the current one"""
+        with self._lock:
+            if config is not None and config == self.config:
+                return False
+            if config is not None:
+                self.config = config
+            self._stats["invalidations"] += 1
+        self._entries.clear()
+        logger.info("Retrieval cache invalidated")
+        return True
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        retrieval_total = stats.pop("retrieval_ms_total")
+        return dict(
+            stats,
+            saved_ms=round(stats["saved_ms"], 1),
+            mean_retrieval_ms=round(retrieval_total / stats["stores"], 1) if stats["stores"] else 0.0,
+            config=self.config,
+            entries=self._entries.stats(),
+        )
@@ -2,8 +2,25 @@ from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import logging
 import requests
-import json
+import os
 import time
+from ollama_client import get_client
+from prompt_builder import chunk_text
+from singleflight import SingleFlight, request_key
+from admission import AdmissionRejected, busy_response, ndjson, released_on_error, single_chunk_stream
+from direct_ollama_shared import (
+    MODEL_NAME,
+    admission,
+    build_request,
+    get_busy_message,
+    get_fallback_message,
+    get_welcome_message,
+    prompts,
+    save_exchange,
+    sessions,
+)
+from crisis import is_high_risk
+from warmup import NotReady, Warmup
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -12,92 +29,96 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Ollama API endpoint
-OLLAMA_API = "http://localhost:11434/api/generate"
-OLLAMA_STREAM_API = "http://localhost:11434/api/generate"
-MODEL_NAME = "qwen2.5:latest"
-REQUEST_TIMEOUT = 120  # seconds
+# Shared, connection-pooled Ollama client (pool size, keep-alive and timeouts
+# are configured through OLLAMA_* environment variables, see ollama_client.py)
+ollama = get_client()
 
-# Specialized contexts for different chat types
-GENERAL_CONTEXT = """“You're an India-focused crisis support assistant. Offer empathetic, supportive guidance for anyone in mental distress, prioritize their safety, suggest immediate coping strategies, and recommend professional help. If they mention self‑harm or harming others, gently urge them to seek urgent assistance and share these 24×7 helplines:
--Tele‑Manas: 14416
--Kiran: 1800‑599‑0019
--Aasra: +91‑22‑27546669"
+# Which model answers: "ollama" (default), "gpt2" (the fine-tuned GPT-2 in
+# fine_tuned/, served in-process by local_gpt2.py) or "auto" (Ollama, with
+# the local model taking over while Ollama is down or saturated)
+CHAT_BACKEND = os.environ.get("CHAT_BACKEND", "ollama")
 
-"""
+# Identical in-flight generations (same model, context and history) are
+# sent upstream once and shared between callers
+generations = SingleFlight("ollama")
 
-CRISIS_SUPPORT_CONTEXT = """
-You are a crisis support assistant. You are an India specific mental health assistant. The person you're talking to may be experiencing distress
-or a mental health crisis. Be supportive, empathetic, and focus on safety. Acknowledge their
-feelings, provide immediate coping strategies, and suggest professional resources.
-Always prioritize their safety and well-being. If they express thoughts of harm to themselves
-or others, gently encourage them to seek immediate professional help and provide these crisis lines:
-- Tele-Manas: 14416 (24×7 Government helpline in all Indian languages)
-- Kiran: 1800-599-0019 (National Mental Health Rehab Helpline)
-- Aasra: +91-22-27546669 (24×7 Suicide Prevention)
-"""
+def load_local_model():
+    from local_gpt2 import LocalGPT2
+    return LocalGPT2()
 
-THERAPY_CONTEXT = """
-You are a therapy assistant providing supportive conversation using evidence-based therapeutic
-approaches. You are an India specific mental health assistant. Use techniques like cognitive reframing, validation, open-ended questions, and
-reflective listening. Help the user explore their thoughts and feelings, but make it clear
-you're not a replacement for a licensed therapist. Encourage healthy coping skills and
-self-reflection. Focus on being non-judgmental and supportive. If they express thoughts of harm to themselves
-or others, gently encourage them to seek immediate professional help and provide these crisis lines:
-- Tele-Manas: 14416 (24×7 Government helpline in all Indian languages)
-- Kiran: 1800-599-0019 (National Mental Health Rehab Helpline)
-- Aasra: +91-22-27546669 (24×7 Suicide Prevention)
-"""
+# The local model loads in the background so the server binds immediately
+local_models = Warmup()
+if CHAT_BACKEND in ("gpt2", "auto"):
+    local_models.register("gpt2", load_local_model)
+    local_models.start()
 
-# Session storage
-sessions = {}
+def get_local_model():
+    """The local GPT-2 if this backend uses it and it has loaded, else None"""
+    component = local_models.components.get("gpt2")
+    if component is None:
+        return None
+    try:
+        return component.get()
+    except NotReady as e:
+        logger.warning(f"Local model not available: {str(e)}")
+        return None
+
+def build_local_prompt(message, session_id=None):
+    """Plain User/Assistant transcript for the fine-tuned GPT-2 (it has no chat template)"""
+    history = sessions.get(session_id) if session_id else []
+    lines = []
+    for exchange in history[-3:]:
+        lines.append(f"User: {exchange['user']}")
+        lines.append(f"Assistant: {exchange['assistant']}")
+    lines.append(f"User: {message}")
+    lines.append("Assistant:")
+    return "\n".join(lines)
+
+# The model would otherwise go on to write the user's next turn
+LOCAL_STOP = ("\nUser:",)
+
+def get_local_response(model, message, session_id=None):
+    """Get a response from the in-process GPT-2"""
+    start_time = time.time()
+    response = model.generate(build_local_prompt(message, session_id), stop=LOCAL_STOP).strip()
+    logger.info(f"Received response from local model in {time.time() - start_time:.2f}s")
+    return response
+
+def stream_local_response(sequence, message, session_id=None):
+    """Stream a submitted local-model sequence in the same format as stream_ollama_response"""
+    full_response = ""
+    try:
+        # Closing the response closes stream(), which cancels the sequence
+        for token in sequence.stream():
+            if not full_response:
+                token = token.lstrip()
+            full_response += token
+            yield ndjson({"chunk": token, "done": False})
+        yield ndjson({"chunk": "", "done": True, "full_response": full_response})
+        save_exchange(session_id, message, full_response)
+    except Exception as e:
+        logger.error(f"Error in local streaming: {str(e)}")
+        yield ndjson({"chunk": f"Error: {str(e)}", "done": True})
 
 def get_ollama_response(message, chat_type="GENERAL", session_id=None):
     """Get a response directly from Ollama API with specialized context based on chat type"""
     try:
-        # Select the appropriate context based on chat type
-        if chat_type == "CRISIS_SUPPORT":
-            context = CRISIS_SUPPORT_CONTEXT
-        elif chat_type == "THERAPY":
-            context = THERAPY_CONTEXT
-        else:
-            # Default to general context
-            context = GENERAL_CONTEXT
-            
         logger.info(f"Using context for chat type: {chat_type}")
         
-        # Build prompt with session history if available
-        prompt = context
-        
-        # Add conversation history for context
-        if session_id and session_id in sessions:
-            history = sessions[session_id]
-            for exchange in history[-3:]:  # Only use last 3 exchanges for context
-                prompt += f"\nUser: {exchange['user']}\nAssistant: {exchange['assistant']}"
-        
-        # Add current message
-        prompt += f"\nUser: {message}\nAssistant:"
-        
         # Prepare request to Ollama
-        payload = {
-            "model": MODEL_NAME,
-            "prompt": prompt,
-            "stream": False,
-            "temperature": 0.7,
-            "max_tokens": 500
-        }
+        endpoint, payload = build_request(message, chat_type, session_id)
         
         # Log the request
         logger.info(f"Sending request to Ollama with model {MODEL_NAME} for chat type {chat_type}")
         
         # Send request to Ollama
         start_time = time.time()
-        response = requests.post(OLLAMA_API, json=payload, timeout=REQUEST_TIMEOUT)
-        response.raise_for_status()  # Raise exception for HTTP errors
+        response_data = generations.do(request_key(endpoint, payload),
+                                       lambda: ollama.generate(payload, endpoint))
+        prompts.record(session_id, chat_type, response_data)
         
         # Parse response
-        response_data = response.json()
-        generated_text = response_data.get("response", "")
+        generated_text = chunk_text(response_data)
         
         # Log timing
         elapsed = time.time() - start_time
@@ -120,92 +141,40 @@ def get_ollama_response(message, chat_type="GENERAL", session_id=None):
 def stream_ollama_response(message, chat_type="GENERAL", session_id=None):
     """Stream a response from Ollama API with specialized context based on chat type"""
     try:
-        # Select the appropriate context based on chat type
-        if chat_type == "CRISIS_SUPPORT":
-            context = CRISIS_SUPPORT_CONTEXT
-        elif chat_type == "THERAPY":
-            context = THERAPY_CONTEXT
-        else:
-            # Default to general context
-            context = GENERAL_CONTEXT
-            
         logger.info(f"Using context for chat type: {chat_type} (streaming)")
         
-        # Build prompt with session history if available
-        prompt = context
-        
-        # Add conversation history for context
-        if session_id and session_id in sessions:
-            history = sessions[session_id]
-            for exchange in history[-3:]:  # Only use last 3 exchanges for context
-                prompt += f"\nUser: {exchange['user']}\nAssistant: {exchange['assistant']}"
-        
-        # Add current message
-        prompt += f"\nUser: {message}\nAssistant:"
-        
         # Prepare request to Ollama
-        payload = {
-            "model": MODEL_NAME,
-            "prompt": prompt,
-            "stream": True,
-            "temperature": 0.7,
-            "max_tokens": 500
-        }
+        endpoint, payload = build_request(message, chat_type, session_id, stream=True)
         
         # Log the request
         logger.info(f"Sending streaming request to Ollama with model {MODEL_NAME} for chat type {chat_type}")
         
         # Send request to Ollama with streaming
-        response = requests.post(OLLAMA_STREAM_API, json=payload, stream=True, timeout=REQUEST_TIMEOUT)
-        response.raise_for_status()
+        chunks = generations.stream(request_key(endpoint, payload),
+                                    lambda: ollama.stream_generate(payload, endpoint))
         
         # Track the full response for session history
         full_response = ""
         
         # Return streaming response
-        for line in response.iter_lines():
-            if line:
-                # Parse the JSON line
-                try:
-                    chunk = json.loads(line)
-                    token = chunk.get("response", "")
-                    full_response += token
-                    
-                    # Format as JSON for the client
-                    yield json.dumps({"chunk": token, "done": False}) + "\n"
-                    
-                except json.JSONDecodeError:
-                    logger.warning(f"Failed to decode JSON: {line}")
+        for chunk in chunks:
+            if chunk.get("done"):
+                prompts.record(session_id, chat_type, chunk)
+            token = chunk_text(chunk)
+            full_response += token
+            
+            # Format as JSON for the client
+            yield ndjson({"chunk": token, "done": False})
         
         # Send the final done message
-        yield json.dumps({"chunk": "", "done": True, "full_response": full_response}) + "\n"
+        yield ndjson({"chunk": "", "done": True, "full_response": full_response})
         
         # Save to session history
-        if session_id:
-            if session_id not in sessions:
-                sessions[session_id] = []
-                
-            sessions[session_id].append({
-                "user": message,
-                "assistant": full_response
-            })
-            
-            # Limit session history size
-            if len(sessions[session_id]) > 10:
-                sessions[session_id] = sessions[session_id][-10:]
+        save_exchange(session_id, message, full_response)
         
     except Exception as e:
         logger.error(f"Error in streaming: {str(e)}")
-        yield json.dumps({"chunk": f"Error: {str(e)}", "done": True}) + "\n"
-
-# Define welcome messages for different chat types
-def get_welcome_message(chat_type="GENERAL"):
-    if chat_type == "CRISIS_SUPPORT":
-        return "I understand you've selected crisis support. I'm here to help during difficult moments. While I'm not a replacement for professional help in emergencies, I can listen and provide support. How are you feeling right now, and how can I help you today?"
-    elif chat_type == "THERAPY":
-        return "Welcome to your therapy session space. I'm here to provide a supportive conversation using evidence-based approaches. Remember, I'm not a replacement for a licensed therapist but can help you explore thoughts and feelings. What brings you to therapy today?"
-    else:
-        return "Hello! I'm your mental health assistant. I'm here to provide general support and information about mental health topics. How can I help you today?"
+        yield ndjson({"chunk": f"Error: {str(e)}", "done": True})
 
 @app.route('/chat', methods=['POST'])
 def chat():
@@ -226,32 +195,34 @@ def chat():
             response = get_welcome_message(chat_type)
             return jsonify({"response": response})
         
-        # Check if Ollama is available
+        # Check if Ollama is available (cached circuit-breaker state, no probe)
         try:
-            # Quick check if Ollama is running
-            version_check = requests.get("http://localhost:11434/api/version", timeout=2)
-            version_check.raise_for_status()
-            logger.info(f"Ollama is available, version: {version_check.json().get('version')}")
+            if CHAT_BACKEND == "gpt2":
+                raise requests.exceptions.ConnectionError("local backend selected")
+            if not ollama.is_available():
+                raise requests.exceptions.ConnectionError(f"circuit {ollama.breaker.state}")
             
-            # Get response from Ollama
-            response = get_ollama_response(message, chat_type, session_id)
+            # Get response from Ollama once admitted
+            with admission.acquire(chat_type, crisis=is_high_risk(message)):
+                response = get_ollama_response(message, chat_type, session_id)
             
             # Store conversation in session history
-            if session_id not in sessions:
-                sessions[session_id] = []
-                
-            sessions[session_id].append({
-                "user": message,
-                "assistant": response
-            })
-            
-            # Limit session history size
-            if len(sessions[session_id]) > 10:
-                sessions[session_id] = sessions[session_id][-10:]
+            save_exchange(session_id, message, response)
                 
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"Ollama is not available: {str(e)}")
-            response = f"Hello! You said: '{message}'. I'm running in backup mode because the AI service is currently unavailable."
+        except (AdmissionRejected, requests.exceptions.RequestException) as e:
+            model = get_local_model()
+            if model is not None:
+                logger.info(f"Answering with the local model: {str(e)}")
+                try:
+                    response = get_local_response(model, message, session_id)
+                except AdmissionRejected as busy:
+                    return busy_response(busy, get_busy_message(busy.retry_after))
+                save_exchange(session_id, message, response)
+            elif isinstance(e, AdmissionRejected):
+                return busy_response(e, get_busy_message(e.retry_after))
+            else:
+                logger.warning(f"Ollama is not available: {str(e)}")
+                response = get_fallback_message(message)
             
         return jsonify({"response": response})
         
@@ -277,36 +248,44 @@ def chat_stream():
             welcome = get_welcome_message(chat_type)
             
             # For welcome messages, we'll send a single chunk with done=true
-            def welcome_generator():
-                yield json.dumps({"chunk": welcome, "done": False}) + "\n"
-                yield json.dumps({"chunk": "", "done": True, "full_response": welcome}) + "\n"
-                
-            return Response(stream_with_context(welcome_generator()), 
+            return Response(stream_with_context(single_chunk_stream(welcome)),
                           content_type='application/json')
         
-        # Check if Ollama is available
+        # Check if Ollama is available (cached circuit-breaker state, no probe)
         try:
-            # Quick check if Ollama is running
-            version_check = requests.get("http://localhost:11434/api/version", timeout=2)
-            version_check.raise_for_status()
-            logger.info(f"Ollama is available for streaming, version: {version_check.json().get('version')}")
+            if CHAT_BACKEND == "gpt2":
+                raise requests.exceptions.ConnectionError("local backend selected")
+            if not ollama.is_available():
+                raise requests.exceptions.ConnectionError(f"circuit {ollama.breaker.state}")
             
-            # Stream response from Ollama
-            return Response(
-                stream_with_context(stream_ollama_response(message, chat_type, session_id)),
-                content_type='application/json'
-            )
+            # The slot is held until the stream is closed, not just until
+            # the first chunk is sent
+            ticket = admission.acquire(chat_type, crisis=is_high_risk(message))
+            with released_on_error(ticket):
+                response = Response(
+                    stream_with_context(stream_ollama_response(message, chat_type, session_id)),
+                    content_type='application/json'
+                )
+                response.call_on_close(ticket.release)
+            return response
                 
-        except requests.exceptions.RequestException as e:
+        except (AdmissionRejected, requests.exceptions.RequestException) as e:
+            model = get_local_model()
+            if model is not None:
+                logger.info(f"Streaming from the local model: {str(e)}")
+                try:
+                    # Submitted before the response starts so a full queue gets a 503
+                    sequence = model.submit(build_local_prompt(message, session_id), stop=LOCAL_STOP)
+                except AdmissionRejected as busy:
+                    return busy_response(busy, get_busy_message(busy.retry_after))
+                return Response(stream_with_context(stream_local_response(sequence, message, session_id)),
+                                content_type='application/json')
+            if isinstance(e, AdmissionRejected):
+                return busy_response(e, get_busy_message(e.retry_after))
             logger.warning(f"Ollama is not available for streaming: {str(e)}")
             
             # Return a fallback response as a stream
-            def fallback_generator():
-                fallback = f"Hello! You said: '{message}'. I'm running in backup mode because the AI service is currently unavailable."
-                yield json.dumps({"chunk": fallback, "done": False}) + "\n"
-                yield json.dumps({"chunk": "", "done": True, "full_response": fallback}) + "\n"
-                
-            return Response(stream_with_context(fallback_generator()), 
+            return Response(stream_with_context(single_chunk_stream(get_fallback_message(message))),
                           content_type='application/json')
             
     except Exception as e:
@@ -315,30 +294,39 @@ def chat_stream():
         # Return error as a stream
         def error_generator():
             error_msg = f"Error: {str(e)}"
-            yield json.dumps({"chunk": error_msg, "done": True}) + "\n"
+            yield ndjson({"chunk": error_msg, "done": True})
             
         return Response(stream_with_context(error_generator()), 
                       content_type='application/json')
 
+def local_model_status():
+    component = local_models.components.get("gpt2")
+    if component is None:
+        return None
+    model = component.peek()
+    return dict(component.status(), **model.stats()) if model is not None else component.status()
+
 @app.route('/health', methods=['GET'])
 def health_check():
     logger.info("Health check called")
     
-    # Check Ollama availability
-    ollama_status = "unavailable"
-    try:
-        response = requests.get("http://localhost:11434/api/version", timeout=1)
-        if response.status_code == 200:
-            ollama_status = "available"
-    except:
-        pass
+    # Availability comes from the background-refreshed circuit breaker
+    ollama_status = "available" if ollama.is_available() else "unavailable"
         
     return jsonify({
         "status": "ok", 
         "server": "direct_ollama",
-        "ollama_status": ollama_status
+        "ollama_status": ollama_status,
+        "ollama_client": ollama.stats(),
+        "sessions": sessions.stats(),
+        "prompts": prompts.stats(),
+        "coalescing": generations.stats(),
+        "admission": admission.stats(),
+        "backend": CHAT_BACKEND,
+        "local_model": local_model_status()
     })
 
 if __name__ == "__main__":
     logger.info("Starting direct Ollama server on port 5002...")
+    ollama.start_monitor()
     app.run(host='0.0.0.0', port=5002, debug=True) 
\ No newline at end of file
@@ -0,0 +1,210 @@
+import asyncio
+import contextlib
+import logging
+import os
+import time
+
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from admission import AdmissionRejected, busy_response, ndjson, single_chunk_stream
+from crisis import is_high_risk
+from direct_ollama_shared import (
+    MODEL_NAME,
+    admission,
+    build_request,
+    get_busy_message,
+    get_fallback_message,
+    get_welcome_message,
+    prompts,
+    save_exchange,
+    sessions,
+)
+from ollama_client import ASYNC_REQUEST_ERRORS, AsyncOllamaClient
+from prompt_builder import chunk_text
+from singleflight import AsyncSingleFlight, request_key
+
+# Run with:  uvicorn direct_ollama_async:app --host 0.0.0.0 --port 5002
+
+logger = logging.getLogger(__name__)
+
+# Every open stream holds one upstream connection, so this is the ceiling on
+# concurrent generations forwarded to Ollama (not on accepted clients).
+ASYNC_POOL_SIZE = int(os.environ.get("OLLAMA_ASYNC_POOL_SIZE", "256"))
+
+ollama = AsyncOllamaClient(pool_size=ASYNC_POOL_SIZE)
+generations = AsyncSingleFlight("ollama")
+
+
+async def store_call(fn, *args):
+    """Run fn (which reads or writes session history) off the event loop if the store persists"""
+    if sessions.backend.persistent:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+
+def shed_response(e):
+    body, status, headers = busy_response(e, get_busy_message(e.retry_after))
+    return JSONResponse(body, status_code=status, headers=headers)
+
+
+async def released_after(body, ticket):
+    try:
+        async for item in body:
+            yield item
+    finally:
+        ticket.release()
+
+
+async def read_request(request):
+    data = await request.json()
+    message = data.get('message', '')
+    chat_type = data.get('chat_type', 'GENERAL')
+    session_id = data.get('session_id', 'default-session')
+    return message, chat_type, session_id
+
+
+async def get_ollama_response(message, chat_type="GENERAL", session_id=None):
+    """Async version of direct_ollama.get_ollama_response"""
+    try:
+        endpoint, payload = await store_call(build_request, message, chat_type, session_id)
+        start_time = time.time()
+        response_data = await generations.do(request_key(endpoint, payload),
+                                             lambda: ollama.generate(payload, endpoint))
+        prompts.record(session_id, chat_type, response_data)
+        generated_text = chunk_text(response_data)
+        logger.info(f"Received response from Ollama in {time.time() - start_time:.2f}s")
+
+        if generated_text.strip().startswith("I'm"):
+            generated_text = generated_text.strip()
+        return generated_text
+
+    except ASYNC_REQUEST_ERRORS as e:
+        logger.error(f"Error connecting to Ollama API: {str(e)}")
+        return f"I'm sorry, I couldn't process your request. There was an error connecting to the AI service: {str(e)}"
+
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        return f"I'm sorry, I couldn't process your request due to an error: {str(e)}"
+
+
+async def stream_ollama_response(message, chat_type="GENERAL", session_id=None):
+    """Async version of direct_ollama.stream_ollama_response"""
+    try:
+        endpoint, payload = await store_call(build_request, message, chat_type, session_id, True)
+        logger.info(f"Sending streaming request to Ollama with model {MODEL_NAME} for chat type {chat_type}")
+
+        full_response = ""
+        chunks = generations.stream(request_key(endpoint, payload),
+                                    lambda: ollama.stream_generate(payload, endpoint))
+        async for chunk in chunks:
+            if chunk.get("done"):
+                prompts.record(session_id, chat_type, chunk)
+            token = chunk_text(chunk)
+            full_response += token
+            yield ndjson({"chunk": token, "done": False})
+
+        yield ndjson({"chunk": "", "done": True, "full_response": full_response})
+        await store_call(save_exchange, session_id, message, full_response)
+
+    except Exception as e:
+        logger.error(f"Error in streaming: {str(e)}")
+        yield ndjson({"chunk": f"Error: {str(e)}", "done": True})
+
+
+async def chat(request):
+    try:
+        message, chat_type, session_id = await read_request(request)
+        logger.info(f"Message: {message}, Type: {chat_type}, Session: {session_id}")
+
+        if not message or message.strip() == "":
+            return JSONResponse({"response": get_welcome_message(chat_type)})
+
+        if not ollama.is_available():
+            logger.warning(f"Ollama is not available: circuit {ollama.breaker.state}")
+            return JSONResponse({"response": get_fallback_message(message)})
+
+        with await admission.acquire_async(chat_type, crisis=is_high_risk(message)):
+            response = await get_ollama_response(message, chat_type, session_id)
+        await store_call(save_exchange, session_id, message, response)
+        return JSONResponse({"response": response})
+
+    except AdmissionRejected as e:
+        return shed_response(e)
+
+    except Exception as e:
+        logger.error(f"Error: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def chat_stream(request):
+    ticket = None
+    try:
+        message, chat_type, session_id = await read_request(request)
+        logger.info(f"Streaming Message: {message}, Type: {chat_type}, Session: {session_id}")
+
+        if not message or message.strip() == "":
+            body = single_chunk_stream(get_welcome_message(chat_type))
+        elif not ollama.is_available():
+            logger.warning(f"Ollama is not available for streaming: circuit {ollama.breaker.state}")
+            body = single_chunk_stream(get_fallback_message(message))
+        else:
+            ticket = await admission.acquire_async(chat_type, crisis=is_high_risk(message))
+            body = released_after(stream_ollama_response(message, chat_type, session_id), ticket)
+
+    except AdmissionRejected as e:
+        return shed_response(e)
+
+    except Exception as e:
+        logger.error(f"Error in streaming: {str(e)}")
+
+        async def error_stream(error_msg=f"Error: {str(e)}"):
+            yield ndjson({"chunk": error_msg, "done": True})
+
+        body = error_stream()
+
+    # released_after frees the slot when the body finishes or is closed; the
+    # background task covers a body that was never iterated (release is idempotent)
+    background = BackgroundTask(ticket.release) if ticket is not None else None
+    return StreamingResponse(body, media_type='application/json', background=background)
+
+
+async def health_check(request):
+    return JSONResponse({
+        "status": "ok",
+        "server": "direct_ollama_async",
+        "ollama_status": "available" if ollama.is_available() else "unavailable",
+        "ollama_client": ollama.stats(),
+        "sessions": sessions.stats(),
+        "prompts": prompts.stats(),
+        "coalescing": generations.stats(),
+        "admission": admission.stats()
+    })
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await ollama.start()
+    yield
+    await ollama.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/chat', chat, methods=['POST']),
+        Route('/chat/stream', chat_stream, methods=['POST']),
+        Route('/health', health_check, methods=['GET']),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
+
+if __name__ == "__main__":
+    import uvicorn
+
+    logger.info("Starting async direct Ollama server on port 5002...")
+    uvicorn.run(app, host='0.0.0.0', port=5002)
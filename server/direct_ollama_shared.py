@@ -0,0 +1,94 @@
+from admission import AdmissionController
+from prompt_builder import PromptBuilder
+from session_store import create_store
+
+# Prompts, session history and admission shared by direct_ollama (Flask) and
+# direct_ollama_async (ASGI), so both serving modes keep the same
+# request/response contract. Importing this module builds no app and no
+# Ollama client, and starts no threads.
+MODEL_NAME = "qwen2.5:latest"
+
+# Specialized contexts for different chat types
+GENERAL_CONTEXT = """“You're an India-focused crisis support assistant. Offer empathetic, supportive guidance for anyone in mental distress, prioritize their safety, suggest immediate coping strategies, and recommend professional help. If they mention self‑harm or harming others, gently urge them to seek urgent assistance and share these 24×7 helplines:
+-Tele‑Manas: 14416
+-Kiran: 1800‑599‑0019
+-Aasra: +91‑22‑27546669"
+
+"""
+
+CRISIS_SUPPORT_CONTEXT = """
+You are a crisis support assistant. You are an India specific mental health assistant. The person you're talking to may be experiencing distress
+or a mental health crisis. Be supportive, empathetic, and focus on safety. Acknowledge their
+feelings, provide immediate coping strategies, and suggest professional resources.
+Always prioritize their safety and well-being. If they express thoughts of harm to themselves
+or others, gently encourage them to seek immediate professional help and provide these crisis lines:
+- Tele-Manas: 14416 (24×7 Government helpline in all Indian languages)
+- Kiran: 1800-599-0019 (National Mental Health Rehab Helpline)
+- Aasra: +91-22-27546669 (24×7 Suicide Prevention)
+"""
+
+THERAPY_CONTEXT = """
+You are a therapy assistant providing supportive conversation using evidence-based therapeutic
+approaches. You are an India specific mental health assistant. Use techniques like cognitive reframing, validation, open-ended questions, and
+reflective listening. Help the user explore their thoughts and feelings, but make it clear
+you're not a replacement for a licensed therapist. Encourage healthy coping skills and
+self-reflection. Focus on being non-judgmental and supportive. If they express thoughts of harm to themselves
+or others, gently encourage them to seek immediate professional help and provide these crisis lines:
+- Tele-Manas: 14416 (24×7 Government helpline in all Indian languages)
+- Kiran: 1800-599-0019 (National Mental Health Rehab Helpline)
+- Aasra: +91-22-27546669 (24×7 Suicide Prevention)
+"""
+
+# Concurrency limits per chat type in front of Ollama; CRISIS_SUPPORT
+# sessions and high-risk messages skip the queue and get reserved slots
+# (see admission.py)
+admission = AdmissionController()
+
+# Session storage: bounded in memory, optionally persisted (see session_store.py)
+sessions = create_store()
+
+# Prompt construction keeps each chat type's context as a stable prefix so
+# Ollama can reuse its KV cache (mode set by OLLAMA_PROMPT_MODE)
+prompts = PromptBuilder(
+    MODEL_NAME,
+    {
+        "GENERAL": GENERAL_CONTEXT,
+        "CRISIS_SUPPORT": CRISIS_SUPPORT_CONTEXT,
+        "THERAPY": THERAPY_CONTEXT,
+    },
+    history_turns=3,  # Only use last 3 exchanges for context
+    options={"temperature": 0.7, "num_predict": 500},
+)
+
+def get_chat_context(chat_type="GENERAL"):
+    """Select the specialized system context for a chat type"""
+    return prompts.system_context(chat_type)
+
+def build_request(message, chat_type="GENERAL", session_id=None, stream=False):
+    """Build the Ollama (endpoint, payload) for a message and its session history"""
+    history = sessions.get(session_id) if session_id else []
+    return prompts.build(message, chat_type, history, session_id, stream)
+
+def save_exchange(session_id, message, response):
+    """Store an exchange in the session history (the store caps its length)"""
+    sessions.append(session_id, {
+        "user": message,
+        "assistant": response
+    })
+
+# Define welcome messages for different chat types
+def get_welcome_message(chat_type="GENERAL"):
+    if chat_type == "CRISIS_SUPPORT":
+        return "I understand you've selected crisis support. I'm here to help during difficult moments. While I'm not a replacement for professional help in emergencies, I can listen and provide support. How are you feeling right now, and how can I help you today?"
+    elif chat_type == "THERAPY":
+        return "Welcome to your therapy session space. I'm here to provide a supportive conversation using evidence-based approaches. Remember, I'm not a replacement for a licensed therapist but can help you explore thoughts and feelings. What brings you to therapy today?"
+    else:
+        return "Hello! I'm your mental health assistant. I'm here to provide general support and information about mental health topics. How can I help you today?"
+
+def get_fallback_message(message):
+    """Reply used when the AI service is unavailable"""
+    return f"Hello! You said: '{message}'. I'm running in backup mode because the AI service is currently unavailable."
+
+def get_busy_message(retry_after):
+    """Reply used when a request is shed by admission control"""
+    return f"I'm helping a lot of people right now. Please try again in {retry_after} seconds."
@@ -0,0 +1,305 @@
+import hashlib
+import itertools
+import json
+import logging
+import os
+import re
+import struct
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within a process
+    fcntl = None
+
+try:
+    from langchain_core.embeddings import Embeddings
+except ImportError:
+    Embeddings = object
+
+logger = logging.getLogger(__name__)
+
+# Set EMBEDDING_CACHE_DIR to "" to disable the cache
+EMBEDDING_CACHE_DIR = os.environ.get(
+    "EMBEDDING_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "embedding_cache"))
+EMBEDDING_CACHE_MAX_BYTES = int(float(os.environ.get("EMBEDDING_CACHE_MAX_MB", "512")) * 1024 * 1024)
+
+# Index records: 16-byte key digest, row number in the vectors file
+_RECORD = struct.Struct("<16sI")
+# Compaction keeps this fraction of max_bytes, so it doesn't run on every append
+_COMPACT_TO = 0.75
+
+
+def embedding_model_name(embeddings):
+    """Model identifier of a LangChain embeddings object (part of every cache key)"""
+    for attribute in ("model", "model_name"):
+        name = getattr(embeddings, attribute, None)
+        if isinstance(name, str) and name:
+            return name
+    return type(embeddings).__name__
+
+
+class EmbeddingStore:
+    """Vectors for one embedding model, shared by every process on the host
+
+    Rows live in a float32 file that readers memory-map, so lookups copy
+    nothing until the caller converts a row; an append-only index file maps
+    key digests to rows. Writers append vectors before their index records,
+    under a file lock, so a reader never sees a record whose row is not
+    written yet. When the vectors outgrow max_bytes the store is compacted
+    into a new generation keeping the most recently used rows; other
+    processes notice the new generation in meta.json and reopen.
+    """
+
+    def __init__(self, directory, max_bytes=EMBEDDING_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.dim = None
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.compactions = 0
+        self._meta_stamp = None
+        self._index = {}  # key digest -> row
+        self._index_offset = 0
+        self._vectors = None  # read-only memmap over the rows seen so far
+        self._last_used = {}  # key digest -> tick, for compaction in this process
+        self._tick = itertools.count()
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.directory, "meta.json")
+
+    def _paths(self, generation):
+        return (os.path.join(self.directory, f"vectors-{generation}.f32"),
+                os.path.join(self.directory, f"index-{generation}.bin"))
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, "lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Pick up a new generation and index records appended by other processes"""
+        try:
+            stat = os.stat(self._meta_path)
+        except FileNotFoundError:
+            return
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp != self._meta_stamp:
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+            self._meta_stamp = stamp
+            if meta["generation"] != self.generation:
+                self.generation, self.dim = meta["generation"], meta["dim"]
+                self._index.clear()
+                self._index_offset = 0
+                self._vectors = None
+
+        index_path = self._paths(self.generation)[1]
+        try:
+            size = os.path.getsize(index_path)
+        except FileNotFoundError:
+            return
+        if size > self._index_offset:
+            with open(index_path, "rb") as f:
+                f.seek(self._index_offset)
+                data = f.read(size - self._index_offset)
+            complete = len(data) - len(data) % _RECORD.size  # skip a record still being written
+            for key, row in _RECORD.iter_unpack(data[:complete]):
+                self._index[key] = row
+            self._index_offset += complete
+
+    def _rows(self, needed):
+        """The memmap, remapped if it does not cover row index needed yet"""
+        if self._vectors is None or len(self._vectors) <= needed:
+            vectors_path = self._paths(self.generation)[0]
+            rows = os.path.getsize(vectors_path) // (self.dim * 4)
+            self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return self._vectors
+
+    def get_many(self, keys):
+        """{key: read-only float32 row} for the keys that are cached"""
+        with self._lock:
+            self._refresh()
+            rows = {key: self._index[key] for key in keys if key in self._index}
+            self.hits += len(rows)
+            self.misses += len(keys) - len(rows)
+            if not rows:
+                return {}
+            vectors = self._rows(max(rows.values()))
+            tick = next(self._tick)
+            found = {}
+            for key, row in rows.items():
+                self._last_used[key] = tick
+                found[key] = vectors[row]
+            return found
+
+    def put_many(self, keys, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(keys):
+            return
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self.generation is None:
+                self.generation, self.dim = 0, vectors.shape[1]
+                self._write_meta()
+            if vectors.shape[1] != self.dim:
+                logger.warning(f"Not caching {vectors.shape[1]}-d vectors in a {self.dim}-d store")
+                return
+            fresh = [i for i, key in enumerate(keys) if key not in self._index]
+            if not fresh:
+                return
+            vectors_path, index_path = self._paths(self.generation)
+            row_bytes = self.dim * 4
+            with open(vectors_path, "ab") as f:
+                size = f.tell()
+                if size % row_bytes:  # a writer died mid-row; drop the partial row
+                    size -= size % row_bytes
+                    f.truncate(size)
+                first_row = size // row_bytes
+                f.write(vectors[fresh].tobytes())
+            records = b"".join(_RECORD.pack(keys[i], first_row + n) for n, i in enumerate(fresh))
+            with open(index_path, "ab") as f:
+                f.write(records)
+            tick = next(self._tick)
+            for n, i in enumerate(fresh):
+                self._index[keys[i]] = first_row + n
+                self._last_used[keys[i]] = tick
+            self._index_offset += len(records)
+            if self.max_bytes and (first_row + len(fresh)) * self.dim * 4 > self.max_bytes:
+                self._compact()
+
+    def _write_meta(self):
+        with open(self._meta_path + ".tmp", "w") as f:
+            json.dump({"generation": self.generation, "dim": self.dim}, f)
+        os.replace(self._meta_path + ".tmp", self._meta_path)
+        stat = os.stat(self._meta_path)
+        self._meta_stamp = (stat.st_ino, stat.st_mtime_ns)
+
+    def _compact(self):
+        """Rewrite the most recently used rows into a new generation (caller holds both locks)"""
+        keep_rows = int(self.max_bytes * _COMPACT_TO) // (self.dim * 4)
+        # Most recently used here first, then the most recently appended
+        ranked = sorted(self._index.items(),
+                        key=lambda item: (self._last_used.get(item[0], -1), item[1]), reverse=True)
+        kept = ranked[:keep_rows]
+        vectors = self._rows(max(row for _, row in kept)) if kept else None
+
+        old_paths = self._paths(self.generation)
+        generation = self.generation + 1
+        vectors_path, index_path = self._paths(generation)
+        with open(vectors_path, "wb") as f:
+            if kept:
+                f.write(np.ascontiguousarray(vectors[[row for _, row in kept]]).tobytes())
+        with open(index_path, "wb") as f:
+            f.write(b"".join(_RECORD.pack(key, row) for row, (key, _) in enumerate(kept)))
+
+        self.generation = generation
+        self._write_meta()
+        self._index = {key: row for row, (key, _) in enumerate(kept)}
+        self._index_offset = len(kept) * _RECORD.size
+        self._last_used = {key: self._last_used[key] for key, _ in kept if key in self._last_used}
+        self._vectors = None
+        self.compactions += 1
+        for path in old_paths:
+            try:
+                os.remove(path)  # other processes keep their open mappings
+            except OSError:
+                pass
+        logger.info(f"Compacted embedding cache {self.directory} to {len(kept)} vectors")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._index),
+                "dim": self.dim,
+                "bytes": len(self._index) * (self.dim or 0) * 4,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "compactions": self.compactions,
+                "generation": self.generation,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """LangChain embeddings wrapper that only computes vectors the store has not seen
+
+    Keys are digests of (model name, document or query, text), so models
+    never share vectors and a query is cached apart from the same text
+    embedded as a document (some models embed the two differently).
+    """
+
+    def __init__(self, embeddings, store=None, model_name=None):
+        self.embeddings = embeddings
+        self.model_name = model_name or embedding_model_name(embeddings)
+        self.store = store or get_store(self.model_name)
+
+    def _key(self, kind, text):
+        return hashlib.blake2b(f"{self.model_name}\x00{kind}\x00{text}".encode("utf-8"),
+                               digest_size=16).digest()
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        keys = [self._key("document", text) for text in texts]
+        found = self.store.get_many(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)  # embed repeated texts once
+        computed = {}
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing, vectors))
+            self.store.put_many(list(computed), list(computed.values()))
+        return [found[key].tolist() if key in found else list(computed[key]) for key in keys]
+
+    def embed_query(self, text):
+        key = self._key("query", text)
+        found = self.store.get_many([key])
+        if key in found:
+            return found[key].tolist()
+        vector = self.embeddings.embed_query(text)
+        self.store.put_many([key], [vector])
+        return list(vector)
+
+    def stats(self):
+        return dict(self.store.stats(), model=self.model_name)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(model_name, directory=None, max_bytes=EMBEDDING_CACHE_MAX_BYTES):
+    """The process-wide store for a model under directory (default EMBEDDING_CACHE_DIR)"""
+    directory = directory or EMBEDDING_CACHE_DIR
+    slug = re.sub(r"[^\w.-]+", "_", model_name)
+    path = os.path.join(directory, f"{slug}-{hashlib.sha1(model_name.encode()).hexdigest()[:8]}")
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = EmbeddingStore(path, max_bytes)
+        return _stores[path]
+
+
+def cached_embeddings(embeddings, model_name=None):
+    """Wrap a LangChain embeddings object in the shared cache (unchanged if the cache is disabled)"""
+    if not EMBEDDING_CACHE_DIR or isinstance(embeddings, CachedEmbeddings):
+        return embeddings
+    return CachedEmbeddings(embeddings, model_name=model_name)
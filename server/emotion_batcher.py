@@ -0,0 +1,184 @@
+import bisect
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from cache import TTLCache, normalize_text
+
+logger = logging.getLogger(__name__)
+
+EMOTION_MAX_BATCH = int(os.environ.get("EMOTION_MAX_BATCH", "16"))
+EMOTION_MAX_WAIT_MS = float(os.environ.get("EMOTION_MAX_WAIT_MS", "10"))
+EMOTION_CACHE_SIZE = int(os.environ.get("EMOTION_CACHE_SIZE", "2048"))
+EMOTION_CACHE_TTL = float(os.environ.get("EMOTION_CACHE_TTL", "3600"))
+
+# A bucket is split when padding would make up more than this share of it
+MAX_PADDING = 0.25
+WAIT_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+
+class Histogram:
+    """Counts per upper bound; the last bucket catches everything above"""
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += 1
+        self.sum += value
+
+    def snapshot(self):
+        labels = [f"<={bound}" for bound in self.bounds] + [f">{self.bounds[-1]}"]
+        return {
+            "buckets": {label: count for label, count in zip(labels, self.counts) if count},
+            "count": self.total,
+            "mean": round(self.sum / self.total, 3) if self.total else 0.0,
+        }
+
+
+def top_label(scores):
+    return max(scores, key=lambda x: x["score"])["label"]
+
+
+class EmotionBatcher:
+    """Runs concurrent emotion requests through the classifier in batches
+
+    Callers enqueue a message and wait on a future. One worker thread takes
+    the first waiting request, then keeps collecting until max_batch_size
+    requests are in hand or max_wait_ms has passed since the first arrived.
+    The batch is sorted by token length and cut into buckets with little
+    padding, and each bucket is one forward pass. Identical messages (after
+    normalize_text) share a result, both while in flight and afterwards
+    through a TTL cache.
+    """
+
+    def __init__(self, pipeline, max_batch_size=EMOTION_MAX_BATCH, max_wait_ms=EMOTION_MAX_WAIT_MS,
+                 cache_size=EMOTION_CACHE_SIZE, cache_ttl=EMOTION_CACHE_TTL):
+        self.pipeline = pipeline
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._queue = queue.Queue()
+        self._inflight = {}  # normalized text -> Future
+        self._lock = threading.Lock()
+        self._batch_sizes = Histogram(range(1, max_batch_size + 1))
+        self._queue_wait = Histogram(WAIT_BUCKETS_MS)
+        self._forward_ms = Histogram(WAIT_BUCKETS_MS)
+        self._stats = {"requests": 0, "coalesced": 0, "batches": 0, "forward_passes": 0, "errors": 0}
+        self._worker = threading.Thread(target=self._run, name="emotion-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, text):
+        """Future resolving to the classifier's scores for text"""
+        key = normalize_text(text)
+        with self._lock:
+            self._stats["requests"] += 1
+            scores = self.cache.get(key)
+            if scores is not None:
+                future = Future()
+                future.set_result(scores)
+                return future
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats["coalesced"] += 1
+                return future
+            future = self._inflight[key] = Future()
+        self._queue.put((key, text, time.perf_counter(), future))
+        return future
+
+    def top_emotion(self, text, timeout=None):
+        return top_label(self.submit(text).result(timeout))
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0
+                             else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _buckets(self, batch):
+        """Split a batch, sorted by token length, where padding would get expensive"""
+        lengths = self._token_lengths([text for _, text, _, _ in batch])
+        ordered = sorted(zip(lengths, batch), key=lambda item: item[0])
+        buckets, current = [], []
+        for length, request in ordered:
+            # Sorted ascending, so the newcomer sets the padded length
+            if current and sum(length - l for l, _ in current) > MAX_PADDING * length * (len(current) + 1):
+                buckets.append([r for _, r in current])
+                current = []
+            current.append((length, request))
+        if current:
+            buckets.append([r for _, r in current])
+        return buckets
+
+    def _token_lengths(self, texts):
+        tokenizer = getattr(self.pipeline, "tokenizer", None)
+        if tokenizer is not None:
+            try:
+                return [len(ids) for ids in tokenizer(texts, truncation=True)["input_ids"]]
+            except Exception:
+                pass
+        return [len(text.split()) + 2 for text in texts]
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            with self._lock:
+                for _, _, enqueued, _ in batch:
+                    self._queue_wait.add((started - enqueued) * 1000)
+                self._batch_sizes.add(len(batch))
+                self._stats["batches"] += 1
+            for bucket in self._buckets(batch):
+                self._forward(bucket)
+
+    def _forward(self, bucket):
+        started = time.perf_counter()
+        failed = False
+        try:
+            results = self.pipeline([text for _, text, _, _ in bucket], batch_size=len(bucket),
+                                    truncation=True)
+        except Exception as e:
+            logger.warning(f"Emotion batch of {len(bucket)} failed: {str(e)}")
+            failed = True
+            results = [e] * len(bucket)
+        forward_ms = (time.perf_counter() - started) * 1000
+        # stats() reads these from request threads
+        with self._lock:
+            self._forward_ms.add(forward_ms)
+            self._stats["forward_passes"] += 1
+            self._stats["errors"] += failed
+        for (key, _, _, future), scores in zip(bucket, results):
+            with self._lock:
+                self._inflight.pop(key, None)
+                if not isinstance(scores, Exception):
+                    self.cache.set(key, scores)
+            if isinstance(scores, Exception):
+                future.set_exception(scores)
+            else:
+                future.set_result(scores)
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                queued=self._queue.qsize(),
+                max_batch_size=self.max_batch_size,
+                max_wait_ms=self.max_wait * 1000,
+                batch_size=self._batch_sizes.snapshot(),
+                queue_wait_ms=self._queue_wait.snapshot(),
+                forward_ms=self._forward_ms.snapshot(),
+                cache=self.cache.stats(),
+            )
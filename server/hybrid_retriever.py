@@ -0,0 +1,190 @@
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+HYBRID_TOP_K = int(os.environ.get("HYBRID_TOP_K", "4"))
+# The lexical fast path answers from BM25 alone when the best document
+# matches at least this share of the query's (IDF-weighted) terms...
+HYBRID_MIN_COVERAGE = float(os.environ.get("HYBRID_MIN_COVERAGE", "0.6"))
+# ...and beats the runner-up by at least this fraction of its score
+HYBRID_MIN_MARGIN = float(os.environ.get("HYBRID_MIN_MARGIN", "0.25"))
+# Reciprocal rank fusion constant (60 is the usual choice)
+RRF_K = 60
+
+# Words that carry no signal in this corpus; everything else, including
+# numbers and names like AASRA or NIMHANS, is a term
+STOPWORDS = frozenset("""
+a an and are as at be by can do for from how i in is it me my of on or so that the this
+to was what when where which who why with you your
+""".split())
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over a small in-memory corpus"""
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(text)) for text in texts]
+        self.lengths = [sum(freqs.values()) for freqs in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        document_freqs = Counter(term for freqs in self.term_freqs for term in freqs)
+        n = len(texts)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_freqs.items()}
+
+    def __len__(self):
+        return len(self.term_freqs)
+
+    def score(self, terms, index):
+        freqs = self.term_freqs[index]
+        norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.avg_length or 1))
+        return sum(self.idf[term] * freqs[term] * (self.k1 + 1) / (freqs[term] + norm)
+                   for term in terms if term in freqs)
+
+    def search(self, query, k):
+        """[(index, score)] of the best k documents with a non-zero score, best first"""
+        terms = tokenize(query)
+        scored = [(i, self.score(terms, i)) for i in range(len(self))]
+        scored = [item for item in scored if item[1] > 0]
+        scored.sort(key=lambda item: -item[1])
+        return scored[:k]
+
+    def coverage(self, query, index):
+        """IDF-weighted share of the query's distinct terms found in a document"""
+        terms = set(tokenize(query))
+        # Terms the corpus has never seen count against coverage like a term
+        # found in a single document (not more: "number" or "call" in a
+        # question should not rule the fast path out on their own)
+        unseen_idf = math.log(1 + (len(self) - 0.5) / 1.5)
+        total = sum(self.idf.get(term, unseen_idf) for term in terms)
+        if not total:
+            return 0.0
+        return sum(self.idf[term] for term in terms if term in self.term_freqs[index]) / total
+
+
+class HybridRetriever:
+    """BM25 next to a vector store, with a lexical fast path
+
+    The helpline corpus is short and keyword-heavy: names and numbers decide
+    relevance. Each query is scored with BM25 first; when the best document
+    covers most of the query and clearly beats the runner-up, those BM25
+    results are returned without embedding the query or searching the vector
+    store. Otherwise both rankings are merged with reciprocal rank fusion.
+    Documents only need a page_content attribute.
+    """
+
+    def __init__(self, documents, vectorstore, k=HYBRID_TOP_K, min_coverage=HYBRID_MIN_COVERAGE,
+                 min_margin=HYBRID_MIN_MARGIN):
+        self.documents = list(documents)
+        self.vectorstore = vectorstore
+        self.k = k
+        self.min_coverage = min_coverage
+        self.min_margin = min_margin
+        self.index = BM25Index([doc.page_content for doc in self.documents])
+        self._lock = threading.Lock()
+        self._stats = {"queries": 0, "fast_path": 0, "fused": 0, "vector_errors": 0,
+                       "bm25_runs": 0, "bm25_ms_total": 0.0, "vector_ms_total": 0.0,
+                       "timed_fast_path": 0, "timed_fused": 0,
+                       "fast_path_request_ms_total": 0.0, "fused_request_ms_total": 0.0}
+
+    def lexical(self, query):
+        """(BM25 results, whether the fast path can use them alone)
+
+        Never embeds the query, so a caller can run it before anything that
+        does, such as a semantic answer cache, and skip that too.
+        """
+        started = time.perf_counter()
+        lexical = self.index.search(query, self.k)
+        bm25_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats["bm25_runs"] += 1
+            self._stats["bm25_ms_total"] += bm25_ms
+        return lexical, self._confident(query, lexical)
+
+    def invoke(self, query, lexical=None):
+        """Documents for query; lexical is a lexical(query) result the caller already has"""
+        lexical, confident = lexical or self.lexical(query)
+        if confident:
+            with self._lock:
+                self._stats["queries"] += 1
+                self._stats["fast_path"] += 1
+            return [self.documents[i] for i, _ in lexical]
+
+        started = time.perf_counter()
+        try:
+            semantic = self.vectorstore.similarity_search(query, k=self.k)
+        except Exception as e:
+            # BM25 alone is a usable answer when the embedding service is down
+            logger.warning(f"Vector search failed, using BM25 results: {str(e)}")
+            with self._lock:
+                self._stats["queries"] += 1
+                self._stats["vector_errors"] += 1
+            return [self.documents[i] for i, _ in lexical]
+        vector_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats["queries"] += 1
+            self._stats["fused"] += 1
+            self._stats["vector_ms_total"] += vector_ms
+        return self._fuse(lexical, semantic)
+
+    def record_request(self, fast_path, elapsed_ms):
+        """Time a caller spent on a query before generation (cache lookups and retrieval)"""
+        path = "fast_path" if fast_path else "fused"
+        with self._lock:
+            self._stats[f"timed_{path}"] += 1
+            self._stats[f"{path}_request_ms_total"] += elapsed_ms
+
+    def _confident(self, query, lexical):
+        if not lexical:
+            return False
+        best, best_score = lexical[0]
+        runner_up = lexical[1][1] if len(lexical) > 1 else 0.0
+        return (self.index.coverage(query, best) >= self.min_coverage
+                and best_score - runner_up >= self.min_margin * best_score)
+
+    def _fuse(self, lexical, semantic):
+        scores = {}
+        by_text = {}
+        for rank, (i, _) in enumerate(lexical):
+            doc = self.documents[i]
+            by_text.setdefault(doc.page_content, doc)
+            scores[doc.page_content] = scores.get(doc.page_content, 0.0) + 1 / (RRF_K + rank + 1)
+        for rank, doc in enumerate(semantic):
+            by_text.setdefault(doc.page_content, doc)
+            scores[doc.page_content] = scores.get(doc.page_content, 0.0) + 1 / (RRF_K + rank + 1)
+        ranked = sorted(scores, key=lambda text: -scores[text])
+        return [by_text[text] for text in ranked[:self.k]]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        bm25_runs, bm25_total = stats.pop("bm25_runs"), stats.pop("bm25_ms_total")
+        vector_total = stats.pop("vector_ms_total")
+        timed_fast, timed_fused = stats.pop("timed_fast_path"), stats.pop("timed_fused")
+        fast_total, fused_total = stats.pop("fast_path_request_ms_total"), stats.pop("fused_request_ms_total")
+        fast_request_ms = fast_total / timed_fast if timed_fast else 0.0
+        fused_request_ms = fused_total / timed_fused if timed_fused else 0.0
+        return dict(
+            stats,
+            documents=len(self.documents),
+            fast_path_rate=round(stats["fast_path"] / stats["queries"], 4) if stats["queries"] else 0.0,
+            mean_bm25_ms=round(bm25_total / bm25_runs, 3) if bm25_runs else 0.0,
+            mean_vector_ms=round(vector_total / stats["fused"], 1) if stats["fused"] else 0.0,
+            # Measured per request by the caller, so the fused side includes
+            # the answer cache's embedding round trip the fast path skips
+            mean_fast_path_request_ms=round(fast_request_ms, 1),
+            mean_fused_request_ms=round(fused_request_ms, 1),
+            saved_ms=round(timed_fast * (fused_request_ms - fast_request_ms), 1) if timed_fused else 0.0,
+        )
@@ -0,0 +1,294 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from admission import AdmissionRejected
+
+logger = logging.getLogger(__name__)
+
+# The fine-tuned 6-layer GPT-2 shipped in fine_tuned/ (weights are not in git;
+# copy them next to config.json)
+GPT2_MODEL_PATH = os.environ.get(
+    "GPT2_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fine_tuned"))
+GPT2_MAX_BATCH = int(os.environ.get("GPT2_MAX_BATCH", "8"))
+GPT2_MAX_QUEUE = int(os.environ.get("GPT2_MAX_QUEUE", "32"))
+GPT2_MAX_NEW_TOKENS = int(os.environ.get("GPT2_MAX_NEW_TOKENS", "128"))
+GPT2_TEMPERATURE = float(os.environ.get("GPT2_TEMPERATURE", "0.8"))
+GPT2_TOP_K = int(os.environ.get("GPT2_TOP_K", "50"))
+
+_DONE = object()
+
+
+def cache_layers(past):
+    """[(keys, values), ...] per layer from a legacy tuple cache or a Cache object"""
+    if isinstance(past, (tuple, list)):
+        return [(layer[0], layer[1]) for layer in past]
+    if hasattr(past, "layers"):
+        return [(layer.keys, layer.values) for layer in past.layers]
+    return list(zip(past.key_cache, past.value_cache))
+
+
+def make_cache(layers):
+    """The model's cache type, filled with per-layer (keys, values)"""
+    try:
+        from transformers import DynamicCache
+    except ImportError:
+        return tuple(layers)
+    cache = DynamicCache()
+    for index, (keys, values) in enumerate(layers):
+        cache.update(keys, values, index)
+    return cache
+
+
+class Sequence:
+    """One request: its prompt, the tokens generated so far and its own KV cache"""
+
+    __slots__ = ("prompt_ids", "generated", "past", "length", "max_new_tokens", "next_token", "stop",
+                 "stopped", "tokens", "text", "cancelled", "submitted", "first_token_at", "finished_at")
+
+    def __init__(self, prompt_ids, max_new_tokens, stop=()):
+        self.prompt_ids = prompt_ids
+        self.generated = []
+        self.past = None  # [(keys, values)] per layer, shaped [1, heads, length, head_dim]
+        self.length = 0  # tokens held in past
+        self.max_new_tokens = max_new_tokens
+        self.next_token = None  # sampled, not yet fed back through the model
+        self.stop = tuple(stop)  # strings that end the reply (not included in it)
+        self.stopped = False
+        self.tokens = queue.Queue()  # text pieces for the caller, then _DONE or an exception
+        self.text = ""
+        self.cancelled = False
+        self.submitted = time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+
+    def stream(self):
+        """Text pieces as they are generated; closing the generator cancels the sequence"""
+        try:
+            while True:
+                piece = self.tokens.get()
+                if piece is _DONE:
+                    return
+                if isinstance(piece, Exception):
+                    raise piece
+                yield piece
+        finally:
+            self.cancelled = True
+
+
+class LocalGPT2:
+    """CPU (or GPU) generation with the fine-tuned GPT-2 and continuous batching
+
+    A single worker thread owns the model. Every iteration it prefills newly
+    admitted requests one at a time, then runs one decode step for all
+    active sequences together: their KV caches are left-padded to a common
+    length and masked, and the step's new keys and values are split back
+    into each sequence's own cache. Sequences join and leave the batch
+    between steps, so a short reply never waits for a long one, and each
+    stops at eos_token_id or its token limit.
+    """
+
+    def __init__(self, model_path=GPT2_MODEL_PATH, max_batch=GPT2_MAX_BATCH, max_queue=GPT2_MAX_QUEUE,
+                 max_new_tokens=GPT2_MAX_NEW_TOKENS, temperature=GPT2_TEMPERATURE, top_k=GPT2_TOP_K,
+                 device=None):
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        self.torch = torch
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
+        self.model = AutoModelForCausalLM.from_pretrained(model_path, local_files_only=True)
+        self.model.to(self.device).eval()
+        self.eos_token_id = self.model.config.eos_token_id
+        self.n_ctx = self.model.config.n_positions
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_k = top_k
+        self._waiting = queue.Queue()
+        self._active = []
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "completed": 0, "cancelled": 0, "rejected": 0,
+                       "steps": 0, "batched_tokens": 0, "generated_tokens": 0, "ttft_ms_total": 0.0}
+        self._worker = threading.Thread(target=self._run, name="gpt2-batcher", daemon=True)
+        self._worker.start()
+        logger.info(f"Loaded {model_path} on {self.device} (max batch {max_batch})")
+
+    def submit(self, prompt, max_new_tokens=None, stop=()):
+        """Queue a prompt and return its Sequence; raises AdmissionRejected when the queue is full"""
+        with self._lock:
+            if self._waiting.qsize() >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise AdmissionRejected("local model queue is full", retry_after=2)
+            self._stats["requests"] += 1
+        max_new_tokens = min(max_new_tokens or self.max_new_tokens, self.n_ctx // 2)
+        # Keep the end of a long prompt, leaving room for the reply
+        prompt_ids = self.tokenizer(prompt)["input_ids"][-(self.n_ctx - max_new_tokens):]
+        sequence = Sequence(prompt_ids, max_new_tokens, stop)
+        self._waiting.put(sequence)
+        return sequence
+
+    def stream(self, prompt, max_new_tokens=None, stop=()):
+        return self.submit(prompt, max_new_tokens, stop).stream()
+
+    def generate(self, prompt, max_new_tokens=None, stop=()):
+        return "".join(self.stream(prompt, max_new_tokens, stop))
+
+    def _run(self):
+        with self.torch.inference_mode():
+            while True:
+                # Block only when there is nothing to decode
+                if not self._active:
+                    self._admit(self._waiting.get())
+                while len(self._active) < self.max_batch:
+                    try:
+                        self._admit(self._waiting.get_nowait())
+                    except queue.Empty:
+                        break
+                self._active = [s for s in self._active if not self._finish_if_done(s)]
+                if self._active:
+                    try:
+                        self._decode_step()
+                    except Exception as e:
+                        logger.error(f"GPT-2 decode step failed: {str(e)}")
+                        for sequence in self._active:
+                            sequence.tokens.put(e)
+                        self._active = []
+
+    def _admit(self, sequence):
+        if sequence.cancelled:
+            return
+        try:
+            output = self.model(self.torch.tensor([sequence.prompt_ids], device=self.device), use_cache=True)
+        except Exception as e:
+            logger.error(f"GPT-2 prefill failed: {str(e)}")
+            sequence.tokens.put(e)
+            return
+        sequence.past = cache_layers(output.past_key_values)
+        sequence.length = len(sequence.prompt_ids)
+        self._emit(sequence, self._sample(output.logits[:, -1, :])[0])
+        self._active.append(sequence)
+
+    def _decode_step(self):
+        torch = self.torch
+        batch = self._active
+        longest = max(s.length for s in batch)
+
+        # Left-pad every cache to the longest one; padded slots are masked out
+        layers = []
+        for layer in range(len(batch[0].past)):
+            keys, values = [], []
+            for s in batch:
+                k, v = s.past[layer]
+                pad = longest - s.length
+                if pad:
+                    k = torch.nn.functional.pad(k, (0, 0, pad, 0))
+                    v = torch.nn.functional.pad(v, (0, 0, pad, 0))
+                keys.append(k)
+                values.append(v)
+            layers.append((torch.cat(keys), torch.cat(values)))
+        mask = torch.zeros((len(batch), longest + 1), dtype=torch.long, device=self.device)
+        for row, s in enumerate(batch):
+            mask[row, longest - s.length:] = 1
+
+        output = self.model(
+            input_ids=torch.tensor([[s.next_token] for s in batch], device=self.device),
+            past_key_values=make_cache(layers),
+            attention_mask=mask,
+            position_ids=torch.tensor([[s.length] for s in batch], device=self.device),
+            use_cache=True,
+        )
+        new_layers = cache_layers(output.past_key_values)
+        tokens = self._sample(output.logits[:, -1, :])
+        for row, s in enumerate(batch):
+            keep = s.length + 1
+            s.past = [(k[row:row + 1, :, -keep:], v[row:row + 1, :, -keep:]) for k, v in new_layers]
+            s.length = keep
+            self._emit(s, tokens[row])
+        with self._lock:
+            self._stats["steps"] += 1
+            self._stats["batched_tokens"] += len(batch)
+
+    def _sample(self, logits):
+        torch = self.torch
+        if self.temperature <= 0:
+            return logits.argmax(dim=-1).tolist()
+        logits = logits / self.temperature
+        if self.top_k:
+            threshold = torch.topk(logits, min(self.top_k, logits.shape[-1])).values[:, -1:]
+            logits = logits.masked_fill(logits < threshold, float("-inf"))
+        return torch.multinomial(torch.softmax(logits, dim=-1), 1).squeeze(-1).tolist()
+
+    def _emit(self, sequence, token):
+        """Record a sampled token and stream whatever text it completes"""
+        sequence.next_token = token
+        if token == self.eos_token_id:
+            return
+        sequence.generated.append(token)
+        if sequence.first_token_at is None:
+            sequence.first_token_at = time.perf_counter()
+        # Decode the whole reply so multi-token characters come out whole
+        text = self.tokenizer.decode(sequence.generated, skip_special_tokens=True)
+        if text.endswith("\ufffd"):
+            return
+        for stop in sequence.stop:
+            index = text.find(stop)
+            if index >= 0:
+                text = text[:index]
+                sequence.stopped = True
+        if not sequence.stopped:
+            # Hold back a tail that could still turn into a stop string
+            text = text[:len(text) - self._stop_prefix(text, sequence.stop)]
+        if len(text) > len(sequence.text):
+            sequence.tokens.put(text[len(sequence.text):])
+            sequence.text = text
+
+    @staticmethod
+    def _stop_prefix(text, stops):
+        """Length of the longest end of text that starts one of the stop strings"""
+        return max((n for stop in stops for n in range(min(len(stop), len(text)), 0, -1)
+                    if stop.startswith(text[-n:])), default=0)
+
+    def _finish_if_done(self, sequence):
+        finished = (sequence.next_token == self.eos_token_id
+                    or sequence.stopped
+                    or len(sequence.generated) >= sequence.max_new_tokens
+                    or len(sequence.prompt_ids) + len(sequence.generated) >= self.n_ctx)
+        if not (finished or sequence.cancelled):
+            return False
+        sequence.finished_at = time.perf_counter()
+        sequence.past = None
+        if not sequence.stopped:
+            # Flush text held back for a partial character or stop string
+            text = self.tokenizer.decode(sequence.generated, skip_special_tokens=True)
+            if len(text) > len(sequence.text):
+                sequence.tokens.put(text[len(sequence.text):])
+                sequence.text = text
+        sequence.tokens.put(_DONE)
+        with self._lock:
+            if sequence.cancelled and not finished:
+                self._stats["cancelled"] += 1
+            else:
+                self._stats["completed"] += 1
+                self._stats["generated_tokens"] += len(sequence.generated)
+                if sequence.first_token_at:
+                    self._stats["ttft_ms_total"] += (sequence.first_token_at - sequence.submitted) * 1000
+        return True
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        ttft_total = stats.pop("ttft_ms_total")
+        return dict(
+            stats,
+            active=len(self._active),
+            waiting=self._waiting.qsize(),
+            max_batch=self.max_batch,
+            device=self.device,
+            mean_batch=round(stats["batched_tokens"] / stats["steps"], 2) if stats["steps"] else 0.0,
+            mean_ttft_ms=round(ttft_total / stats["completed"], 1) if stats["completed"] else 0.0,
+        )
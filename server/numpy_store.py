@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import uuid
+
+import numpy as np
+
+try:
+    from langchain_core.documents import Document
+    from langchain_core.vectorstores import VectorStore
+except ImportError:
+    Document = None
+    VectorStore = object
+
+logger = logging.getLogger(__name__)
+
+# "numpy" keeps small corpora in a NumpyVectorStore, "chroma" keeps using Chroma
+VECTOR_STORE = os.environ.get("VECTOR_STORE", "numpy")
+
+_MATRIX = "vectors.npy"
+_METADATA = "metadata.json"
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _matches(metadata, filter):
+    if callable(filter):
+        return filter(metadata)
+    for key, expected in filter.items():
+        value = metadata.get(key)
+        if isinstance(expected, dict) and "$in" in expected:
+            if value not in expected["$in"]:
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+class NumpyVectorStore(VectorStore):
+    """LangChain vector store over one normalized matrix, for corpora of a few thousand chunks
+
+    Rows are unit vectors, so cosine similarity for a batch of queries is a
+    single matrix multiply, and the top k come from argpartition instead of
+    a full sort. Vectors are float32, or float16 to halve memory (each search
+    then converts the matrix back to float32, so it is slower). save() writes the matrix as an .npy file that
+    load() memory-maps, next to a JSON file with ids, texts and metadata.
+    Filters are a dict of metadata values ({"source": url}, or
+    {"source": {"$in": [...]}}) or a callable taking the metadata.
+    """
+
+    def __init__(self, embedding, dtype=np.float32):
+        self.embedding = embedding
+        self.dtype = np.dtype(dtype)
+        self.ids = []
+        self.texts = []
+        self.metadatas = []
+        self.matrix = np.zeros((0, 0), dtype=self.dtype)
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, dtype=np.float32, **kwargs):
+        store = cls(embedding, dtype=dtype)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.add_vectors(self.embedding.embed_documents(texts), texts, metadatas, ids)
+
+    def add_vectors(self, vectors, texts, metadatas=None, ids=None):
+        """Add precomputed embeddings; an existing id is replaced"""
+        texts = list(texts)
+        metadatas = [dict(m or {}) for m in metadatas] if metadatas else [{} for _ in texts]
+        ids = list(ids) if ids else [uuid.uuid4().hex for _ in texts]
+        vectors = _normalize(vectors).astype(self.dtype)
+        replaced = set(ids).intersection(self.ids)
+        if replaced:
+            self.delete(list(replaced))
+        if len(self.ids):
+            self.matrix = np.concatenate([self.matrix, vectors])
+        else:
+            self.matrix = vectors
+        self.ids.extend(ids)
+        self.texts.extend(texts)
+        self.metadatas.extend(metadatas)
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        if ids is None:
+            return False
+        drop = set(ids)
+        keep = [i for i, doc_id in enumerate(self.ids) if doc_id not in drop]
+        self.matrix = self.matrix[keep]
+        self.ids = [self.ids[i] for i in keep]
+        self.texts = [self.texts[i] for i in keep]
+        self.metadatas = [self.metadatas[i] for i in keep]
+        return True
+
+    def get_by_ids(self, ids):
+        positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        return [self._document(positions[doc_id]) for doc_id in ids if doc_id in positions]
+
+    def _document(self, row):
+        return Document(id=self.ids[row], page_content=self.texts[row], metadata=self.metadatas[row])
+
+    def _top_k(self, scores, k, rows):
+        """Best k (row, score) from a score vector over the candidate rows"""
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best])]
+        return [(int(rows[i]), float(scores[i])) for i in best]
+
+    def _candidates(self, filter):
+        if not filter:
+            return None
+        return np.array([i for i, metadata in enumerate(self.metadatas) if _matches(metadata, filter)],
+                        dtype=np.int64)
+
+    def search_vectors(self, queries, k=4, filter=None):
+        """[(row, cosine similarity)] lists for a batch of query vectors, best first"""
+        queries = _normalize(np.atleast_2d(queries))
+        if not len(self.ids) or k <= 0:
+            return [[] for _ in queries]
+        rows = self._candidates(filter)
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        if not len(matrix):
+            return [[] for _ in queries]
+        scores = queries @ matrix.T.astype(np.float32, copy=False)
+        if rows is None:
+            rows = np.arange(len(matrix))
+        return [self._top_k(row_scores, k, rows) for row_scores in scores]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [(self._document(row), score) for row, score in self.search_vectors(embedding, k, filter)[0]]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def batch_similarity_search_with_score(self, queries, k=4, filter=None):
+        """similarity_search_with_score for several queries with one matrix multiply"""
+        queries = list(queries)
+        if not queries:
+            return []
+        vectors = [self.embedding.embed_query(query) for query in queries]
+        return [[(self._document(row), score) for row, score in hits]
+                for hits in self.search_vectors(vectors, k, filter)]
+
+    def batch_similarity_search(self, queries, k=4, filter=None):
+        return [[doc for doc, _ in hits] for hits in self.batch_similarity_search_with_score(queries, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities already; rounding can put them a hair past 1
+        return lambda score: min(max(score, 0.0), 1.0)
+
+    def save(self, directory):
+        """Write the matrix and metadata to directory (atomically replacing a previous save)"""
+        os.makedirs(directory, exist_ok=True)
+        matrix_path = os.path.join(directory, _MATRIX)
+        with open(matrix_path + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(self.matrix))
+        metadata_path = os.path.join(directory, _METADATA)
+        with open(metadata_path + ".tmp", "w") as f:
+            json.dump({"dtype": self.dtype.name, "ids": self.ids, "texts": self.texts,
+                       "metadatas": self.metadatas}, f)
+        os.replace(matrix_path + ".tmp", matrix_path)
+        os.replace(metadata_path + ".tmp", metadata_path)
+
+    @classmethod
+    def exists(cls, directory):
+        return all(os.path.exists(os.path.join(directory, name)) for name in (_MATRIX, _METADATA))
+
+    @classmethod
+    def load(cls, directory, embedding, mmap=True):
+        """A store saved with save(); the matrix is memory-mapped read-only unless mmap=False
+
+        Adding to or deleting from a mapped store copies the matrix into memory.
+        """
+        with open(os.path.join(directory, _METADATA)) as f:
+            metadata = json.load(f)
+        store = cls(embedding, dtype=metadata["dtype"])
+        store.matrix = np.load(os.path.join(directory, _MATRIX), mmap_mode="r" if mmap else None)
+        store.ids = metadata["ids"]
+        store.texts = metadata["texts"]
+        store.metadatas = metadata["metadatas"]
+        if len(store.matrix) != len(store.ids):
+            raise ValueError(f"{directory} has {len(store.matrix)} vectors for {len(store.ids)} ids")
+        return store
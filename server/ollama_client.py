@@ -0,0 +1,451 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Defaults can be overridden through the environment so every server variant
+# shares one configuration surface.
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+POOL_SIZE = int(os.environ.get("OLLAMA_POOL_SIZE", "10"))
+CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.environ.get("OLLAMA_READ_TIMEOUT", "120"))
+MODEL_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "10m")  # keeps the model resident between turns
+HEALTH_INTERVAL = float(os.environ.get("OLLAMA_HEALTH_INTERVAL", "5"))
+
+
+def is_upstream_failure(exc):
+    """Whether a failed request says Ollama is unhealthy rather than that the request was bad
+
+    Only connection errors, timeouts and 5xx responses count against the
+    circuit breaker. A 4xx (unknown model, malformed payload) is the
+    caller's problem, and a few of them must not push every client into
+    fallback.
+    """
+    if isinstance(exc, requests.exceptions.HTTPError):
+        return exc.response is None or exc.response.status_code >= 500
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status >= 500
+    return isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                            aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+
+class CircuitBreaker:
+    """Tracks upstream health so request handlers never have to probe Ollama themselves"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=3, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+            return self._state
+
+    def allow_request(self):
+        """Closed and half-open both let traffic through; half-open is the trial"""
+        return self.state != self.OPEN
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"Ollama circuit opened after {self._failures} failure(s)")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class OllamaClient:
+    """Connection-pooled Ollama client with a background-refreshed availability state"""
+
+    def __init__(self, base_url=OLLAMA_BASE_URL, pool_size=POOL_SIZE,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 model_keep_alive=MODEL_KEEP_ALIVE, health_interval=HEALTH_INTERVAL,
+                 breaker=None):
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.model_keep_alive = model_keep_alive
+        self.health_interval = health_interval
+        self.breaker = breaker or CircuitBreaker()
+        self.version = None
+
+        # One session per process: connections are kept alive and reused
+        # across requests instead of paying a TCP handshake per turn.
+        self.session = requests.Session()
+        self.session.headers.update({"Connection": "keep-alive"})
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                                    max_retries=0, pool_block=False)
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+
+        self._requests = 0
+        self._errors = 0
+        self._stats_lock = threading.Lock()
+        self._monitor = None
+        self._monitor_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    # Availability
+
+    def start_monitor(self):
+        """Start the background health probe (idempotent)"""
+        with self._monitor_lock:
+            if self._monitor is not None and self._monitor.is_alive():
+                return
+            self._stop.clear()
+            self._monitor = threading.Thread(target=self._monitor_loop,
+                                             name="ollama-health", daemon=True)
+            self._monitor.start()
+
+    def stop_monitor(self):
+        self._stop.set()
+
+    def _monitor_loop(self):
+        while not self._stop.is_set():
+            self.refresh_availability()
+            self._stop.wait(self.health_interval)
+
+    def refresh_availability(self):
+        """Probe /api/version once and feed the result into the circuit breaker"""
+        try:
+            response = self.session.get(self.url("/api/version"), timeout=(self.timeout[0], 2))
+            response.raise_for_status()
+            self.version = response.json().get("version")
+            self.breaker.record_success()
+            return True
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.debug(f"Ollama health probe failed: {str(e)}")
+            self.breaker.record_failure()
+            return False
+
+    def is_available(self):
+        """Cached availability; never blocks on the network"""
+        self.start_monitor()
+        return self.breaker.allow_request()
+
+    # Requests
+
+    def _post(self, path, payload, stream=False):
+        with self._stats_lock:
+            self._requests += 1
+        try:
+            response = self.session.post(self.url(path), json=payload,
+                                         stream=stream, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            with self._stats_lock:
+                self._errors += 1
+            if is_upstream_failure(e):
+                self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return response
+
+    def _with_keep_alive(self, payload):
+        if self.model_keep_alive and "keep_alive" not in payload:
+            payload = dict(payload, keep_alive=self.model_keep_alive)
+        return payload
+
+    def generate(self, payload, endpoint="/api/generate"):
+        """Non-streaming /api/generate (or /api/chat) call; returns the decoded JSON body"""
+        payload = self._with_keep_alive(dict(payload, stream=False))
+        return self._post(endpoint, payload).json()
+
+    def stream_generate(self, payload, endpoint="/api/generate"):
+        """Streaming /api/generate (or /api/chat) call; yields decoded JSON chunks"""
+        payload = self._with_keep_alive(dict(payload, stream=True))
+        return self._iter_chunks(self._post(endpoint, payload, stream=True))
+
+    def _iter_chunks(self, response):
+        # Closing the response hands the connection back to the pool
+        try:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Failed to decode JSON: {line}")
+        finally:
+            response.close()
+
+    # Metrics
+
+    def pool_stats(self):
+        """Pool hit/miss counts: a miss is a request that had to open a new connection"""
+        connections = 0
+        pooled_requests = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue
+            connections += pool.num_connections
+            pooled_requests += pool.num_requests
+        return {
+            "pool_size": self.pool_size,
+            "hits": max(pooled_requests - connections, 0),
+            "misses": connections,
+        }
+
+    def stats(self):
+        with self._stats_lock:
+            requests_sent, errors = self._requests, self._errors
+        return {
+            "base_url": self.base_url,
+            "version": self.version,
+            "circuit": self.breaker.state,
+            "requests": requests_sent,
+            "errors": errors,
+            "pool": self.pool_stats(),
+        }
+
+
+# Exceptions raised by AsyncOllamaClient for transport and HTTP errors
+ASYNC_REQUEST_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+
+class AsyncOllamaClient:
+    """Asyncio counterpart of OllamaClient for ASGI serving modes
+
+    Must be started and closed from the event loop that uses it.
+    """
+
+    def __init__(self, base_url=OLLAMA_BASE_URL, pool_size=POOL_SIZE,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 model_keep_alive=MODEL_KEEP_ALIVE, health_interval=HEALTH_INTERVAL,
+                 breaker=None):
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(total=None, sock_connect=connect_timeout,
+                                             sock_read=read_timeout)
+        self.model_keep_alive = model_keep_alive
+        self.health_interval = health_interval
+        self.breaker = breaker or CircuitBreaker()
+        self.version = None
+        self._session = None
+        self._monitor = None
+        self._requests = 0
+        self._errors = 0
+        self._hits = 0
+        self._misses = 0
+        self._in_flight = 0
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    async def start(self):
+        if self._session is None:
+            trace = aiohttp.TraceConfig()
+            trace.on_connection_create_end.append(self._on_new_connection)
+            trace.on_connection_reuseconn.append(self._on_reused_connection)
+            # Streams hold a connection for their whole lifetime, so the pool
+            # bounds concurrent upstream generations rather than requests/sec.
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=self.timeout,
+                trace_configs=[trace],
+            )
+        if self._monitor is None:
+            self._monitor = asyncio.get_running_loop().create_task(self._monitor_loop())
+
+    async def close(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _on_new_connection(self, session, context, params):
+        self._misses += 1
+
+    async def _on_reused_connection(self, session, context, params):
+        self._hits += 1
+
+    async def _monitor_loop(self):
+        while True:
+            await self.refresh_availability()
+            await asyncio.sleep(self.health_interval)
+
+    async def refresh_availability(self):
+        """Probe /api/version once and feed the result into the circuit breaker"""
+        try:
+            async with self._session.get(self.url("/api/version"),
+                                         timeout=aiohttp.ClientTimeout(total=2)) as response:
+                response.raise_for_status()
+                self.version = (await response.json()).get("version")
+            self.breaker.record_success()
+            return True
+        except ASYNC_REQUEST_ERRORS + (ValueError,) as e:
+            logger.debug(f"Ollama health probe failed: {str(e)}")
+            self.breaker.record_failure()
+            return False
+
+    def is_available(self):
+        """Cached availability; never blocks on the network"""
+        return self.breaker.allow_request()
+
+    def _with_keep_alive(self, payload):
+        if self.model_keep_alive and "keep_alive" not in payload:
+            payload = dict(payload, keep_alive=self.model_keep_alive)
+        return payload
+
+    async def generate(self, payload, endpoint="/api/generate"):
+        """Non-streaming /api/generate (or /api/chat) call; returns the decoded JSON body"""
+        payload = self._with_keep_alive(dict(payload, stream=False))
+        self._requests += 1
+        self._in_flight += 1
+        try:
+            async with self._session.post(self.url(endpoint), json=payload) as response:
+                response.raise_for_status()
+                body = await response.json(content_type=None)
+        except ASYNC_REQUEST_ERRORS as e:
+            self._errors += 1
+            if is_upstream_failure(e):
+                self.breaker.record_failure()
+            raise
+        finally:
+            self._in_flight -= 1
+        self.breaker.record_success()
+        return body
+
+    async def stream_generate(self, payload, endpoint="/api/generate"):
+        """Streaming /api/generate (or /api/chat) call; yields decoded JSON chunks without blocking the loop"""
+        payload = self._with_keep_alive(dict(payload, stream=True))
+        self._requests += 1
+        self._in_flight += 1
+        try:
+            async with self._session.post(self.url(endpoint), json=payload) as response:
+                response.raise_for_status()
+                self.breaker.record_success()
+                async for line in response.content:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Failed to decode JSON: {line}")
+        except ASYNC_REQUEST_ERRORS as e:
+            self._errors += 1
+            if is_upstream_failure(e):
+                self.breaker.record_failure()
+            raise
+        finally:
+            self._in_flight -= 1
+
+    def stats(self):
+        return {
+            "base_url": self.base_url,
+            "version": self.version,
+            "circuit": self.breaker.state,
+            "requests": self._requests,
+            "errors": self._errors,
+            "in_flight": self._in_flight,
+            "pool": {
+                "pool_size": self.pool_size,
+                "hits": self._hits,
+                "misses": self._misses,
+            },
+        }
+
+
+async def _anext(agen):
+    # run_coroutine_threadsafe needs a real coroutine, not the awaitable __anext__ returns
+    return await agen.__anext__()
+
+
+class ClientThread:
+    """Runs an AsyncOllamaClient on its own long-lived event loop thread
+
+    For servers that are synchronous or create a fresh event loop per request
+    (Flask async views): the aiohttp session and its connection pool belong
+    to one loop that outlives every request, and handlers reach it through
+    call() / call_async() / stream().
+    """
+
+    def __init__(self, client=None):
+        self.client = client or AsyncOllamaClient()
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="ollama-loop", daemon=True)
+        self._thread.start()
+        self.call(self.client.start())
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, coro):
+        """Run a coroutine on the client loop and block for its result"""
+        return self.submit(coro).result()
+
+    async def call_async(self, coro):
+        """Await a coroutine on the client loop from another event loop"""
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def stream(self, agen):
+        """Iterate an async generator from the client loop as a plain iterator"""
+        try:
+            while True:
+                try:
+                    yield self.call(_anext(agen))
+                except StopAsyncIteration:
+                    return
+        finally:
+            # Closing early (client disconnected) releases the upstream connection
+            self.call(agen.aclose())
+
+    def close(self):
+        self.call(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+_default_client = None
+_default_client_thread = None
+_default_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide shared client"""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = OllamaClient()
+        return _default_client
+
+
+def get_client_thread():
+    """Process-wide shared async client on a background loop"""
+    global _default_client_thread
+    with _default_lock:
+        if _default_client_thread is None:
+            _default_client_thread = ClientThread()
+        return _default_client_thread
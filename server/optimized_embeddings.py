@@ -1,8 +1,38 @@
+import itertools
+import json
 import logging
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import torch
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from embedding_cache import cached_embeddings
+
+
+class PrecomputedEmbeddings(Embeddings):
+    """Serves embed_documents from vectors computed ahead of time, by text
+
+    Lets a vector store's public add_texts write vectors that were already
+    embedded elsewhere; anything not precomputed goes to the real model.
+    """
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.vectors = {}
+
+    def embed_documents(self, texts):
+        missing = [text for text in texts if text not in self.vectors]
+        if missing:
+            self.vectors.update(zip(missing, self.embeddings.embed_documents(missing)))
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
 
 class OptimizedEmbeddings:
     """A class for efficiently handling embeddings with GPU acceleration if available"""
@@ -44,6 +74,8 @@ class OptimizedEmbeddings:
                 except Exception as e2:
                     self.logger.error(f"Error initializing fallback embeddings: {str(e2)}")
                     raise
+            # Vectors are cached on disk by model and text, across restarts
+            self._embeddings = cached_embeddings(self._embeddings)
         return self._embeddings
     
     def _get_collection(self, collection_name):
@@ -70,6 +102,132 @@ class OptimizedEmbeddings:
             self.logger.error(f"Error adding texts to collection {collection_name}: {str(e)}")
             raise
     
+    def bulk_add(self, texts, collection_name="default", metadatas=None, batch_size=64, workers=2,
+                 job_id=None, progress=None):
+        """Stream texts into a collection in batches, embedding ahead of the writes
+
+        texts (and metadatas, if given) may be any iterables, e.g. generators
+        over a large archive; only the batches in flight are held in memory.
+        Batches are embedded on a pool of workers while the calling thread
+        writes finished batches in order, so at most workers + 1 batches are
+        pending at a time.
+
+        With a job_id the number of committed texts is checkpointed in the
+        persist directory after every batch. Calling again with the same
+        job_id and the same input skips what was already written; IDs are
+        derived from the job and position, so a batch that was written but
+        not checkpointed before a crash is overwritten, not duplicated.
+
+        progress, if given, is called with the running stats after each
+        batch. Returns the final stats: counts, chunks/sec, bytes/sec and the
+        seconds spent reading, embedding (summed over workers), waiting for
+        embeddings and writing.
+        """
+        self._get_collection(collection_name)
+        embeddings = self._get_embeddings()
+        # Writes go through Chroma's add_texts with the vectors the workers
+        # computed, instead of embedding every batch a second time
+        precomputed = PrecomputedEmbeddings(embeddings)
+        writer = Chroma(
+            collection_name=collection_name,
+            embedding_function=precomputed,
+            persist_directory=self.persist_directory
+        )
+        checkpoint = self._checkpoint_path(collection_name, job_id) if job_id else None
+        committed = self._read_checkpoint(checkpoint)
+        prefix = job_id or uuid.uuid4().hex[:12]
+
+        items = zip(texts, metadatas) if metadatas is not None else ((text, None) for text in texts)
+        if committed:
+            self.logger.info(f"Resuming bulk job {job_id}: skipping {committed} committed texts")
+            items = itertools.islice(items, committed, None)
+
+        stats = {"chunks": 0, "bytes": 0, "batches": 0, "resumed_from": committed,
+                 "read_seconds": 0.0, "embed_seconds": 0.0, "wait_seconds": 0.0, "write_seconds": 0.0}
+        started = time.perf_counter()
+
+        def embed(batch):
+            embed_started = time.perf_counter()
+            vectors = embeddings.embed_documents([text for text, _ in batch])
+            return vectors, time.perf_counter() - embed_started
+
+        def write(batch, future, position):
+            wait_started = time.perf_counter()
+            vectors, embed_seconds = future.result()
+            write_started = time.perf_counter()
+            batch_texts = [text for text, _ in batch]
+            precomputed.vectors = dict(zip(batch_texts, vectors))
+            # add_texts upserts, so a replayed batch is idempotent; it stores
+            # chunks with an empty metadata dict without metadata
+            writer.add_texts(
+                batch_texts,
+                metadatas=[meta or {} for _, meta in batch] if metadatas is not None else None,
+                ids=[f"{prefix}-{position + i}" for i in range(len(batch))],
+            )
+            finished = time.perf_counter()
+            stats["embed_seconds"] += embed_seconds
+            stats["wait_seconds"] += write_started - wait_started
+            stats["write_seconds"] += finished - write_started
+            stats["chunks"] += len(batch)
+            stats["bytes"] += sum(len(text.encode("utf-8")) for text, _ in batch)
+            stats["batches"] += 1
+            self._write_checkpoint(checkpoint, position + len(batch))
+            self._throughput(stats, finished - started)
+            if progress:
+                progress(dict(stats))
+            else:
+                self.logger.info(f"Bulk add to {collection_name}: {committed + stats['chunks']} texts, "
+                                 f"{stats['chunks_per_sec']} chunks/s")
+
+        position = committed
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as pool:
+            while True:
+                read_started = time.perf_counter()
+                batch = list(itertools.islice(items, batch_size))
+                stats["read_seconds"] += time.perf_counter() - read_started
+                if not batch:
+                    break
+                pending.append((batch, pool.submit(embed, batch), position))
+                position += len(batch)
+                if len(pending) > workers:
+                    write(*pending.popleft())
+            while pending:
+                write(*pending.popleft())
+
+        self._throughput(stats, time.perf_counter() - started)
+        if checkpoint:
+            self._write_checkpoint(checkpoint, position, done=True)
+        self.logger.info(f"Bulk add to {collection_name} finished: {stats['chunks']} texts in "
+                         f"{stats['elapsed_seconds']}s ({stats['chunks_per_sec']} chunks/s, "
+                         f"{stats['bytes_per_sec']} bytes/s)")
+        return stats
+
+    @staticmethod
+    def _throughput(stats, elapsed):
+        stats["elapsed_seconds"] = round(elapsed, 3)
+        stats["chunks_per_sec"] = round(stats["chunks"] / elapsed, 1) if elapsed else 0.0
+        stats["bytes_per_sec"] = round(stats["bytes"] / elapsed, 1) if elapsed else 0.0
+
+    def _checkpoint_path(self, collection_name, job_id):
+        return os.path.join(self.persist_directory, f"bulk-{collection_name}-{job_id}.json")
+
+    def _read_checkpoint(self, path):
+        if not path or not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            checkpoint = json.load(f)
+        # A finished job run again starts over (and overwrites the same IDs)
+        return 0 if checkpoint.get("done") else checkpoint["committed"]
+
+    def _write_checkpoint(self, path, committed, done=False):
+        if not path:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"committed": committed, "done": done, "updated": time.time()}, f)
+        os.replace(path + ".tmp", path)
+
     def similarity_search(self, query, collection_name="default", k=4):
         """Find similar documents"""
         if not query:
@@ -84,8 +242,10 @@ class OptimizedEmbeddings:
     
     def status(self):
         """Return the status of the embeddings system"""
+        stats = getattr(self._embeddings, "stats", None)
         return {
             "initialized": self._embeddings is not None,
+            "embedding_cache": stats() if stats else None,
             "collections": list(self._collections.keys()),
             "gpu_available": self.has_gpu
         } 
\ No newline at end of file
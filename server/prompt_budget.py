@@ -0,0 +1,186 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Token budget per prompt section (the fixed guidelines are counted, not cut)
+PROMPT_BUDGET_HISTORY = int(os.environ.get("PROMPT_BUDGET_HISTORY", "600"))
+PROMPT_BUDGET_SUMMARY = int(os.environ.get("PROMPT_BUDGET_SUMMARY", "150"))
+PROMPT_BUDGET_CONTEXT = int(os.environ.get("PROMPT_BUDGET_CONTEXT", "500"))
+PROMPT_BUDGET_MESSAGE = int(os.environ.get("PROMPT_BUDGET_MESSAGE", "400"))
+# Most messages kept verbatim, however short they are
+PROMPT_RECENT_MESSAGES = int(os.environ.get("PROMPT_RECENT_MESSAGES", "6"))
+# The tokenizer used by the text splitters; close enough to count for qwen2.5
+TOKEN_ENCODING = os.environ.get("TOKEN_ENCODING", "cl100k_base")
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+class TokenCounter:
+    """tiktoken counts and cuts, memoized per string
+
+    Falls back to about four characters per token if tiktoken or its
+    encoding files are not available.
+    """
+
+    def __init__(self, encoding=TOKEN_ENCODING):
+        try:
+            import tiktoken
+            self.encoding = tiktoken.get_encoding(encoding)
+        except Exception as e:
+            logger.warning(f"Counting tokens by length, tiktoken unavailable: {str(e)}")
+            self.encoding = None
+        # History messages and guidelines repeat on every turn
+        self.count = lru_cache(maxsize=4096)(self._count)
+
+    def _count(self, text):
+        if self.encoding is None:
+            return (len(text) + 3) // 4
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text, max_tokens):
+        """text cut to at most max_tokens tokens"""
+        if self.count(text) <= max_tokens:
+            return text
+        if self.encoding is None:
+            return text[:max_tokens * 4]
+        return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def first_sentence(text):
+    return _SENTENCE_END.split(text.strip(), 1)[0]
+
+
+def extractive_summary(summary, messages):
+    """Rolling summary without a model call: one line per folded user message"""
+    lines = [summary] if summary else []
+    lines += [f"- User said: {first_sentence(text)}" for role, text in messages if role == "User"]
+    return "\n".join(lines)
+
+
+class PromptBudget:
+    """Fits prompt sections into per-section token budgets
+
+    Recent history is kept verbatim, newest first, while it fits the
+    history budget (and at most recent_messages messages); older messages
+    are folded into a rolling summary. Summaries are cached by a chained
+    digest of the messages they cover, so each turn only summarizes the
+    messages that newly fell out of the window. The summarizer defaults to
+    an extractive one and can be any fn(previous_summary, messages) -> str.
+    Messages are (role, text) pairs.
+    """
+
+    def __init__(self, counter=None, history_tokens=PROMPT_BUDGET_HISTORY, summary_tokens=PROMPT_BUDGET_SUMMARY,
+                 context_tokens=PROMPT_BUDGET_CONTEXT, message_tokens=PROMPT_BUDGET_MESSAGE,
+                 recent_messages=PROMPT_RECENT_MESSAGES, summarize=extractive_summary, max_summaries=256,
+                 window=200):
+        self.counter = counter or TokenCounter()
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.context_tokens = context_tokens
+        self.message_tokens = message_tokens
+        self.recent_messages = recent_messages
+        self.summarize = summarize
+        self.max_summaries = max_summaries
+        self._summaries = OrderedDict()  # digest of the folded messages -> summary
+        self._totals = deque(maxlen=window)  # prompt tokens of recent turns
+        self._lock = threading.Lock()
+        self._stats = {"turns": 0, "summaries_built": 0, "summary_cache_hits": 0, "truncated_sections": 0}
+        self.last_counts = {}
+
+    def fit_history(self, messages):
+        """(summary, recent messages) within the summary and history budgets"""
+        recent = []
+        used = 0
+        for role, text in reversed(messages):
+            tokens = self.counter.count(f"{role}: {text}")
+            if len(recent) >= self.recent_messages or (recent and used + tokens > self.history_tokens):
+                break
+            recent.append((role, text))
+            used += tokens
+        recent.reverse()
+        folded = messages[:len(messages) - len(recent)]
+        summary = self._summary(folded) if folded else ""
+        # A single message longer than the whole budget is cut rather than dropped
+        if recent and used > self.history_tokens:
+            role, text = recent[0]
+            recent[0] = (role, self.counter.truncate(text, self.history_tokens))
+            self._count_truncation()
+        return summary, recent
+
+    def _summary(self, folded):
+        # digests[i] identifies folded[:i + 1]
+        digests = []
+        digest = b""
+        for role, text in folded:
+            digest = hashlib.blake2b(digest + f"{role}\0{text}".encode("utf-8"), digest_size=16).digest()
+            digests.append(digest)
+        with self._lock:
+            covered, summary = 0, ""
+            for i in range(len(digests) - 1, -1, -1):
+                if digests[i] in self._summaries:
+                    covered, summary = i + 1, self._summaries[digests[i]]
+                    self._summaries.move_to_end(digests[i])
+                    break
+            if covered == len(folded):
+                self._stats["summary_cache_hits"] += 1
+                return summary
+        summary = self.summarize(summary, folded[covered:])
+        summary = self._keep_recent(summary)
+        with self._lock:
+            self._stats["summaries_built"] += 1
+            self._summaries[digests[-1]] = summary
+            while len(self._summaries) > self.max_summaries:
+                self._summaries.popitem(last=False)
+        return summary
+
+    def _keep_recent(self, summary):
+        """Drop the oldest summary lines until it fits its budget"""
+        lines = summary.splitlines()
+        while len(lines) > 1 and self.counter.count("\n".join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        return self.counter.truncate("\n".join(lines), self.summary_tokens)
+
+    def fit(self, text, max_tokens):
+        if self.counter.count(text) <= max_tokens:
+            return text
+        self._count_truncation()
+        return self.counter.truncate(text, max_tokens)
+
+    def fit_context(self, context):
+        return self.fit(context, self.context_tokens)
+
+    def fit_message(self, message):
+        return self.fit(message, self.message_tokens)
+
+    def _count_truncation(self):
+        with self._lock:
+            self._stats["truncated_sections"] += 1
+
+    def record(self, sections, prompt):
+        """Count the tokens of one assembled prompt; sections maps names to their text"""
+        counts = {name: self.counter.count(text) for name, text in sections.items()}
+        counts["total"] = self.counter.count(prompt)
+        with self._lock:
+            self._stats["turns"] += 1
+            self._totals.append(counts["total"])
+            self.last_counts = counts
+        return counts
+
+    def stats(self):
+        with self._lock:
+            totals = sorted(self._totals)
+            return dict(
+                self._stats,
+                last_turn=dict(self.last_counts),
+                mean_prompt_tokens=round(sum(totals) / len(totals), 1) if totals else 0.0,
+                p95_prompt_tokens=totals[min(int(len(totals) * 0.95), len(totals) - 1)] if totals else 0,
+                max_prompt_tokens=totals[-1] if totals else 0,
+                budgets={"history": self.history_tokens, "summary": self.summary_tokens,
+                         "context": self.context_tokens, "message": self.message_tokens},
+            )
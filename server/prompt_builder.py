@@ -0,0 +1,123 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# flat:    one /api/generate prompt string rebuilt every turn (original behaviour)
+# chat:    /api/chat with the chat-type context as a fixed system message, so the
+#          templated prefix is byte-identical across turns and Ollama's KV cache
+#          only has to prefill what follows it
+# context: /api/generate carrying forward the token `context` Ollama returns,
+#          so each turn only sends the new user message
+PROMPT_MODES = ("flat", "chat", "context")
+PROMPT_MODE = os.environ.get("OLLAMA_PROMPT_MODE", "chat")
+
+GENERATE_ENDPOINT = "/api/generate"
+CHAT_ENDPOINT = "/api/chat"
+
+
+def chunk_text(chunk):
+    """Token text from an /api/generate or /api/chat response chunk"""
+    if "message" in chunk:
+        return chunk["message"].get("content", "")
+    return chunk.get("response", "")
+
+
+class PromptBuilder:
+    """Builds Ollama requests that keep a stable, cache-friendly prefix per chat type"""
+
+    def __init__(self, model, contexts, default_chat_type="GENERAL", mode=PROMPT_MODE,
+                 history_turns=3, options=None, max_sessions=1000, max_context_tokens=6000):
+        if mode not in PROMPT_MODES:
+            raise ValueError(f"Unknown prompt mode {mode!r}, expected one of {PROMPT_MODES}")
+        self.model = model
+        self.contexts = contexts
+        self.default_chat_type = default_chat_type
+        self.mode = mode
+        self.history_turns = history_turns
+        self.options = options or {}
+        self.max_sessions = max_sessions
+        self.max_context_tokens = max_context_tokens
+        self._token_contexts = OrderedDict()  # (session_id, chat_type) -> Ollama context
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "context_reused": 0, "context_reset": 0}
+
+    def system_context(self, chat_type):
+        return self.contexts.get(chat_type, self.contexts[self.default_chat_type])
+
+    def build(self, message, chat_type, history, session_id=None, stream=False):
+        """Return (endpoint, payload) for one turn; history is a list of exchanges"""
+        history = history[-self.history_turns:] if self.history_turns else []
+        with self._lock:
+            self._stats["requests"] += 1
+        if self.mode == "chat":
+            payload = self._chat_payload(message, chat_type, history)
+            endpoint = CHAT_ENDPOINT
+        elif self.mode == "context":
+            payload = self._context_payload(message, chat_type, history, session_id)
+            endpoint = GENERATE_ENDPOINT
+        else:
+            payload = self._flat_payload(message, chat_type, history)
+            endpoint = GENERATE_ENDPOINT
+        payload.update(model=self.model, stream=stream)
+        if self.options:
+            payload["options"] = dict(self.options)
+        return endpoint, payload
+
+    def record(self, session_id, chat_type, final_chunk):
+        """Remember the context Ollama returned at the end of a turn (context mode only)"""
+        if self.mode != "context" or not session_id:
+            return
+        context = final_chunk.get("context")
+        key = (session_id, chat_type)
+        with self._lock:
+            if not context or len(context) > self.max_context_tokens:
+                # Too long to keep extending: the next turn starts a fresh prefix
+                if self._token_contexts.pop(key, None) is not None:
+                    self._stats["context_reset"] += 1
+                return
+            self._token_contexts[key] = context
+            self._token_contexts.move_to_end(key)
+            while len(self._token_contexts) > self.max_sessions:
+                self._token_contexts.popitem(last=False)
+
+    def forget(self, session_id):
+        with self._lock:
+            for key in [key for key in self._token_contexts if key[0] == session_id]:
+                del self._token_contexts[key]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, mode=self.mode, cached_contexts=len(self._token_contexts))
+
+    def _flat_payload(self, message, chat_type, history):
+        prompt = self.system_context(chat_type)
+        for exchange in history:
+            prompt += f"\nUser: {exchange['user']}\nAssistant: {exchange['assistant']}"
+        prompt += f"\nUser: {message}\nAssistant:"
+        return {"prompt": prompt}
+
+    def _chat_payload(self, message, chat_type, history):
+        messages = [{"role": "system", "content": self.system_context(chat_type)}]
+        for exchange in history:
+            messages.append({"role": "user", "content": exchange["user"]})
+            messages.append({"role": "assistant", "content": exchange["assistant"]})
+        messages.append({"role": "user", "content": message})
+        return {"messages": messages}
+
+    def _context_payload(self, message, chat_type, history, session_id):
+        with self._lock:
+            context = self._token_contexts.get((session_id, chat_type)) if session_id else None
+            if context is not None:
+                self._stats["context_reused"] += 1
+        if context is not None:
+            return {"prompt": message, "context": context}
+        # First turn (or after a reset): system context plus recent history,
+        # whose evaluated tokens come back as the context for the next turn
+        prompt = ""
+        for exchange in history:
+            prompt += f"User: {exchange['user']}\nAssistant: {exchange['assistant']}\n"
+        prompt += message
+        return {"system": self.system_context(chat_type), "prompt": prompt}
@@ -0,0 +1,92 @@
+import re
+
+# Exclusion list for organizational references, and what replaces them
+BLACKLISTED_ENTITIES = [
+    "mpower", "thelivelovelaughfoundation",
+    "depwd", "pib.gov", "mpowerminds"
+]
+RESOURCE_PLACEHOLDER = "[mental health resource]"
+
+
+class Sanitizer:
+    """Rewrites blacklisted terms (whole words, any case) with one compiled pattern
+
+    sanitize() handles complete text; stream() returns a StreamSanitizer
+    that rewrites a token stream as it arrives and produces exactly the
+    same text.
+    """
+
+    def __init__(self, terms, replacement):
+        # Longest first, so a term that extends another ("mpowerminds") wins
+        terms = sorted({term.lower() for term in terms}, key=len, reverse=True)
+        self.replacement = replacement
+        self.pattern = re.compile(r"\b(?:" + "|".join(re.escape(term) for term in terms) + r")\b", re.I)
+        self.max_length = len(terms[0]) if terms else 0
+        # A stream ending in one of these might still turn into a match
+        self.prefixes = frozenset(term[:i] for term in terms for i in range(1, len(term) + 1))
+        self._template = replacement.replace("\\", "\\\\")
+
+    def sanitize(self, text):
+        return self.pattern.sub(self._template, text)
+
+    def stream(self):
+        return StreamSanitizer(self)
+
+    def sanitize_stream(self, chunks):
+        """Sanitized pieces of an iterable of chunks (empty pieces are skipped)"""
+        stream = self.stream()
+        for chunk in chunks:
+            piece = stream.feed(chunk)
+            if piece:
+                yield piece
+        piece = stream.flush()
+        if piece:
+            yield piece
+
+
+class StreamSanitizer:
+    """Incremental Sanitizer for one stream: feed() chunks, then flush()
+
+    Text is passed on as soon as it cannot be part of a match. Only a
+    trailing run that is still the start of a blacklisted term is held
+    back (at most the longest term), plus the last character passed on,
+    which the next match needs for its word boundary.
+    """
+
+    __slots__ = ("sanitizer", "buffer", "previous")
+
+    def __init__(self, sanitizer):
+        self.sanitizer = sanitizer
+        self.buffer = ""
+        self.previous = ""  # last character already passed on
+
+    def feed(self, chunk):
+        text = self.previous + self.buffer + chunk
+        return self._emit(text, self._safe_end(text))
+
+    def flush(self):
+        text = self.previous + self.buffer
+        return self._emit(text, len(text))
+
+    def _safe_end(self, text):
+        """Index in text up to which no match can still change"""
+        prefixes = self.sanitizer.prefixes
+        for start in range(max(len(self.previous), len(text) - self.sanitizer.max_length), len(text)):
+            if text[start:].lower() in prefixes:
+                return start
+        return len(text)
+
+    def _emit(self, text, safe_end):
+        pieces = []
+        position = len(self.previous)
+        for match in self.sanitizer.pattern.finditer(text, position):
+            if match.start() >= safe_end:
+                break
+            pieces.append(text[position:match.start()])
+            pieces.append(self.sanitizer.replacement)
+            position = match.end()
+        end = max(position, safe_end)
+        pieces.append(text[position:end])
+        self.previous = text[end - 1:end] if end else ""
+        self.buffer = text[end:]
+        return "".join(pieces)
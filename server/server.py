@@ -4,17 +4,17 @@ from pathlib import Path
 import logging
 import sys
 import os
+import time
 import traceback
 
-# Import RAG components
-from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings
-from langchain_ollama import ChatOllama
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_core.documents import Document
+from cache import AnswerCache, fingerprint, normalize_text
+from singleflight import SingleFlight, request_key
+from admission import AdmissionController, AdmissionRejected
+from crisis import is_high_risk
+from warmup import NotReady, Warmup
+from embedding_cache import cached_embeddings
+from hybrid_retriever import HybridRetriever
+from numpy_store import VECTOR_STORE, NumpyVectorStore
 
 app = Flask(__name__)
 CORS(app)
@@ -27,11 +27,40 @@ logger = logging.getLogger(__name__)
 # Dictionary to store loaded models
 models = {}
 
-# Initialize RAG components
-try:
+# Response cache in front of the RAG chain (threshold is cosine similarity)
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", "3600"))
+LLM_MODEL = "qwen2.5:latest"
+
+# Concurrent identical prompts share one RAG generation
+coalescer = SingleFlight("rag")
+
+# Concurrency limits per chat type in front of the LLM (cache hits skip it)
+admission = AdmissionController()
+EMBEDDING_MODEL = "nomic-embed-text"
+
+# Define available models
+available_models = {
+    "rag": {
+        "name": "RAG-Enhanced Qwen2.5",
+        "type": "rag"
+    }
+}
+
+def build_rag():
+    """Build the RAG chain and its answer cache (runs on the warm-up thread)"""
+    # Import RAG components
+    from langchain_ollama import OllamaEmbeddings
+    from langchain_ollama import ChatOllama
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain.text_splitter import CharacterTextSplitter
+    from langchain_core.documents import Document
+
     logger.info("Initializing Ollama model...")
     # Initialize Ollama model
-    model_local = ChatOllama(model="qwen2.5:latest")
+    model_local = ChatOllama(model=LLM_MODEL)
     logger.info("Ollama model initialized successfully")
     
     logger.info("Creating test documents...")
@@ -64,12 +93,19 @@ try:
     
     logger.info("Creating vector store...")
     # Create embeddings and store in vector DB
-    vectorstore = Chroma.from_documents(
-        documents=doc_splits,
-        collection_name="mental-health-india",
-        embedding=OllamaEmbeddings(model='nomic-embed-text'),
-    )
-    retriever = vectorstore.as_retriever()
+    embeddings = cached_embeddings(OllamaEmbeddings(model=EMBEDDING_MODEL))
+    if VECTOR_STORE == "chroma":
+        from langchain_chroma import Chroma
+        vectorstore = Chroma.from_documents(
+            documents=doc_splits,
+            collection_name="mental-health-india",
+            embedding=embeddings,
+        )
+    else:
+        # A handful of chunks: a matrix multiply beats starting Chroma
+        vectorstore = NumpyVectorStore.from_documents(doc_splits, embeddings)
+    # BM25 over the same chunks answers keyword queries without the embedding round trip
+    retriever = HybridRetriever(doc_splits, vectorstore)
     logger.info("Vector store created successfully")
     
     # Setup RAG prompt template
@@ -84,43 +120,65 @@ try:
     
     rag_prompt = ChatPromptTemplate.from_template(rag_template)
     
+    # Answers depend on the documents, both models and the prompt. All are
+    # fixed for the life of the process (a restart starts an empty cache),
+    # so the fingerprint only labels the entries in /cache; after re-pulling
+    # a model under the same tag, DELETE /cache empties it
+    corpus_fingerprint = fingerprint(
+        LLM_MODEL, EMBEDDING_MODEL, rag_template,
+        *(doc.page_content for doc in doc_splits)
+    )
+    answer_cache = AnswerCache(
+        embed_query=embeddings.embed_query,
+        threshold=ANSWER_CACHE_THRESHOLD,
+        maxsize=ANSWER_CACHE_SIZE,
+        ttl=ANSWER_CACHE_TTL,
+        fingerprint=corpus_fingerprint,
+    )
+    
     logger.info("Creating RAG chain...")
-    # Create RAG chain
+    # Create RAG chain; generate() retrieves first, since the lexical fast
+    # path decides whether the answer cache may embed the prompt
     rag_chain = (
-        {"context": retriever, "question": RunnablePassthrough()}
-        | rag_prompt
+        rag_prompt
         | model_local
         | StrOutputParser()
     )
     logger.info("RAG chain created successfully")
     
-    # Define available models
-    available_models = {
-        "rag": {
-            "name": "RAG-Enhanced Qwen2.5",
-            "type": "rag"
-        }
-    }
-    
     # Store RAG components
     models["rag"] = {
-        "chain": rag_chain
+        "chain": rag_chain,
+        "cache": answer_cache,
+        "embeddings": embeddings,
+        "retriever": retriever
     }
     logger.info("Models initialized successfully")
-    
-except Exception as e:
-    logger.error(f"Error during initialization: {str(e)}")
-    logger.error(f"Traceback: {traceback.format_exc()}")
-    raise
+    return models["rag"]
+
+# The server binds right away; the RAG stack is built on the warm-up thread
+# and /ready reports when it can serve
+warmup = Warmup()
+warmup.register("rag", build_rag)
+warmup.start()
 
 @app.route('/', methods=['GET'])
 def home():
     return jsonify({
         'status': 'server is running', 
         'endpoint': '/generate',
-        'available_models': list(available_models.keys())
+        'available_models': list(available_models.keys()),
+        'coalescing': coalescer.stats(),
+        'admission': admission.stats(),
+        'retrieval': models['rag']['retriever'].stats() if 'rag' in models else None,
+        'ready': warmup.ready()
     })
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    readiness = warmup.readiness()
+    return jsonify(readiness), 200 if readiness['ready'] else 503
+
 @app.route('/models', methods=['GET'])
 def get_models():
     return jsonify({
@@ -132,6 +190,25 @@ def get_models():
         ]
     })
 
+@app.route('/cache', methods=['GET'])
+def cache_stats():
+    stats = {
+        model_id: model['cache'].stats()
+        for model_id, model in models.items() if 'cache' in model
+    }
+    stats['embeddings'] = {
+        model_id: model['embeddings'].stats()
+        for model_id, model in models.items() if hasattr(model.get('embeddings'), 'stats')
+    }
+    return jsonify(stats)
+
+@app.route('/cache', methods=['DELETE'])
+def clear_cache():
+    for model in models.values():
+        if 'cache' in model:
+            model['cache'].invalidate()
+    return jsonify({'status': 'cleared'})
+
 @app.route('/generate', methods=['POST'])
 def generate():
     try:
@@ -141,6 +218,7 @@ def generate():
             
         prompt = data.get('prompt', '')
         model_id = data.get('model_id', 'rag')  # Default to RAG model
+        chat_type = data.get('chat_type', 'GENERAL')
         
         logger.info(f"Received generate request - prompt: {prompt}, model_id: {model_id}")
         
@@ -154,9 +232,50 @@ def generate():
         if model_id == "rag":
             logger.info("Using RAG model for generation")
             try:
-                response = models["rag"]["chain"].invoke(prompt)
+                rag = warmup.components["rag"].get()
+            except NotReady as e:
+                logger.warning(f"Request before warm-up finished: {str(e)}")
+                if e.state == 'failed':
+                    return jsonify({'error': f'Model {model_id} failed to load'}), 500
+                return (jsonify({'error': 'The model is still loading, please try again shortly.',
+                                 'retry_after': e.retry_after}),
+                        503, {'Retry-After': str(e.retry_after)})
+            try:
+                cache = rag["cache"]
+                retriever = rag["retriever"]
+                started = time.perf_counter()
+                # BM25 first: when it can answer alone, nothing embeds the
+                # prompt, so the answer cache only tries an exact match
+                lexical = retriever.lexical(prompt)
+                fast_path = lexical[1]
+                # A near-identical wording can still mean something else; a
+                # crisis message only ever gets an answer to its exact text
+                crisis = is_high_risk(prompt)
+                semantic = not (fast_path or crisis)
+                response, match = cache.lookup(prompt, semantic=semantic)
+                lookup_ms = (time.perf_counter() - started) * 1000
+                if response is not None:
+                    logger.info(f"Answer cache hit ({match})")
+                    return jsonify({'response': response, 'model': model_id})
+                
+                def generate_and_cache():
+                    retrieval_started = time.perf_counter()
+                    context = retriever.invoke(prompt, lexical=lexical)
+                    # Lookup plus retrieval, without the wait for admission
+                    retriever.record_request(
+                        fast_path, lookup_ms + (time.perf_counter() - retrieval_started) * 1000)
+                    answer = rag["chain"].invoke({"context": context, "question": prompt})
+                    cache.store(prompt, answer, semantic=semantic)
+                    return answer
+                
+                with admission.acquire(chat_type, crisis=crisis):
+                    response = coalescer.do(request_key(model_id, normalize_text(prompt)), generate_and_cache)
                 logger.info("RAG model generated response successfully")
                 return jsonify({'response': response, 'model': model_id})
+            except AdmissionRejected as e:
+                logger.warning(f"Request shed: {str(e)}")
+                return (jsonify({'error': str(e), 'retry_after': e.retry_after}),
+                        503, {'Retry-After': str(e.retry_after)})
             except Exception as e:
                 logger.error(f"Error during RAG generation: {str(e)}")
                 logger.error(f"Traceback: {traceback.format_exc()}")
@@ -171,4 +290,5 @@ def generate():
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # The reloader would import this module, and build the RAG stack, twice
+    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,456 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "memory")  # memory | sqlite | log
+SESSION_PATH = os.environ.get("SESSION_PATH", "./sessions.db")
+SESSION_MAX_HISTORY = int(os.environ.get("SESSION_MAX_HISTORY", "10"))
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", "3600"))  # seconds
+SESSION_MEMORY_BUDGET = int(os.environ.get("SESSION_MEMORY_BUDGET", str(32 * 1024 * 1024)))  # bytes
+
+
+def entry_size(entry):
+    """Rough in-memory footprint of one history entry"""
+    return 64 + sum(len(key) + len(str(value)) for key, value in entry.items())
+
+
+class MemoryBackend:
+    """No persistence: sessions live only as long as they stay in memory"""
+
+    persistent = False
+
+    def load(self, session_id, limit):
+        return None
+
+    def append(self, session_id, entries, keep, now):
+        pass
+
+    def touch(self, session_ids, now):
+        pass
+
+    def delete(self, session_id):
+        pass
+
+    def expire(self, cutoff):
+        return []
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend:
+    """One row per history entry; sessions are read back individually on first access"""
+
+    persistent = True
+
+    def __init__(self, path=SESSION_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                session_id TEXT NOT NULL,
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_session ON entries (session_id, seq);
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                last_access REAL NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def load(self, session_id, limit):
+        """(entries, last access time) of a session, or None"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload FROM entries WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+                (session_id, limit),
+            ).fetchall()
+            last_access = self._conn.execute(
+                "SELECT last_access FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if not rows:
+            return None
+        return [json.loads(payload) for (payload,) in reversed(rows)], last_access[0] if last_access else 0.0
+
+    def append(self, session_id, entries, keep, now):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO entries (session_id, payload) VALUES (?, ?)",
+                [(session_id, json.dumps(entry)) for entry in entries],
+            )
+            # Trim in the same transaction so the table never outgrows the cap
+            self._conn.execute(
+                "DELETE FROM entries WHERE session_id = ? AND seq NOT IN "
+                "(SELECT seq FROM entries WHERE session_id = ? ORDER BY seq DESC LIMIT ?)",
+                (session_id, session_id, keep),
+            )
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, last_access) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET last_access = excluded.last_access",
+                (session_id, now),
+            )
+
+    def touch(self, session_ids, now):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE sessions SET last_access = ? WHERE session_id = ?",
+                [(now, session_id) for session_id in session_ids],
+            )
+
+    def delete(self, session_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def expire(self, cutoff):
+        """Delete sessions last accessed before cutoff; returns their IDs"""
+        with self._lock, self._conn:
+            expired = [session_id for (session_id,) in self._conn.execute(
+                "SELECT session_id FROM sessions WHERE last_access < ?", (cutoff,))]
+            self._conn.execute(
+                "DELETE FROM entries WHERE session_id IN "
+                "(SELECT session_id FROM sessions WHERE last_access < ?)", (cutoff,))
+            self._conn.execute("DELETE FROM sessions WHERE last_access < ?", (cutoff,))
+            return expired
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class AppendLogBackend:
+    """Append-only JSON-lines log with offset index and periodic compaction
+
+    Startup scans the log once to index byte offsets per session; entry
+    payloads are only parsed when a session is actually requested.
+    """
+
+    persistent = True
+
+    def __init__(self, path=SESSION_PATH, compact_ratio=0.5, min_compact_records=1000):
+        self.path = path
+        self.compact_ratio = compact_ratio
+        self.min_compact_records = min_compact_records
+        self._lock = threading.RLock()
+        self._offsets = {}      # session_id -> [byte offsets of live entries]
+        self._last_access = {}  # session_id -> time of last append or touch
+        self._records = 0       # total records in the file, live or dead
+        self._live = 0          # records compaction would keep: entries plus one touch per session
+        self._index()
+        self._file = open(self.path, "ab")
+
+    def _index(self):
+        if not os.path.exists(self.path):
+            return
+        torn_at = None
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # The process died halfway through an append
+                    torn_at = offset
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping unreadable record at byte {offset} of {self.path}")
+                    self._records += 1
+                    offset += len(line)
+                    continue
+                sid = record["sid"]
+                if record["op"] == "append":
+                    self._offsets.setdefault(sid, []).append(offset)
+                    self._last_access[sid] = record["ts"]
+                elif record["op"] == "trim":
+                    self._offsets[sid] = self._offsets.get(sid, [])[-record["keep"]:]
+                elif record["op"] == "touch":
+                    if sid in self._offsets:
+                        self._last_access[sid] = record["ts"]
+                else:
+                    self._offsets.pop(sid, None)
+                    self._last_access.pop(sid, None)
+                self._records += 1
+                offset += len(line)
+        if torn_at is not None:
+            logger.warning(f"Truncating incomplete last record at byte {torn_at} of {self.path}")
+            os.truncate(self.path, torn_at)
+        self._live = sum(len(offsets) + 1 for offsets in self._offsets.values())
+
+    def _write(self, records):
+        offsets = []
+        for record in records:
+            offsets.append(self._file.tell())
+            self._file.write(json.dumps(record).encode("utf-8") + b"\n")
+        self._file.flush()
+        self._records += len(records)
+        return offsets
+
+    def load(self, session_id, limit):
+        """(entries, last access time) of a session, or None"""
+        with self._lock:
+            offsets = self._offsets.get(session_id, [])[-limit:]
+            if not offsets:
+                return None
+            entries = []
+            with open(self.path, "rb") as f:
+                for offset in offsets:
+                    f.seek(offset)
+                    entries.append(json.loads(f.readline())["entry"])
+            return entries, self._last_access.get(session_id, 0.0)
+
+    def append(self, session_id, entries, keep, now):
+        with self._lock:
+            offsets = self._write([{"op": "append", "sid": session_id, "ts": now, "entry": entry}
+                                   for entry in entries])
+            if session_id not in self._offsets:
+                self._live += 1
+            live = self._offsets.setdefault(session_id, [])
+            live.extend(offsets)
+            self._live += len(offsets)
+            if len(live) > keep:
+                self._write([{"op": "trim", "sid": session_id, "keep": keep}])
+                self._live -= len(live) - keep
+                del live[:-keep]
+            self._last_access[session_id] = now
+            self._maybe_compact()
+
+    def touch(self, session_ids, now):
+        with self._lock:
+            live = [sid for sid in session_ids if sid in self._offsets]
+            for sid in live:
+                self._last_access[sid] = now
+            if live:
+                self._write([{"op": "touch", "sid": sid, "ts": now} for sid in live])
+                self._maybe_compact()
+
+    def delete(self, session_id):
+        with self._lock:
+            offsets = self._offsets.pop(session_id, None)
+            if offsets is not None:
+                self._live -= len(offsets) + 1
+                self._last_access.pop(session_id, None)
+                self._write([{"op": "delete", "sid": session_id}])
+
+    def expire(self, cutoff):
+        with self._lock:
+            expired = [sid for sid, ts in self._last_access.items() if ts < cutoff]
+            for sid in expired:
+                self._live -= len(self._offsets.pop(sid, ())) + 1
+                self._last_access.pop(sid, None)
+            if expired:
+                self._write([{"op": "delete", "sid": sid} for sid in expired])
+                self._maybe_compact()
+            return expired
+
+    def _maybe_compact(self):
+        if self._records < self.min_compact_records or self._live > self._records * self.compact_ratio:
+            return
+        self.compact()
+
+    def compact(self):
+        """Rewrite the log with only live entries"""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        tmp_path = self.path + ".compact"
+        new_offsets = {}
+        with open(self.path, "rb") as src, open(tmp_path, "wb") as dst:
+            for sid, offsets in self._offsets.items():
+                for offset in offsets:
+                    src.seek(offset)
+                    new_offsets.setdefault(sid, []).append(dst.tell())
+                    dst.write(src.readline())
+                # Keeps touches newer than the session's last append
+                touch = {"op": "touch", "sid": sid, "ts": self._last_access.get(sid, 0.0)}
+                dst.write(json.dumps(touch).encode("utf-8") + b"\n")
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "ab")
+        self._offsets = new_offsets
+        self._records = self._live = sum(len(offsets) + 1 for offsets in new_offsets.values())
+        logger.info(f"Compacted session log to {self._records} records")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class _Session:
+    __slots__ = ("entries", "nbytes", "last_access", "persisted_access")
+
+    def __init__(self, entries, now):
+        self.entries = entries
+        self.nbytes = sum(entry_size(entry) for entry in entries)
+        self.last_access = now
+        self.persisted_access = now  # last access time the backend has recorded
+
+
+class SessionStore:
+    """Bounded conversation-history store
+
+    Keeps at most ``max_history`` entries per session and ``memory_budget``
+    bytes across all sessions in memory, evicting least-recently-used
+    sessions first. Sessions idle for longer than ``idle_ttl`` are dropped
+    everywhere, including the backend. Sessions evicted for memory reasons
+    are reloaded lazily from a persistent backend on next access. Reads
+    refresh the backend's access time too, at most once per
+    ``sweep_interval`` per session, so a session that is read but not
+    written is not expired there while in use.
+    """
+
+    def __init__(self, backend=None, max_history=SESSION_MAX_HISTORY,
+                 memory_budget=SESSION_MEMORY_BUDGET, idle_ttl=SESSION_IDLE_TTL,
+                 sweep_interval=60.0, clock=time.time):
+        self.backend = backend or MemoryBackend()
+        self.max_history = max_history
+        self.memory_budget = memory_budget
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self._sessions = OrderedDict()
+        self._nbytes = 0
+        self._last_sweep = clock()
+        self._lock = threading.RLock()
+        self._stats = {"hits": 0, "loads": 0, "misses": 0, "lru_evictions": 0, "ttl_evictions": 0}
+
+    def __contains__(self, session_id):
+        return bool(self.get(session_id))
+
+    def get(self, session_id):
+        """Return a copy of the session history (empty list if unknown)"""
+        with self._lock:
+            session = self._touch(session_id)
+            return list(session.entries) if session else []
+
+    def append(self, session_id, *entries):
+        """Append entries to a session, trimming it to max_history"""
+        if not session_id or not entries:
+            return
+        with self._lock:
+            now = self.clock()
+            session = self._touch(session_id)
+            if session is None:
+                session = _Session([], now)
+                self._sessions[session_id] = session
+            added = sum(entry_size(entry) for entry in entries)
+            session.entries.extend(entries)
+            session.nbytes += added
+            session.persisted_access = now
+            self._nbytes += added
+            overflow = len(session.entries) - self.max_history
+            if overflow > 0:
+                dropped = sum(entry_size(entry) for entry in session.entries[:overflow])
+                del session.entries[:overflow]
+                session.nbytes -= dropped
+                self._nbytes -= dropped
+            self.backend.append(session_id, entries, self.max_history, now)
+            self._enforce_budget()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._drop(session_id)
+            self.backend.delete(session_id)
+
+    def sweep(self):
+        """Evict sessions idle for longer than idle_ttl"""
+        with self._lock:
+            now = self.clock()
+            self._last_sweep = now
+            cutoff = now - self.idle_ttl
+            # The OrderedDict is in LRU order, so expired sessions are at the front
+            dropped = set()
+            while self._sessions:
+                session_id, session = next(iter(self._sessions.items()))
+                if session.last_access >= cutoff:
+                    break
+                self._drop(session_id)
+                dropped.add(session_id)
+            # Sessions still in use must not expire in the backend
+            self._persist_access([session_id for session_id, session in self._sessions.items()
+                                  if session.persisted_access < cutoff], now)
+            expired = set(self.backend.expire(cutoff))
+            # Each session counts once, whether it was held in memory or not
+            self._stats["ttl_evictions"] += len(dropped | expired)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, sessions=len(self._sessions), bytes=self._nbytes,
+                        memory_budget=self.memory_budget,
+                        backend=type(self.backend).__name__)
+
+    def close(self):
+        self.backend.close()
+
+    def _touch(self, session_id):
+        now = self.clock()
+        if now - self._last_sweep >= self.sweep_interval:
+            self.sweep()
+        session = self._sessions.get(session_id)
+        if session is not None and now - session.last_access > self.idle_ttl:
+            self._drop(session_id)
+            self.backend.delete(session_id)
+            self._stats["ttl_evictions"] += 1
+            session = None
+        elif session is not None:
+            self._stats["hits"] += 1
+        elif self.backend.persistent:
+            loaded = self.backend.load(session_id, self.max_history)
+            if loaded and now - loaded[1] > self.idle_ttl:
+                # Idle too long already; the next sweep would have expired it
+                self.backend.delete(session_id)
+                self._stats["ttl_evictions"] += 1
+            elif loaded:
+                session = _Session(loaded[0], now)
+                session.persisted_access = loaded[1]
+                self._sessions[session_id] = session
+                self._nbytes += session.nbytes
+                self._stats["loads"] += 1
+                self._enforce_budget(keep=session_id)
+        if session is None:
+            self._stats["misses"] += 1
+            return None
+        session.last_access = now
+        self._sessions.move_to_end(session_id)
+        if now - session.persisted_access >= self.sweep_interval:
+            self._persist_access([session_id], now)
+        return session
+
+    def _persist_access(self, session_ids, now):
+        if not session_ids or not self.backend.persistent:
+            return
+        self.backend.touch(session_ids, now)
+        for session_id in session_ids:
+            self._sessions[session_id].persisted_access = now
+
+    def _drop(self, session_id):
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._nbytes -= session.nbytes
+
+    def _enforce_budget(self, keep=None):
+        while self._nbytes > self.memory_budget and len(self._sessions) > 1:
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                break
+            self._drop(session_id)
+            self._stats["lru_evictions"] += 1
+
+
+def create_store(backend=SESSION_BACKEND, path=SESSION_PATH, **kwargs):
+    """Build a SessionStore from a backend name (memory, sqlite or log)"""
+    if backend == "sqlite":
+        return SessionStore(SQLiteBackend(path), **kwargs)
+    if backend == "log":
+        return SessionStore(AppendLogBackend(path), **kwargs)
+    return SessionStore(MemoryBackend(), **kwargs)
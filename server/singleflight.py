@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def request_key(*parts):
+    """Fingerprint of everything that determines a generation (model, context, history, ...)"""
+    blob = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Broadcast:
+    """Buffered fan-out of one upstream stream; late subscribers replay from the start"""
+
+    def __init__(self):
+        self.items = []
+        self.done = False
+        self.error = None
+        self.cond = threading.Condition()
+
+    def publish(self, item):
+        with self.cond:
+            self.items.append(item)
+            self.cond.notify_all()
+
+    def finish(self, error=None):
+        with self.cond:
+            self.done = True
+            self.error = error
+            self.cond.notify_all()
+
+    def subscribe(self):
+        index = 0
+        while True:
+            with self.cond:
+                while index >= len(self.items) and not self.done:
+                    self.cond.wait()
+                batch = self.items[index:]
+                index += len(batch)
+                finished = self.done and index >= len(self.items)
+            yield from batch
+            if finished:
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class SingleFlight:
+    """Coalesces concurrent identical requests onto one upstream call
+
+    ``do`` shares a single result between callers with the same key;
+    ``stream`` shares one upstream iterator, fanning its items out to every
+    subscriber. Nothing is kept once the upstream call completes; this is
+    deduplication of in-flight work, not a cache.
+    """
+
+    def __init__(self, name="singleflight"):
+        self.name = name
+        self._calls = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "calls_coalesced": 0, "streams": 0, "streams_coalesced": 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["calls"] += 1
+            else:
+                self._stats["calls_coalesced"] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def stream(self, key, fn):
+        """Iterate fn()'s items, sharing one upstream iteration per key"""
+        with self._lock:
+            broadcast = self._streams.get(key)
+            if broadcast is None:
+                broadcast = self._streams[key] = _Broadcast()
+                self._stats["streams"] += 1
+                # The producer runs on its own thread so followers keep
+                # receiving items even if the first caller disconnects.
+                threading.Thread(target=self._produce, args=(key, broadcast, fn),
+                                 name=f"{self.name}-stream", daemon=True).start()
+            else:
+                self._stats["streams_coalesced"] += 1
+        return broadcast.subscribe()
+
+    def _produce(self, key, broadcast, fn):
+        error = None
+        try:
+            for item in fn():
+                broadcast.publish(item)
+        except Exception as e:
+            error = e
+        finally:
+            with self._lock:
+                self._streams.pop(key, None)
+            broadcast.finish(error)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls) + len(self._streams),
+                        duplicates_avoided=self._stats["calls_coalesced"] + self._stats["streams_coalesced"])
+
+
+class _AsyncBroadcast:
+    def __init__(self):
+        self.items = []
+        self.done = False
+        self.error = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, item):
+        self.items.append(item)
+        self._notify()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def subscribe(self):
+        index = 0
+        while True:
+            if index < len(self.items):
+                yield self.items[index]
+                index += 1
+            elif self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                await self._changed.wait()
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight; fn returns a coroutine / async iterator"""
+
+    def __init__(self, name="singleflight"):
+        self.name = name
+        self._calls = {}
+        self._streams = {}
+        # The event loop only holds tasks weakly; without this a producer could
+        # be garbage-collected mid-stream and leave its subscribers waiting forever
+        self._producers = set()
+        self._stats = {"calls": 0, "calls_coalesced": 0, "streams": 0, "streams_coalesced": 0}
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            self._stats["calls"] += 1
+        else:
+            self._stats["calls_coalesced"] += 1
+        # Shielded so one caller going away does not cancel the shared call
+        return await asyncio.shield(task)
+
+    def stream(self, key, fn):
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = self._streams[key] = _AsyncBroadcast()
+            self._stats["streams"] += 1
+            producer = asyncio.ensure_future(self._produce(key, broadcast, fn))
+            self._producers.add(producer)
+            producer.add_done_callback(self._producers.discard)
+        else:
+            self._stats["streams_coalesced"] += 1
+        return broadcast.subscribe()
+
+    async def _produce(self, key, broadcast, fn):
+        error = None
+        try:
+            async for item in fn():
+                broadcast.publish(item)
+        except Exception as e:
+            error = e
+        finally:
+            self._streams.pop(key, None)
+            broadcast.finish(error)
+
+    def stats(self):
+        return dict(self._stats, in_flight=len(self._calls) + len(self._streams),
+                    duplicates_avoided=self._stats["calls_coalesced"] + self._stats["streams_coalesced"])
@@ -0,0 +1,144 @@
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimings:
+    """Start offset and duration (ms) of each stage of one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}  # name -> (start_ms, duration_ms)
+
+    def record(self, name, started, finished):
+        self.stages[name] = ((started - self.started) * 1000, (finished - started) * 1000)
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self):
+        """Server-Timing header value, e.g. 'retrieve;dur=120.4, generate;dur=3380.2, total;dur=3502.9'"""
+        parts = [f"{name};dur={duration:.1f}" for name, (_, duration) in self.stages.items()]
+        parts.append(f"total;dur={self.total_ms:.1f}")
+        return ", ".join(parts)
+
+    def summary(self):
+        return " ".join(f"{name}={start:.0f}+{duration:.0f}ms"
+                        for name, (start, duration) in self.stages.items())
+
+
+class StageGraph:
+    """A request pipeline as a small dependency graph of stages
+
+    Stages are functions of one dict, holding the request inputs and the
+    results of finished stages under their stage names. Each stage starts on
+    the pool as soon as the stages it runs after have finished, so
+    independent ones overlap. Work nobody waits for (analytics, logging) goes
+    to a separate background executor with background(); at most
+    max_background such tasks are queued or running, and further ones are
+    dropped rather than piling up behind a slow dependency.
+    """
+
+    def __init__(self, name, workers=8, background_workers=2, max_background=64):
+        self.name = name
+        self._stages = {}  # name -> (fn, after); registration order is kept
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-stage")
+        self._background = ThreadPoolExecutor(max_workers=background_workers,
+                                              thread_name_prefix=f"{name}-background")
+        self._background_slots = threading.BoundedSemaphore(max_background)
+        self._lock = threading.Lock()
+        self._totals = {}  # stage -> [count, total_ms, max_ms]
+        self._background_errors = 0
+        self._background_dropped = 0
+
+    def stage(self, name, after=()):
+        """Decorator registering fn(ctx) as a stage that runs once every stage in after has finished"""
+        def register(fn):
+            unknown = [dep for dep in after if dep not in self._stages]
+            if unknown:
+                raise ValueError(f"Stage {name} runs after unregistered stages {unknown}")
+            self._stages[name] = (fn, tuple(after))
+            return fn
+        return register
+
+    def run(self, **inputs):
+        """Run every stage; returns (ctx, StageTimings) or raises the first stage error"""
+        timings = StageTimings()
+        ctx = dict(inputs)
+        remaining = dict(self._stages)
+        running = {}
+
+        def timed(name, fn):
+            started = time.perf_counter()
+            try:
+                return fn(ctx)
+            finally:
+                timings.record(name, started, time.perf_counter())
+
+        def start_ready():
+            for name, (fn, after) in list(remaining.items()):
+                if all(dep in ctx for dep in after):
+                    del remaining[name]
+                    running[self._pool.submit(timed, name, fn)] = name
+
+        start_ready()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    # Stages already running finish on their own; nothing new starts
+                    self._record(timings)
+                    raise error
+                ctx[name] = future.result()
+            start_ready()
+        self._record(timings)
+        return ctx, timings
+
+    def background(self, fn, *args):
+        """Run fn off the request path; errors are logged, never raised
+
+        Returns the task's future, or None if the background queue is full
+        and the task was dropped.
+        """
+        if not self._background_slots.acquire(blocking=False):
+            with self._lock:
+                self._background_dropped += 1
+            return None
+
+        def guarded():
+            try:
+                return fn(*args)
+            except Exception as e:
+                with self._lock:
+                    self._background_errors += 1
+                logger.warning(f"Background task {getattr(fn, '__name__', fn)} failed: {str(e)}")
+            finally:
+                self._background_slots.release()
+        try:
+            return self._background.submit(guarded)
+        except RuntimeError:
+            self._background_slots.release()
+            raise
+
+    def _record(self, timings):
+        with self._lock:
+            for name, (_, duration) in timings.stages.items():
+                totals = self._totals.setdefault(name, [0, 0.0, 0.0])
+                totals[0] += 1
+                totals[1] += duration
+                totals[2] = max(totals[2], duration)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "stages": {name: {"count": count, "mean_ms": round(total / count, 1), "max_ms": round(peak, 1)}
+                           for name, (count, total, peak) in self._totals.items()},
+                "background_errors": self._background_errors,
+                "background_dropped": self._background_dropped,
+            }
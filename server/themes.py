@@ -0,0 +1,145 @@
+import os
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+
+# Conversation themes tracked per session; each is a list of keywords
+# matched case-insensitively on word boundaries.
+THEMES = {
+    "anxiety": ["anxious", "worried", "panic", "stress"],
+    "depression": ["sad", "depressed", "hopeless", "down"],
+    "relationships": ["relationship", "family", "friend", "partner"],
+    "self_esteem": ["worthless", "confidence", "self-esteem"],
+    "trauma": ["trauma", "abuse", "ptsd", "flashback"],
+}
+
+THEME_NAMES = tuple(THEMES)
+THEME_HALF_LIFE = float(os.environ.get("THEME_HALF_LIFE", "0"))  # seconds, 0 disables decay
+THEME_MAX_SESSIONS = int(os.environ.get("THEME_MAX_SESSIONS", "10000"))
+THEME_IDLE_TTL = float(os.environ.get("THEME_IDLE_TTL", "3600"))
+
+_THEME_INDEX = {name: index for index, name in enumerate(THEME_NAMES)}
+_THEME_REGEX = re.compile(r"\b(?:" + "|".join(
+    f"(?P<{name}>{'|'.join(re.escape(word) for word in words)})" for name, words in THEMES.items()
+) + r")\b")
+
+
+def find_themes(text):
+    """Indexes of the themes mentioned in text, found in one regex pass"""
+    return {_THEME_INDEX[m.lastgroup] for m in _THEME_REGEX.finditer(text.lower())}
+
+
+class ContextManager:
+    """Recent exchanges and theme counts for one conversation
+
+    Counts live in a fixed-size array indexed like THEME_NAMES and ``top``
+    keeps the themes ordered by count, updated with one insertion step per
+    increment instead of a full sort per read. With ``half_life`` set, older
+    mentions decay; decay scales every count by the same factor, so it never
+    changes the order.
+    """
+
+    __slots__ = ("window", "counts", "first_seen", "top", "half_life", "updated_at")
+
+    def __init__(self, window_size=6, half_life=None):
+        self.window = deque(maxlen=window_size)
+        self.counts = array("d", bytes(8 * len(THEME_NAMES)))
+        self.first_seen = array("b", bytes(len(THEME_NAMES)))  # order of first mention
+        self.top = []  # theme indexes with a non-zero count, highest first
+        self.half_life = half_life or None
+        self.updated_at = time.monotonic()
+
+    def update(self, exchange):
+        """Add new exchange and track themes"""
+        self.window.append(exchange)
+        self._track_themes(exchange)
+
+    def _track_themes(self, exchange):
+        self._decay()
+        for index in find_themes(exchange):
+            if self.counts[index] == 0:
+                self.first_seen[index] = len(self.top)
+                self.top.append(index)
+            self.counts[index] += 1
+            self._promote(index)
+
+    def _decay(self):
+        now = time.monotonic()
+        if self.half_life and self.top:
+            factor = 0.5 ** ((now - self.updated_at) / self.half_life)
+            for index in self.top:
+                self.counts[index] *= factor
+        self.updated_at = now
+
+    def _promote(self, index):
+        # Only the incremented theme can move, and only upwards; ties are
+        # ordered by first mention
+        position = self.top.index(index)
+        count, seen = self.counts[index], self.first_seen[index]
+        while position:
+            above = self.top[position - 1]
+            if self.counts[above] > count or (self.counts[above] == count and self.first_seen[above] < seen):
+                break
+            self.top[position] = above
+            position -= 1
+        self.top[position] = index
+
+    @property
+    def theme_tracker(self):
+        return {THEME_NAMES[index]: self._count(index) for index in self.top}
+
+    def dominant_themes(self, k=3):
+        return [(THEME_NAMES[index], self._count(index)) for index in self.top[:k]]
+
+    def _count(self, index):
+        count = self.counts[index]
+        return round(count, 2) if self.half_life else int(count)
+
+    def get_context(self):
+        """Get current conversation context and themes"""
+        return {
+            "recent_exchanges": list(self.window),
+            "dominant_themes": self.dominant_themes(3),
+        }
+
+
+class SessionContexts:
+    """Bounded registry of per-session ContextManagers (LRU, idle sessions expire)"""
+
+    def __init__(self, window_size=6, half_life=THEME_HALF_LIFE, max_sessions=THEME_MAX_SESSIONS,
+                 idle_ttl=THEME_IDLE_TTL):
+        self.window_size = window_size
+        self.half_life = half_life
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()  # session_id -> ContextManager
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "evicted": 0, "expired": 0}
+
+    def get(self, session_id):
+        """The session's ContextManager, created on first use"""
+        now = time.monotonic()
+        with self._lock:
+            manager = self._sessions.get(session_id)
+            if manager is not None and self.idle_ttl and now - manager.updated_at > self.idle_ttl:
+                manager = None
+                self._stats["expired"] += 1
+            if manager is None:
+                manager = self._sessions[session_id] = ContextManager(self.window_size, self.half_life)
+                self._stats["created"] += 1
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._stats["evicted"] += 1
+            return manager
+
+    def forget(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, sessions=len(self._sessions), max_sessions=self.max_sessions,
+                        half_life=self.half_life)
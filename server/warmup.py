@@ -0,0 +1,137 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# How long a request waits for a component that is still warming up before
+# the server answers 503 instead
+WARMUP_WAIT = float(os.environ.get("WARMUP_WAIT", "0"))
+# "background" loads every component on the warm-up thread at startup;
+# "lazy" loads each one on the first request that needs it
+WARMUP_MODE = os.environ.get("WARMUP_MODE", "background")
+
+PENDING, LOADING, READY, FAILED = "pending", "loading", "ready", "failed"
+
+
+class NotReady(Exception):
+    """A component is still loading (or failed to load)"""
+
+    def __init__(self, name, state, retry_after=5):
+        super().__init__(f"{name} is {state}")
+        self.name = name
+        self.state = state
+        self.retry_after = retry_after
+
+
+class Component:
+    """A heavy dependency built once, on a background thread or on first use"""
+
+    def __init__(self, name, loader, required=True):
+        self.name = name
+        self.loader = loader
+        self.required = required
+        self.state = PENDING
+        self.value = None
+        self.error = None
+        self.seconds = None
+        self.lazy = False
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def load(self):
+        """Run the loader unless another thread already did; returns the value or None on failure"""
+        with self._lock:
+            if self.state != PENDING:
+                return self.value
+            self.state = LOADING
+        started = time.perf_counter()
+        try:
+            value = self.loader()
+        except Exception as e:
+            logger.error(f"Could not load {self.name}: {str(e)}", exc_info=True)
+            self.error = str(e)
+            self.state = FAILED
+        else:
+            self.value = value
+            self.state = READY
+            logger.info(f"{self.name} ready in {time.perf_counter() - started:.2f}s")
+        self.seconds = round(time.perf_counter() - started, 3)
+        self._done.set()
+        return self.value
+
+    def get(self, wait=WARMUP_WAIT):
+        """The loaded value, waiting up to wait seconds (None: until loaded); raises NotReady otherwise
+
+        In lazy mode the first caller loads the component on its own thread.
+        """
+        if self.lazy and self.state == PENDING:
+            self.load()
+        self._done.wait(wait)
+        if self.state != READY:
+            raise NotReady(self.name, self.state)
+        return self.value
+
+    def peek(self):
+        """The value if ready, else None, without waiting or triggering a load"""
+        return self.value if self.state == READY else None
+
+    def status(self):
+        status = {"state": self.state, "required": self.required}
+        if self.seconds is not None:
+            status["seconds"] = self.seconds
+        if self.error:
+            status["error"] = self.error
+        return status
+
+
+class Warmup:
+    """Registry of components, loaded in order on one background thread
+
+    The server binds and answers liveness checks while this runs; readiness()
+    reports each component so orchestrators can hold traffic until the
+    required ones are loaded.
+    """
+
+    def __init__(self, mode=WARMUP_MODE):
+        self.mode = mode
+        self.components = {}
+        self.started_at = None
+        self._thread = None
+
+    def register(self, name, loader, required=True):
+        component = self.components[name] = Component(name, loader, required)
+        return component
+
+    def start(self):
+        if self.started_at is not None:
+            return self
+        self.started_at = time.monotonic()
+        if self.mode == "lazy":
+            for component in self.components.values():
+                component.lazy = True
+        else:
+            self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        # One thread, in registration order: the components share imports
+        # (torch, transformers, langchain) and loading them in parallel only
+        # contends on the import lock
+        for component in self.components.values():
+            component.load()
+
+    def ready(self):
+        # In lazy mode a component nobody has asked for yet is ready to load on demand
+        return all(c.state == READY or (c.lazy and c.state == PENDING)
+                   for c in self.components.values() if c.required)
+
+    def readiness(self):
+        return {
+            "ready": self.ready(),
+            "mode": self.mode,
+            "uptime": round(time.monotonic() - self.started_at, 3) if self.started_at else 0,
+            "components": {name: c.status() for name, c in self.components.items()},
+        }